@@ -8,29 +8,71 @@ https://github.com/wilfredallyn/pw3
 import asyncio
 import logging
 from datetime import timedelta
+from functools import partial
+from typing import TYPE_CHECKING
 
+from homeassistant.config_entries import SOURCE_INTEGRATION_DISCOVERY
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import Config
 from homeassistant.core import HomeAssistant
+from homeassistant.core import callback
 from homeassistant.exceptions import ConfigEntryNotReady
-from pypowerwall import Powerwall
+from homeassistant.helpers import discovery_flow
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
+from .api import Pw3ApiClient
+from .api import Pw3ApiClientAuthenticationError
+from .api import Pw3ApiClientError
+from .api import load_cloud_auth
+from .api import save_cloud_token
+from .backfill import EnergyBackfill
+from .const import CONF_AGGREGATE_POLL
+from .const import CONF_BACKFILL_DAYS
+from .const import CONF_BACKUP_RESERVE
+from .const import CONF_FAST_SAMPLE_INTERVAL
+from .const import CONF_GATEWAY_PASSWORD
+from .const import CONF_HOST
+from .const import CONF_IMPORT_STATISTICS
+from .const import CONF_MAX_INTERVAL
+from .const import CONF_MIN_INTERVAL
+from .const import CONF_NATIVE_API
+from .const import CONF_SITE_ID
+from .const import DEFAULT_AGGREGATE_POLL
+from .const import DEFAULT_BACKFILL_DAYS
+from .const import DEFAULT_BACKUP_RESERVE
+from .const import DEFAULT_FAST_SAMPLE_INTERVAL
+from .const import DEFAULT_IMPORT_STATISTICS
+from .const import DEFAULT_MAX_INTERVAL
+from .const import DEFAULT_MIN_INTERVAL
+from .const import DEFAULT_NATIVE_API
 from .const import DOMAIN
+from .const import MAX_FAST_SAMPLE_INTERVAL
+from .const import MIN_FAST_SAMPLE_INTERVAL
 from .const import PLATFORMS
 from .const import STARTUP_MESSAGE
+from .control import CommandQueue
+from .control import PowerwallControlClient
+from .coordinator import Pw3AccountCoordinator
 from .coordinator import Pw3DataUpdateCoordinator
+from .ratelimit import async_get_rate_limiter
+from .services import async_setup_services
+from .session import async_get_session_pool
+from .source import LOCAL
+from .source import DataSource
 
 from homeassistant.helpers import config_validation as cv
 
-CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+if TYPE_CHECKING:
+    from pypowerwall import Powerwall
 
-SCAN_INTERVAL = timedelta(seconds=30)
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
 
 async def async_setup(hass: HomeAssistant, config: Config):
     """Set up this integration using YAML is not supported."""
+    async_setup_services(hass)
     return True
 
 
@@ -47,7 +89,23 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
         _LOGGER.error("No email provided in configuration")
         return False
 
+    site_id = entry.data.get(CONF_SITE_ID)
+    native = entry.options.get(CONF_NATIVE_API, DEFAULT_NATIVE_API)
+    # Entries for the same account and site share one logged-in client, and
+    # a reload picks up the client the unloaded entry released.
+    sessions = async_get_session_pool(hass)
+    # Native entries share one account coordinator, which polls all of the
+    # account's sites on one schedule.
+    account_key = ("account", pw_email)
+    # Every Tesla call for the account shares one rate limiter
+    limiter = async_get_rate_limiter(hass, pw_email)
+    session_key = account_key if native else ("pypowerwall", pw_email, site_id)
+
     def init_powerwall():
+        # pypowerwall and its dependencies load here, in the executor, the
+        # first time an entry needs a client
+        from pypowerwall import Powerwall
+
         return Powerwall(
             authpath=hass.config.path(),
             host="",
@@ -55,27 +113,232 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
             email=pw_email,
             timezone=pw_timezone,
             cloudmode=True,
+            siteid=site_id,
+        )
+
+    async def async_init_api() -> Pw3ApiClient:
+        # Reuse the token pypowerwall's cloud setup cached, but talk to the
+        # Tesla API directly on the event loop.
+        authpath = hass.config.path()
+        token, cached_site_id = await hass.async_add_executor_job(
+            load_cloud_auth, authpath, pw_email
         )
+        if not token:
+            raise Pw3ApiClientAuthenticationError(
+                f"No cached Tesla token found in {authpath}"
+            )
+
+        def update_token(new_token: dict) -> None:
+            hass.async_add_executor_job(save_cloud_token, authpath, pw_email, new_token)
 
-    try:
-        pw = await hass.async_add_executor_job(init_powerwall)
-    except Exception as e:
-        _LOGGER.error(f"Error initializing Powerwall: {str(e)}")
-        raise ConfigEntryNotReady from e
+        return Pw3ApiClient(
+            pw_email,
+            async_get_clientsession(hass),
+            token,
+            site_id=site_id or cached_site_id,
+            token_updater=update_token,
+            limiter=limiter,
+        )
 
-    coordinator = Pw3DataUpdateCoordinator(hass, pw)
-    await coordinator.async_config_entry_first_refresh()
+    async def async_init_account() -> Pw3AccountCoordinator:
+        account = Pw3AccountCoordinator(hass, await async_init_api())
+        await account.async_discover()
+        return account
+
+    async def async_connect() -> "Powerwall":
+        return await sessions.async_acquire(
+            session_key, partial(hass.async_add_executor_job, init_powerwall)
+        )
+
+    local = None
+    if host := entry.data.get(CONF_HOST):
+        local_key = (LOCAL, host)
+
+        def init_gateway():
+            # TEDAPI over the gateway's LAN/Wi-Fi address. pypowerwall's own
+            # failover is off; the coordinator falls back to the cloud.
+            from pypowerwall import Powerwall
+
+            return Powerwall(
+                host=host,
+                password="",
+                email=pw_email,
+                timezone=pw_timezone,
+                authpath=hass.config.path(),
+                gw_pwd=entry.data.get(CONF_GATEWAY_PASSWORD),
+                failover=False,
+            )
+
+        async def async_connect_local() -> "Powerwall":
+            return await sessions.async_acquire(
+                local_key, partial(hass.async_add_executor_job, init_gateway)
+            )
+
+        local = DataSource(LOCAL, connect=async_connect_local, session_key=local_key)
+
+    pw = None
+    api = None
+    account = None
+    if native:
+        try:
+            account = await sessions.async_acquire(session_key, async_init_account)
+        except Pw3ApiClientError as exception:
+            _LOGGER.error("Error initializing Tesla API client: %s", exception)
+            raise ConfigEntryNotReady from exception
+        if (site_id := site_id or account.default_site) is None:
+            sessions.async_release(session_key)
+            raise ConfigEntryNotReady("No Tesla energy sites found")
+        api = account.client(site_id)
+
+    coordinator = Pw3DataUpdateCoordinator(
+        hass,
+        pw,
+        aggregate=entry.options.get(CONF_AGGREGATE_POLL, DEFAULT_AGGREGATE_POLL),
+        api=api,
+        min_interval=timedelta(
+            seconds=entry.options.get(
+                CONF_MIN_INTERVAL, DEFAULT_MIN_INTERVAL.total_seconds()
+            )
+        ),
+        max_interval=timedelta(
+            seconds=entry.options.get(
+                CONF_MAX_INTERVAL, DEFAULT_MAX_INTERVAL.total_seconds()
+            )
+        ),
+        # The cloud login runs with the first refresh, not here
+        connect=async_connect if api is None else None,
+        local=local,
+        fast_interval=_fast_sample_interval(entry, local is not None),
+        statistics=entry.options.get(CONF_IMPORT_STATISTICS, DEFAULT_IMPORT_STATISTICS),
+        limiter=limiter,
+        reserve=entry.options.get(CONF_BACKUP_RESERVE, DEFAULT_BACKUP_RESERVE),
+    )
+    coordinator.cloud.session_key = session_key
+    # Battery controls write through the native client, or else pypowerwall's
+    # cloud client, on the account's control lane
+    coordinator.controls = CommandQueue(
+        hass,
+        api if api is not None else PowerwallControlClient(coordinator),
+        coordinator,
+    )
+    entry.async_on_unload(coordinator.controls.async_shutdown)
+    if account is not None and local is None:
+        entry.async_on_unload(account.async_subscribe(site_id, coordinator))
+    await coordinator.async_load_energy()
+    await coordinator.async_load_statistics()
+    if coordinator.statistics is not None:
+        # The backfill below owns the statistics checkpoint until it ends, so
+        # no live import, starting with the first refresh's, can move
+        # last_hour past an hour it has yet to write
+        coordinator.statistics.paused = True
+    # Start from the last cached payload when there is one, and log in and
+    # refresh in the background; only a cold start waits for the cloud.
+    warm = await coordinator.async_load_cache()
+    if not warm:
+        try:
+            await coordinator.async_config_entry_first_refresh()
+        except ConfigEntryNotReady:
+            _async_release_sessions(hass, coordinator)
+            raise
 
     hass.data[DOMAIN][entry.entry_id] = coordinator
 
-    await hass.config_entries.async_forward_entry_setups(
-        entry, [platform for platform in PLATFORMS if entry.options.get(platform, True)]
+    coordinator.platforms = [
+        platform for platform in PLATFORMS if entry.options.get(platform, True)
+    ]
+    await hass.config_entries.async_forward_entry_setups(entry, coordinator.platforms)
+
+    entry.async_create_background_task(
+        hass, coordinator.controls.async_load(), f"{DOMAIN} battery settings"
     )
 
-    entry.add_update_listener(async_reload_entry)
+    if coordinator.fast_interval is not None:
+        entry.async_on_unload(coordinator.async_start_sampling())
+
+    if warm:
+        entry.async_create_background_task(
+            hass, coordinator.async_refresh(), f"{DOMAIN} first refresh"
+        )
+
+    if coordinator.statistics is not None:
+
+        async def async_backfill() -> None:
+            # Calendar history is only on the cloud API, so use the native
+            # client even when live data comes from pypowerwall.
+            try:
+                history = await sessions.async_acquire(account_key, async_init_account)
+            except Pw3ApiClientError as exception:
+                _LOGGER.warning("Energy history backfill unavailable: %s", exception)
+                coordinator.statistics.paused = False
+                coordinator.statistics.async_import(hass)
+                return
+            try:
+                await EnergyBackfill(
+                    hass,
+                    history.client(site_id or history.default_site),
+                    coordinator.statistics,
+                    coordinator.async_save_statistics,
+                    entry.options.get(CONF_BACKFILL_DAYS, DEFAULT_BACKFILL_DAYS),
+                    pw_timezone or hass.config.time_zone,
+                ).async_run()
+            finally:
+                sessions.async_release(account_key)
+
+        entry.async_create_background_task(
+            hass, async_backfill(), f"{DOMAIN} energy backfill"
+        )
+
+    if account is not None:
+        _async_discover_sites(hass, entry, account)
+
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
     return True
 
 
+@callback
+def _async_discover_sites(
+    hass: HomeAssistant, entry: ConfigEntry, account: Pw3AccountCoordinator
+) -> None:
+    """Offer a config entry for each site on the account that has none."""
+    email = entry.data.get("pw_email")
+    claimed = {
+        other.data.get(CONF_SITE_ID) or account.default_site
+        for other in hass.config_entries.async_entries(DOMAIN)
+        if other.data.get("pw_email") == email
+    }
+    for site_id in account.sites:
+        if site_id in claimed:
+            continue
+        discovery_flow.async_create_flow(
+            hass,
+            DOMAIN,
+            context={"source": SOURCE_INTEGRATION_DISCOVERY},
+            data={
+                "pw_email": email,
+                "pw_timezone": entry.data.get("pw_timezone"),
+                CONF_SITE_ID: site_id,
+            },
+        )
+
+
+def _fast_sample_interval(entry: ConfigEntry, local: bool) -> timedelta | None:
+    """Return the configured fast-sample interval, or None when it is off."""
+    seconds = entry.options.get(CONF_FAST_SAMPLE_INTERVAL, DEFAULT_FAST_SAMPLE_INTERVAL)
+    if not seconds:
+        return None
+    if not local:
+        # Reading the cloud every few seconds would use up the account's
+        # rate limit and hold back the regular refreshes
+        _LOGGER.warning(
+            "Fast sampling needs a gateway host; it stays off for %s", entry.title
+        )
+        return None
+    return max(
+        MIN_FAST_SAMPLE_INTERVAL,
+        min(MAX_FAST_SAMPLE_INTERVAL, timedelta(seconds=seconds)),
+    )
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Handle removal of an entry."""
     coordinator = hass.data[DOMAIN][entry.entry_id]
@@ -90,11 +353,23 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     )
     if unloaded:
         hass.data[DOMAIN].pop(entry.entry_id)
+        await coordinator.async_save()
+        _async_release_sessions(hass, coordinator)
 
     return unloaded
 
 
+@callback
+def _async_release_sessions(
+    hass: HomeAssistant, coordinator: Pw3DataUpdateCoordinator
+) -> None:
+    """Release the pooled clients the coordinator's sources got as far as acquiring."""
+    sessions = async_get_session_pool(hass)
+    for source in coordinator.sources.sources:
+        if source.connected and source.session_key is not None:
+            sessions.async_release(source.session_key)
+
+
 async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Reload config entry."""
-    await async_unload_entry(hass, entry)
-    await async_setup_entry(hass, entry)
+    await hass.config_entries.async_reload(entry.entry_id)
@@ -1,76 +1,452 @@
-"""Sample API Client."""
+"""Tesla cloud API client for pw3."""
 
 import asyncio
+import json
 import logging
+import os
 import socket
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Callable
+from urllib.parse import urlencode
 
 import aiohttp
-import async_timeout
+
+from .ratelimit import CONTROL
+from .ratelimit import HISTORY
+from .ratelimit import LIVE
+from .ratelimit import MAX_WAIT
+from .ratelimit import RateLimiter
 
 TIMEOUT = 10
 
+OWNER_API_URL = "https://owner-api.teslamotors.com/api/1"
+SSO_TOKEN_URL = "https://auth.tesla.com/oauth2/v3/token"
+SSO_CLIENT_ID = "ownerapi"
+
+# Token and site files written by pypowerwall's cloud setup
+AUTHFILE = ".pypowerwall.auth"
+SITEFILE = ".pypowerwall.site"
+
+# live_status feeds power, grid and SOE; reuse one response for this long so a
+# refresh that reads all three only makes one request.
+LIVE_STATUS_TTL = 5
+
+# Refresh the access token this many seconds before it expires
+TOKEN_EXPIRY_MARGIN = 60
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
 HEADERS = {"Content-type": "application/json; charset=UTF-8"}
 
 
+class Pw3ApiClientError(Exception):
+    """Exception to indicate a general API error."""
+
+
+class Pw3ApiClientAuthenticationError(Pw3ApiClientError):
+    """Exception to indicate an authentication error."""
+
+
+class Pw3ApiClientRateLimitError(Pw3ApiClientError):
+    """Exception to indicate a call was throttled or held back by backoff."""
+
+    def __init__(self, message: str, retry_after: float | None = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Return the seconds a Retry-After header asks to wait, if it is valid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def load_cloud_auth(authpath: str, email: str) -> tuple[dict | None, int | None]:
+    """Read the token and site id pypowerwall cached under authpath.
+
+    This does blocking file I/O and must run in the executor.
+    """
+    token = None
+    site_id = None
+    try:
+        with open(os.path.join(authpath, AUTHFILE), encoding="utf-8") as file:
+            token = json.load(file).get(email, {}).get("sso") or None
+    except (OSError, ValueError) as exception:
+        _LOGGER.debug("Unable to read Tesla token cache: %s", exception)
+    try:
+        with open(os.path.join(authpath, SITEFILE), encoding="utf-8") as file:
+            site_id = int(file.read())
+    except (OSError, ValueError):
+        pass
+    return token, site_id
+
+
+def save_cloud_token(authpath: str, email: str, token: dict) -> None:
+    """Write a refreshed token back to pypowerwall's cache.
+
+    This does blocking file I/O and must run in the executor.
+    """
+    path = os.path.join(authpath, AUTHFILE)
+    try:
+        with open(path, encoding="utf-8") as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        cache = {}
+    entry = cache.setdefault(email, {})
+    entry["sso"] = token
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(cache, file)
+
+
+class _Login:
+    """Token state shared by the clients of one account."""
+
+    def __init__(self, token: dict) -> None:
+        self.token = token
+        self.lock = asyncio.Lock()
+
+
 class Pw3ApiClient:
     def __init__(
-        self, username: str, password: str, session: aiohttp.ClientSession
+        self,
+        email: str,
+        session: aiohttp.ClientSession,
+        token: dict,
+        site_id: int | None = None,
+        base_url: str = OWNER_API_URL,
+        token_url: str = SSO_TOKEN_URL,
+        token_updater: Callable[[dict], None] | None = None,
+        limiter: RateLimiter | None = None,
     ) -> None:
-        """Sample API Client."""
-        self._username = username
-        self._passeword = password
+        """Tesla Owner/Fleet API client for a single energy site.
+
+        Requests go through the shared aiohttp session, so connections to the
+        API host are kept alive and reused between refreshes, and through
+        the account's rate limiter when one is given.
+        """
+        self._email = email
         self._session = session
+        self._login = _Login(dict(token))
+        self._site_id = site_id
+        self._base_url = base_url.rstrip("/")
+        self._token_url = token_url
+        self._token_updater = token_updater
+        self.limiter = limiter
+        self._live_status: dict | None = None
+        self._live_status_time = 0.0
+        self._live_status_task: asyncio.Task | None = None
+
+    @property
+    def site_id(self) -> int | None:
+        """Return the energy site id, once known."""
+        return self._site_id
+
+    @property
+    def _token(self) -> dict:
+        return self._login.token
 
-    async def async_get_data(self) -> dict:
-        """Get data from the API."""
-        url = "https://jsonplaceholder.typicode.com/posts/1"
-        return await self.api_wrapper("get", url)
+    @_token.setter
+    def _token(self, token: dict) -> None:
+        self._login.token = token
 
-    async def async_set_title(self, value: str) -> None:
-        """Get data from the API."""
-        url = "https://jsonplaceholder.typicode.com/posts/1"
-        await self.api_wrapper("patch", url, data={"title": value}, headers=HEADERS)
+    def for_site(self, site_id: int) -> "Pw3ApiClient":
+        """Return a client for another site on the account, sharing this login.
+
+        Both clients use one token, so a refresh by either is seen by the
+        other and the account logs in once however many sites it has.
+        """
+        client = Pw3ApiClient(
+            self._email,
+            self._session,
+            {},
+            site_id=site_id,
+            base_url=self._base_url,
+            token_url=self._token_url,
+            token_updater=self._token_updater,
+            limiter=self.limiter,
+        )
+        client._login = self._login
+        return client
+
+    async def async_get_sites(self) -> list[dict]:
+        """Return the energy sites on the account."""
+        response = await self.api_wrapper("get", f"{self._base_url}/products")
+        return [
+            product
+            for product in response.get("response", [])
+            if "energy_site_id" in product
+        ]
+
+    async def async_get_site_id(self) -> int:
+        """Return the configured site id, discovering the first site if unset."""
+        if self._site_id is None:
+            sites = await self.async_get_sites()
+            if not sites:
+                raise Pw3ApiClientError("No Tesla energy sites found")
+            self._site_id = int(sites[0]["energy_site_id"])
+        return self._site_id
+
+    async def async_get_live_status(self) -> dict:
+        """Return the site live_status, shared by concurrent and recent callers."""
+        if (
+            self._live_status is not None
+            and time.monotonic() - self._live_status_time < LIVE_STATUS_TTL
+        ):
+            return self._live_status
+        if self._live_status_task is None or self._live_status_task.done():
+            self._live_status_task = asyncio.create_task(
+                self._async_fetch_live_status()
+            )
+        return await asyncio.shield(self._live_status_task)
+
+    async def _async_fetch_live_status(self) -> dict:
+        site_id = await self.async_get_site_id()
+        response = await self.api_wrapper(
+            "get", f"{self._base_url}/energy_sites/{site_id}/live_status"
+        )
+        self._live_status = response["response"]
+        self._live_status_time = time.monotonic()
+        return self._live_status
+
+    async def async_get_aggregates(self) -> dict:
+        """Return live power in pypowerwall's /api/meters/aggregates shape."""
+        status = await self.async_get_live_status()
+        return {
+            "site": {"instant_power": status.get("grid_power") or 0},
+            "battery": {"instant_power": status.get("battery_power") or 0},
+            "load": {"instant_power": status.get("load_power") or 0},
+            "solar": {"instant_power": status.get("solar_power") or 0},
+        }
+
+    async def async_get_power(self) -> dict:
+        """Return live power in pypowerwall's power() shape."""
+        aggregates = await self.async_get_aggregates()
+        return {key: value["instant_power"] for key, value in aggregates.items()}
+
+    async def async_get_grid(self) -> float:
+        """Return live grid power, negative when exporting."""
+        return (await self.async_get_aggregates())["site"]["instant_power"]
+
+    async def async_get_soe(self) -> dict:
+        """Return the battery state of energy in gateway (unscaled) percent."""
+        status = await self.async_get_live_status()
+        # The cloud reports the app-scaled charge, which hides a 5% reserve
+        percentage_charged = status.get("percentage_charged") or 0
+        return {"percentage": (percentage_charged + (5 / 0.95)) * 0.95}
+
+    async def async_get_calendar_history(
+        self, end_date: datetime, time_zone: str, kind: str = "energy"
+    ) -> list[dict]:
+        """Return one day of site history, ending at end_date, as a time series."""
+        site_id = await self.async_get_site_id()
+        query = urlencode(
+            {
+                "kind": kind,
+                "period": "day",
+                "end_date": end_date.isoformat(),
+                "time_zone": time_zone,
+            }
+        )
+        response = await self.api_wrapper(
+            "get",
+            f"{self._base_url}/energy_sites/{site_id}/calendar_history?{query}",
+            lane=HISTORY,
+        )
+        return response["response"].get("time_series") or []
+
+    async def async_get_settings(self) -> dict:
+        """Return the site's battery settings, keyed as pw3's controls are."""
+        site_id = await self.async_get_site_id()
+        response = await self.api_wrapper(
+            "get", f"{self._base_url}/energy_sites/{site_id}/site_info"
+        )
+        info = response["response"]
+        return {
+            "backup_reserve": info.get("backup_reserve_percent"),
+            "operation_mode": info.get("default_real_mode"),
+            "storm_mode": (info.get("user_settings") or {}).get("storm_mode_enabled"),
+            "grid_charging": not (info.get("components") or {}).get(
+                "disallow_charge_from_grid_with_solar_installed", False
+            ),
+        }
+
+    async def async_set_backup_reserve(self, percent: int) -> None:
+        """Set the backup reserve, in percent as the Tesla app shows it."""
+        await self._async_command("backup", {"backup_reserve_percent": percent})
+
+    async def async_set_operation_mode(self, mode: str) -> None:
+        """Set the operation mode: self_consumption, autonomous or backup."""
+        await self._async_command("operation", {"default_real_mode": mode})
+
+    async def async_set_storm_mode(self, enabled: bool) -> None:
+        """Turn Storm Watch on or off."""
+        await self._async_command("storm_mode", {"enabled": enabled})
+
+    async def async_set_grid_charging(self, enabled: bool) -> None:
+        """Allow or stop charging the battery from the grid."""
+        await self._async_command(
+            "grid_import_export",
+            {"disallow_charge_from_grid_with_solar_installed": not enabled},
+        )
+
+    async def _async_command(self, command: str, data: dict) -> None:
+        site_id = await self.async_get_site_id()
+        await self.api_wrapper(
+            "post",
+            f"{self._base_url}/energy_sites/{site_id}/{command}",
+            data=data,
+            lane=CONTROL,
+        )
+
+    async def async_refresh_token(self) -> None:
+        """Exchange the refresh token for a new access token."""
+        refresh_token = self._token.get("refresh_token")
+        if not refresh_token:
+            raise Pw3ApiClientAuthenticationError("No refresh token available")
+        try:
+            async with asyncio.timeout(TIMEOUT):
+                async with self._session.post(
+                    self._token_url,
+                    json={
+                        "grant_type": "refresh_token",
+                        "client_id": SSO_CLIENT_ID,
+                        "refresh_token": refresh_token,
+                        "scope": "openid email offline_access",
+                    },
+                ) as response:
+                    if response.status in (400, 401, 403):
+                        raise Pw3ApiClientAuthenticationError(
+                            f"Token refresh rejected ({response.status})"
+                        )
+                    response.raise_for_status()
+                    token = await response.json()
+        except (asyncio.TimeoutError, aiohttp.ClientError) as exception:
+            raise Pw3ApiClientError(
+                f"Error refreshing Tesla token - {exception}"
+            ) from exception
+
+        token.setdefault("refresh_token", refresh_token)
+        if "expires_in" in token:
+            token["expires_at"] = time.time() + token["expires_in"]
+        self._token = token
+        if self._token_updater is not None:
+            self._token_updater(token)
+
+    async def _async_ensure_token(self) -> None:
+        expires_at = self._token.get("expires_at", 0)
+        if self._token.get("access_token") and (
+            not expires_at or expires_at - TOKEN_EXPIRY_MARGIN > time.time()
+        ):
+            return
+        async with self._login.lock:
+            if self._token.get("expires_at", 0) == expires_at:
+                await self.async_refresh_token()
 
     async def api_wrapper(
-        self, method: str, url: str, data: dict = {}, headers: dict = {}
+        self,
+        method: str,
+        url: str,
+        data: dict | None = None,
+        headers: dict = {},
+        lane: int = LIVE,
     ) -> dict:
-        """Get information from the API."""
-        try:
-            async with async_timeout.timeout(TIMEOUT, loop=asyncio.get_event_loop()):
-                if method == "get":
-                    response = await self._session.get(url, headers=headers)
-                    return await response.json()
+        """Call the API, refreshing the access token once on a 401.
 
-                elif method == "put":
-                    await self._session.put(url, headers=headers, json=data)
+        Each attempt waits for a rate limiter token in lane. Throttling and
+        server or network errors put the account's calls into backoff.
+        """
+        await self._async_ensure_token()
+        refreshed = False
+        while True:
+            await self._async_wait_turn(lane)
+            request_headers = {
+                **HEADERS,
+                **headers,
+                "Authorization": f"Bearer {self._token['access_token']}",
+            }
+            try:
+                async with asyncio.timeout(TIMEOUT):
+                    async with self._session.request(
+                        method, url, headers=request_headers, json=data
+                    ) as response:
+                        if response.status == 401 and not refreshed:
+                            await self.async_refresh_token()
+                            refreshed = True
+                            continue
+                        if response.status in (401, 403):
+                            raise Pw3ApiClientAuthenticationError(
+                                f"Tesla API rejected credentials ({response.status})"
+                            )
+                        retry_after = parse_retry_after(
+                            response.headers.get("Retry-After")
+                        )
+                        if response.status == 429 or (
+                            response.status == 503 and retry_after is not None
+                        ):
+                            if self.limiter is not None:
+                                retry_after = self.limiter.throttle(retry_after)
+                            raise Pw3ApiClientRateLimitError(
+                                f"Tesla API throttled {url} ({response.status})",
+                                retry_after,
+                            )
+                        response.raise_for_status()
+                        result = await response.json()
+                        if self.limiter is not None:
+                            self.limiter.success()
+                        return result
 
-                elif method == "patch":
-                    await self._session.patch(url, headers=headers, json=data)
+            except asyncio.TimeoutError as exception:
+                _LOGGER.error(
+                    "Timeout error fetching information from %s - %s",
+                    url,
+                    exception,
+                )
+                self._backoff()
+                raise Pw3ApiClientError(f"Timeout fetching {url}") from exception
 
-                elif method == "post":
-                    await self._session.post(url, headers=headers, json=data)
+            except (KeyError, TypeError, ValueError) as exception:
+                _LOGGER.error(
+                    "Error parsing information from %s - %s",
+                    url,
+                    exception,
+                )
+                raise Pw3ApiClientError(f"Error parsing {url}") from exception
 
-        except asyncio.TimeoutError as exception:
-            _LOGGER.error(
-                "Timeout error fetching information from %s - %s",
-                url,
-                exception,
-            )
+            except (aiohttp.ClientError, socket.gaierror) as exception:
+                _LOGGER.error(
+                    "Error fetching information from %s - %s",
+                    url,
+                    exception,
+                )
+                # Client errors other than throttling are not worth backing
+                # off for; server and connection errors are
+                if (
+                    not isinstance(exception, aiohttp.ClientResponseError)
+                    or exception.status >= 500
+                ):
+                    self._backoff()
+                raise Pw3ApiClientError(f"Error fetching {url}") from exception
 
-        except (KeyError, TypeError) as exception:
-            _LOGGER.error(
-                "Error parsing information from %s - %s",
-                url,
-                exception,
-            )
-        except (aiohttp.ClientError, socket.gaierror) as exception:
-            _LOGGER.error(
-                "Error fetching information from %s - %s",
-                url,
-                exception,
+    async def _async_wait_turn(self, lane: int) -> None:
+        """Wait for the rate limiter, or fail fast while calls are held back."""
+        if self.limiter is None:
+            return
+        if not await self.limiter.async_acquire(lane, MAX_WAIT[lane]):
+            retry_after = self.limiter.retry_in()
+            raise Pw3ApiClientRateLimitError(
+                f"Tesla API calls held back for {round(retry_after)}s", retry_after
             )
-        except Exception as exception:  # pylint: disable=broad-except
-            _LOGGER.error("Something really wrong happened! - %s", exception)
+
+    def _backoff(self) -> None:
+        if self.limiter is not None:
+            self.limiter.failure()
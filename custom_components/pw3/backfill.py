@@ -0,0 +1,160 @@
+"""Historical energy backfill for pw3 from Tesla calendar history."""
+
+import logging
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from datetime import tzinfo
+from typing import Awaitable
+from typing import Callable
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from .api import Pw3ApiClient
+from .api import Pw3ApiClientError
+from .const import MAX_BACKFILL_DAYS
+from .statistics import HOUR_SECONDS
+from .statistics import StatisticsAggregator
+
+# Days of history fetched (one request each) per import batch and checkpoint
+BACKFILL_BATCH_DAYS = 7
+
+# calendar_history fields (Wh per interval) making up each *_energy field.
+# Battery and grid follow the coordinator's signs: consumption is battery
+# discharge and grid import.
+HISTORY_FIELDS: dict[str, tuple[str, ...]] = {
+    "solar_energy": ("solar_energy_exported",),
+    "home_energy": (
+        "consumer_energy_imported_from_grid",
+        "consumer_energy_imported_from_solar",
+        "consumer_energy_imported_from_battery",
+        "consumer_energy_imported_from_generator",
+    ),
+    "battery_consumption_energy": ("battery_energy_exported",),
+    "battery_production_energy": (
+        "battery_energy_imported_from_grid",
+        "battery_energy_imported_from_solar",
+        "battery_energy_imported_from_generator",
+    ),
+    "grid_consumption_energy": ("grid_energy_imported",),
+    "grid_production_energy": (
+        "grid_energy_exported_from_solar",
+        "grid_energy_exported_from_battery",
+        "grid_energy_exported_from_generator",
+    ),
+}
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+def hourly_energy(
+    time_series: list[dict], start: float, end: float
+) -> dict[float, dict[str, float]]:
+    """Sum calendar_history intervals into {hour start: {field: Wh}}.
+
+    Intervals outside [start, end) are dropped.
+    """
+    hours: dict[float, dict[str, float]] = {}
+    for interval in time_series:
+        if (timestamp := dt_util.parse_datetime(interval.get("timestamp", ""))) is None:
+            continue
+        hour = timestamp.timestamp() - timestamp.timestamp() % HOUR_SECONDS
+        if not start <= hour < end:
+            continue
+        totals = hours.setdefault(hour, dict.fromkeys(HISTORY_FIELDS, 0.0))
+        for field, sources in HISTORY_FIELDS.items():
+            totals[field] += sum(interval.get(source) or 0 for source in sources)
+    return hours
+
+
+class EnergyBackfill:
+    """Import hourly energy history the live statistics do not cover.
+
+    On first setup this is the last `days` days; after downtime it is the
+    gap since the last imported hour. History is fetched a day at a time
+    and imported in batches of BACKFILL_BATCH_DAYS, saving the checkpoint
+    after each, so an interrupted backfill resumes where it stopped. Live
+    statistics imports wait until the backfill finishes.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        api: Pw3ApiClient,
+        statistics: StatisticsAggregator,
+        checkpoint: Callable[[], Awaitable[None]],
+        days: int,
+        time_zone: str,
+    ) -> None:
+        self.hass = hass
+        self.api = api
+        self.statistics = statistics
+        self.checkpoint = checkpoint
+        self.days = days
+        self.time_zone = time_zone
+
+    async def async_run(self) -> int:
+        """Run the backfill; returns the number of hours imported."""
+        self.statistics.paused = True
+        try:
+            return await self._async_backfill()
+        except Pw3ApiClientError as exception:
+            _LOGGER.warning("Energy history backfill stopped: %s", exception)
+            return 0
+        finally:
+            self.statistics.paused = False
+            self.statistics.async_import(self.hass)
+            await self.checkpoint()
+
+    async def _async_backfill(self) -> int:
+        now = dt_util.utcnow().timestamp()
+        end = now - now % HOUR_SECONDS
+        zone = dt_util.get_time_zone(self.time_zone) or dt_util.DEFAULT_TIME_ZONE
+        if self.statistics.last_hour is not None:
+            start = self.statistics.last_hour + HOUR_SECONDS
+        elif self.days:
+            first_day = datetime.fromtimestamp(now, zone).date() - timedelta(self.days)
+            start = self._midnight(first_day, zone)
+        else:
+            return 0
+        start = max(start, end - MAX_BACKFILL_DAYS * 86400)
+        if start >= end:
+            return 0
+
+        _LOGGER.info(
+            "Backfilling energy history from %s", dt_util.utc_from_timestamp(start)
+        )
+        imported = 0
+        batch: dict[float, dict[str, float]] = {}
+        day = datetime.fromtimestamp(start, zone).date()
+        fetched = 0
+        while self._midnight(day, zone) < end:
+            # end_date is the last second of the local day
+            day_end = datetime.fromtimestamp(
+                self._midnight(day + timedelta(days=1), zone) - 1, zone
+            )
+            time_series = await self.api.async_get_calendar_history(
+                day_end, self.time_zone
+            )
+            batch.update(hourly_energy(time_series, start, end))
+            fetched += 1
+            day += timedelta(days=1)
+            if fetched % BACKFILL_BATCH_DAYS == 0 or self._midnight(day, zone) >= end:
+                imported += self._import(batch)
+                batch = {}
+                await self.checkpoint()
+        return imported
+
+    def _import(self, batch: dict[float, dict[str, float]]) -> int:
+        fields = self.statistics.sum_fields
+        hours = [
+            (hour, {field: wh for field, wh in deltas.items() if field in fields})
+            for hour, deltas in sorted(batch.items())
+        ]
+        self.statistics.async_import_energy(self.hass, hours)
+        return len(hours)
+
+    @staticmethod
+    def _midnight(day: date, zone: tzinfo) -> float:
+        return datetime.combine(day, datetime.min.time(), zone).timestamp()
@@ -2,8 +2,45 @@
 
 import voluptuous as vol
 from homeassistant import config_entries
+from homeassistant.core import callback
+from homeassistant.helpers import selector
 
+from .const import CONF_BACKFILL_DAYS
+from .const import CONF_DEADBANDS
+from .const import CONF_FAST_SAMPLE_INTERVAL
+from .const import CONF_GATEWAY_PASSWORD
+from .const import CONF_HOST
+from .const import CONF_IMPORT_STATISTICS
+from .const import CONF_MAX_INTERVAL
+from .const import CONF_MAX_STATE_AGE
+from .const import CONF_MIN_INTERVAL
+from .const import CONF_NATIVE_API
+from .const import CONF_SITE_ID
+from .const import DEFAULT_BACKFILL_DAYS
+from .const import DEFAULT_FAST_SAMPLE_INTERVAL
+from .const import DEFAULT_IMPORT_STATISTICS
+from .const import DEFAULT_MAX_INTERVAL
+from .const import DEFAULT_MAX_STATE_AGE
+from .const import DEFAULT_MIN_INTERVAL
 from .const import DOMAIN
+from .const import MAX_BACKFILL_DAYS
+from .const import MAX_FAST_SAMPLE_INTERVAL
+from .const import MAX_POLL_INTERVAL
+from .const import MAX_STATE_AGE
+from .const import MIN_POLL_INTERVAL
+
+# Bounds of the refresh interval options, in seconds
+POLL_INTERVAL_RANGE = vol.All(
+    vol.Coerce(float),
+    vol.Range(
+        min=MIN_POLL_INTERVAL.total_seconds(), max=MAX_POLL_INTERVAL.total_seconds()
+    ),
+)
+
+
+def _deadbands(value):
+    """Validate the per-sensor deadbands, a mapping of sensor key to change."""
+    return vol.Schema({str: vol.All(vol.Coerce(float), vol.Range(min=0))})(value or {})
 
 
 class Pw3ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
@@ -16,7 +53,16 @@ class Pw3ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             # Validate email
             if "@" not in user_input["pw_email"]:
                 errors["pw_email"] = "invalid_email"
+            elif user_input.get(CONF_HOST) and not user_input.get(
+                CONF_GATEWAY_PASSWORD
+            ):
+                # Powerwall 3 gateways only answer TEDAPI with the QR password
+                errors[CONF_GATEWAY_PASSWORD] = "gateway_password_required"
             else:
+                if (site_id := user_input.get(CONF_SITE_ID)) is not None:
+                    # Same id as discovered entries, so a site is only added once
+                    await self.async_set_unique_id(str(site_id))
+                    self._abort_if_unique_id_configured()
                 return self.async_create_entry(title="PW3", data=user_input)
 
         return self.async_show_form(
@@ -31,10 +77,149 @@ class Pw3ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                         description="Your timezone (e.g., America/New_York)",
                         default="America/New_York",
                     ): str,
+                    # Energy site to read; the account's first site if unset
+                    vol.Optional(
+                        CONF_SITE_ID,
+                        description="Tesla energy site id",
+                    ): vol.Coerce(int),
+                    vol.Optional(
+                        CONF_HOST,
+                        description="Gateway address on your LAN (e.g., 192.168.91.1)",
+                    ): str,
+                    vol.Optional(
+                        CONF_GATEWAY_PASSWORD,
+                        description="Gateway password from the QR sticker",
+                    ): str,
                 }
             ),
             errors=errors,
         )
 
+    async def async_step_integration_discovery(self, discovery_info):
+        """Handle another energy site found on a configured account."""
+        await self.async_set_unique_id(str(discovery_info[CONF_SITE_ID]))
+        self._abort_if_unique_id_configured()
+        self._discovered = discovery_info
+        self.context["title_placeholders"] = {
+            "site_id": str(discovery_info[CONF_SITE_ID])
+        }
+        return await self.async_step_discovery_confirm()
+
+    async def async_step_discovery_confirm(self, user_input=None):
+        """Confirm adding a discovered energy site."""
+        site_id = str(self._discovered[CONF_SITE_ID])
+        if user_input is not None:
+            # Discovered sites are polled through the shared account client
+            return self.async_create_entry(
+                title=f"PW3 {site_id}",
+                data=self._discovered,
+                options={CONF_NATIVE_API: True},
+            )
+
+        return self.async_show_form(
+            step_id="discovery_confirm",
+            description_placeholders={"site_id": site_id},
+        )
+
     # Ensure the integration always starts with the user step
     async_step_import = async_step_user
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Return the options flow."""
+        return Pw3OptionsFlowHandler(config_entry)
+
+
+class Pw3OptionsFlowHandler(config_entries.OptionsFlow):
+    """Options for an existing entry."""
+
+    def __init__(self, config_entry):
+        """Initialize the options flow."""
+        self.config_entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        """Manage the options."""
+        return await self.async_step_user()
+
+    async def async_step_user(self, user_input=None):
+        """Handle the options form."""
+        options = self.config_entry.options
+        errors = {}
+        if user_input is not None:
+            min_interval = user_input.get(
+                CONF_MIN_INTERVAL,
+                options.get(CONF_MIN_INTERVAL, DEFAULT_MIN_INTERVAL.total_seconds()),
+            )
+            max_interval = user_input.get(
+                CONF_MAX_INTERVAL,
+                options.get(CONF_MAX_INTERVAL, DEFAULT_MAX_INTERVAL.total_seconds()),
+            )
+            if min_interval > max_interval:
+                errors[CONF_MAX_INTERVAL] = "max_interval_below_min"
+            else:
+                # Options not on the form, such as native_api, are kept
+                return self.async_create_entry(title="", data={**options, **user_input})
+            # Show the rejected values again rather than the saved ones
+            options = {**options, **user_input}
+
+        return self.async_show_form(
+            step_id="user",
+            data_schema=vol.Schema(
+                {
+                    # Bounds of the adaptive refresh interval, in seconds
+                    vol.Optional(
+                        CONF_MIN_INTERVAL,
+                        default=options.get(
+                            CONF_MIN_INTERVAL, DEFAULT_MIN_INTERVAL.total_seconds()
+                        ),
+                    ): POLL_INTERVAL_RANGE,
+                    vol.Optional(
+                        CONF_MAX_INTERVAL,
+                        default=options.get(
+                            CONF_MAX_INTERVAL, DEFAULT_MAX_INTERVAL.total_seconds()
+                        ),
+                    ): POLL_INTERVAL_RANGE,
+                    # Seconds between gateway reads; 0 turns fast sampling off
+                    vol.Optional(
+                        CONF_FAST_SAMPLE_INTERVAL,
+                        default=options.get(
+                            CONF_FAST_SAMPLE_INTERVAL, DEFAULT_FAST_SAMPLE_INTERVAL
+                        ),
+                    ): vol.All(
+                        vol.Coerce(float),
+                        vol.Range(min=0, max=MAX_FAST_SAMPLE_INTERVAL.total_seconds()),
+                    ),
+                    # Seconds a sensor may go without a state write; 0 writes
+                    # every refresh
+                    vol.Optional(
+                        CONF_MAX_STATE_AGE,
+                        default=options.get(
+                            CONF_MAX_STATE_AGE, DEFAULT_MAX_STATE_AGE.total_seconds()
+                        ),
+                    ): vol.All(
+                        vol.Coerce(float),
+                        vol.Range(min=0, max=MAX_STATE_AGE.total_seconds()),
+                    ),
+                    # Smallest change worth a state write, by sensor key;
+                    # sensors not listed keep their device class default
+                    vol.Optional(
+                        CONF_DEADBANDS, default=options.get(CONF_DEADBANDS, {})
+                    ): vol.All(selector.ObjectSelector(), _deadbands),
+                    vol.Optional(
+                        CONF_IMPORT_STATISTICS,
+                        default=options.get(
+                            CONF_IMPORT_STATISTICS, DEFAULT_IMPORT_STATISTICS
+                        ),
+                    ): bool,
+                    # Days of cloud history imported on first setup
+                    vol.Optional(
+                        CONF_BACKFILL_DAYS,
+                        default=options.get(CONF_BACKFILL_DAYS, DEFAULT_BACKFILL_DAYS),
+                    ): vol.All(
+                        vol.Coerce(int), vol.Range(min=0, max=MAX_BACKFILL_DAYS)
+                    ),
+                }
+            ),
+            errors=errors,
+        )
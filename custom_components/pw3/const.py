@@ -1,26 +1,22 @@
 """Constants for pw3."""
 
+from datetime import timedelta
+
 # Base component constants
 NAME = "pw3"
 DOMAIN = "pw3"
 DOMAIN_DATA = f"{DOMAIN}_data"
 VERSION = "0.0.0"
 
-ATTRIBUTION = "Data provided by http://jsonplaceholder.typicode.com/"
 ISSUE_URL = "https://github.com/wilfredallyn/pw3/issues"
 
-# Icons
-ICON = "mdi:format-quote-close"
-
-# Device classes
-BINARY_SENSOR_DEVICE_CLASS = "connectivity"
-
 # Platforms
-BINARY_SENSOR = "binary_sensor"
 SENSOR = "sensor"
+NUMBER = "number"
+SELECT = "select"
 SWITCH = "switch"
 ENERGY_SENSOR = "energy"
-PLATFORMS = [SENSOR]
+PLATFORMS = [SENSOR, NUMBER, SELECT, SWITCH]
 
 
 # Configuration and options
@@ -31,9 +27,44 @@ CONF_SOLAR = "solar"
 CONF_BATTERY = "battery"
 CONF_HOME = "home"
 CONF_GRID = "grid"
+CONF_SITE_ID = "pw_site_id"
+CONF_HOST = "pw_host"
+CONF_GATEWAY_PASSWORD = "pw_gw_password"
+CONF_AGGREGATE_POLL = "aggregate_poll"
+CONF_NATIVE_API = "native_api"
+CONF_MIN_INTERVAL = "min_interval"
+CONF_MAX_INTERVAL = "max_interval"
+CONF_DEADBANDS = "deadbands"
+CONF_MAX_STATE_AGE = "max_state_age"
+CONF_FAST_SAMPLE_INTERVAL = "fast_sample_interval"
+CONF_IMPORT_STATISTICS = "import_statistics"
+CONF_BACKFILL_DAYS = "backfill_days"
+CONF_BACKUP_RESERVE = "backup_reserve"
 
 # Defaults
 DEFAULT_NAME = DOMAIN
+DEFAULT_AGGREGATE_POLL = True
+DEFAULT_NATIVE_API = False
+DEFAULT_UPDATE_INTERVAL = timedelta(minutes=1)
+DEFAULT_MIN_INTERVAL = timedelta(seconds=15)
+DEFAULT_MAX_INTERVAL = timedelta(minutes=5)
+DEFAULT_MAX_STATE_AGE = timedelta(minutes=15)
+# Fast sampling is off by default; when set it is clamped to this range
+DEFAULT_FAST_SAMPLE_INTERVAL = 0
+DEFAULT_IMPORT_STATISTICS = False
+# Days of history imported on first setup when statistics import is on
+DEFAULT_BACKFILL_DAYS = 7
+# Longest gap backfilled, on first setup or after downtime
+MAX_BACKFILL_DAYS = 90
+# Backup reserve (%, as the Tesla app shows it) used for reserve forecasts
+DEFAULT_BACKUP_RESERVE = 20
+MIN_FAST_SAMPLE_INTERVAL = timedelta(seconds=1)
+MAX_FAST_SAMPLE_INTERVAL = timedelta(seconds=5)
+# Range offered for the adaptive refresh interval's bounds
+MIN_POLL_INTERVAL = timedelta(seconds=5)
+MAX_POLL_INTERVAL = timedelta(hours=1)
+# Longest max_state_age offered; states are written at least daily
+MAX_STATE_AGE = timedelta(days=1)
 
 
 STARTUP_MESSAGE = f"""
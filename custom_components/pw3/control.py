@@ -0,0 +1,234 @@
+"""Battery controls for pw3: optimistic settings and batched command writes."""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import TYPE_CHECKING
+from typing import Any
+from typing import Callable
+
+from homeassistant.core import CALLBACK_TYPE
+from homeassistant.core import HomeAssistant
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+
+from .api import Pw3ApiClient
+from .api import Pw3ApiClientError
+from .coordinator import Pw3DataUpdateCoordinator
+from .executor import ExecutorBusyError
+
+if TYPE_CHECKING:
+    from pypowerwall import Powerwall
+
+# Settings, named as Pw3ApiClient.async_get_settings returns them
+BACKUP_RESERVE = "backup_reserve"
+OPERATION_MODE = "operation_mode"
+STORM_MODE = "storm_mode"
+GRID_CHARGING = "grid_charging"
+OPERATION_MODES = ["self_consumption", "autonomous", "backup"]
+
+# Client method writing each setting; a client without one does not
+# support that setting
+SETTERS = {
+    BACKUP_RESERVE: "async_set_backup_reserve",
+    OPERATION_MODE: "async_set_operation_mode",
+    STORM_MODE: "async_set_storm_mode",
+    GRID_CHARGING: "async_set_grid_charging",
+}
+
+# Seconds to wait for further changes before sending them, e.g. while a
+# reserve slider is being dragged
+COMMAND_DEBOUNCE = 2.0
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+class CommandQueue:
+    """Queue setting changes and write them to the Tesla API in one batch.
+
+    A change shows in settings at once. Writes wait until no change has
+    come for the cooldown, which each change restarts; then only the last
+    value of each setting is sent, and only if it differs from what Tesla
+    last confirmed. Changes made while a batch is being written go out in
+    the next one. A write that fails puts its setting back to the
+    confirmed value. Each batch that wrote anything is followed by a
+    single coordinator refresh instead of one per command.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        api: "Pw3ApiClient | PowerwallControlClient",
+        coordinator: Pw3DataUpdateCoordinator,
+        cooldown: float = COMMAND_DEBOUNCE,
+    ) -> None:
+        self.hass = hass
+        self.api = api
+        self.coordinator = coordinator
+        self.cooldown = cooldown
+        self.settings: dict[str, Any] = {}
+        self.confirmed: dict[str, Any] = {}
+        self.pending: dict[str, Any] = {}
+        self.commands_sent = 0
+        self._listeners: list[Callable[[], None]] = []
+        self._cancel_flush: CALLBACK_TYPE | None = None
+        self._flushing = False
+        self._setters: dict[str, Callable[[Any], Any]] = {
+            key: getattr(api, setter)
+            for key, setter in SETTERS.items()
+            if hasattr(api, setter)
+        }
+
+    @property
+    def supported(self) -> set[str]:
+        """Return the settings the client can write."""
+        return set(self._setters)
+
+    async def async_load(self) -> None:
+        """Read the current settings from the site."""
+        try:
+            settings = await self.api.async_get_settings()
+        except Pw3ApiClientError as exception:
+            _LOGGER.warning("Error reading Powerwall settings: %s", exception)
+            return
+        self.confirmed = settings
+        self.settings = {**settings, **self.pending}
+        self._async_apply()
+
+    async def async_set(self, key: str, value: Any) -> None:
+        """Change a setting now and queue the write."""
+        self.settings[key] = value
+        self.pending[key] = value
+        self._async_apply()
+        self._async_schedule_flush()
+
+    @callback
+    def _async_schedule_flush(self) -> None:
+        """Send the queued changes once the cooldown passes without another."""
+        if self._cancel_flush is not None:
+            self._cancel_flush()
+        self._cancel_flush = async_call_later(
+            self.hass, self.cooldown, self._async_flush_due
+        )
+
+    async def _async_flush_due(self, _now: datetime) -> None:
+        self._cancel_flush = None
+        if self._flushing:
+            # The batch being written schedules the next one when it ends
+            return
+        self._flushing = True
+        try:
+            await self._async_flush()
+        finally:
+            self._flushing = False
+        if self.pending and self._cancel_flush is None:
+            self._async_schedule_flush()
+
+    async def _async_flush(self) -> None:
+        """Send the queued changes that differ from the confirmed settings."""
+        pending, self.pending = self.pending, {}
+        sent = False
+        for key, value in pending.items():
+            if self.confirmed.get(key) == value:
+                continue
+            try:
+                await self._setters[key](value)
+            except Pw3ApiClientError as exception:
+                _LOGGER.error(
+                    "Error setting Powerwall %s to %s: %s", key, value, exception
+                )
+                if key not in self.pending:
+                    self.settings[key] = self.confirmed.get(key)
+                continue
+            self.commands_sent += 1
+            self.confirmed[key] = value
+            sent = True
+        self._async_apply()
+        if sent:
+            await self.coordinator.async_request_refresh()
+
+    @callback
+    def _async_apply(self) -> None:
+        """Pass the settings on to the forecaster and the entities."""
+        if (reserve := self.settings.get(BACKUP_RESERVE)) is not None:
+            self.coordinator.forecaster.reserve = reserve
+        for update_callback in list(self._listeners):
+            update_callback()
+
+    @callback
+    def async_add_listener(self, update_callback: CALLBACK_TYPE) -> CALLBACK_TYPE:
+        """Call update_callback when the settings change."""
+        self._listeners.append(update_callback)
+
+        @callback
+        def remove_listener() -> None:
+            self._listeners.remove(update_callback)
+
+        return remove_listener
+
+    @callback
+    def async_shutdown(self) -> None:
+        """Drop queued changes that have not been sent."""
+        self.pending = {}
+        if self._cancel_flush is not None:
+            self._cancel_flush()
+            self._cancel_flush = None
+
+
+class PowerwallControlClient:
+    """Battery settings through the entry's pypowerwall cloud client.
+
+    For entries that do not use the native API. Calls run in pw3's executor
+    through the account's rate limiter, on the control lane. pypowerwall
+    has no Storm Watch setting, so that one is not offered.
+    """
+
+    def __init__(self, coordinator: Pw3DataUpdateCoordinator) -> None:
+        self.coordinator = coordinator
+
+    async def _async_call(self, target: Callable[..., Any], *args: Any) -> Any:
+        source = self.coordinator.cloud
+        try:
+            await source.async_connect()
+            return await self.coordinator.async_control_job(target, source.pw, *args)
+        except Pw3ApiClientError:
+            raise
+        except (asyncio.TimeoutError, ExecutorBusyError) as exception:
+            raise Pw3ApiClientError(str(exception) or "Timed out") from exception
+        except Exception as exception:  # pylint: disable=broad-except
+            raise Pw3ApiClientError(f"pypowerwall error: {exception}") from exception
+
+    async def async_get_settings(self) -> dict[str, Any]:
+        """Return the settings pypowerwall reports; unsupported ones are left out."""
+        return await self._async_call(_read_settings)
+
+    async def async_set_backup_reserve(self, percent: float) -> None:
+        """Set the backup reserve, as the Tesla app shows it."""
+        await self._async_call(_write, "set_reserve", percent)
+
+    async def async_set_operation_mode(self, mode: str) -> None:
+        """Set the operation mode."""
+        await self._async_call(_write, "set_mode", mode)
+
+    async def async_set_grid_charging(self, enabled: bool) -> None:
+        """Allow or stop charging the battery from the grid."""
+        await self._async_call(_write, "set_grid_charging", enabled)
+
+
+def _read_settings(pw: "Powerwall") -> dict[str, Any]:
+    # One executor job and one limiter token for all of the settings
+    settings = {
+        BACKUP_RESERVE: pw.get_reserve(),
+        OPERATION_MODE: pw.get_mode(),
+        GRID_CHARGING: pw.get_grid_charging(),
+    }
+    if settings[BACKUP_RESERVE] is not None:
+        settings[BACKUP_RESERVE] = round(settings[BACKUP_RESERVE])
+    return {key: value for key, value in settings.items() if value is not None}
+
+
+def _write(pw: "Powerwall", method: str, value: Any) -> Any:
+    # pypowerwall logs why and returns None when it cannot make a change
+    if (result := getattr(pw, method)(value)) is None:
+        raise Pw3ApiClientError(f"pypowerwall {method} failed")
+    return result
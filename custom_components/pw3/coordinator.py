@@ -1,59 +1,1044 @@
+import asyncio
 import logging
+import math
+import random
+import time
+from datetime import datetime
 from datetime import timedelta
+from functools import partial
+from typing import TYPE_CHECKING
+from typing import Any
+from typing import Awaitable
+from typing import Callable
 
+from homeassistant.const import PERCENTAGE
+from homeassistant.const import UnitOfEnergy
+from homeassistant.const import UnitOfPower
+from homeassistant.core import CALLBACK_TYPE
 from homeassistant.core import HomeAssistant
+from homeassistant.core import callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.restore_state import async_get as async_get_restore_state
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
 from homeassistant.helpers.update_coordinator import UpdateFailed
-from pypowerwall import Powerwall
+from homeassistant.util import dt as dt_util
 
+from .api import Pw3ApiClient
+from .api import Pw3ApiClientError
+from .api import Pw3ApiClientRateLimitError
+from .const import CONF_SITE_ID
+from .const import DEFAULT_BACKUP_RESERVE
+from .const import DEFAULT_MAX_INTERVAL
+from .const import DEFAULT_MIN_INTERVAL
+from .const import DEFAULT_UPDATE_INTERVAL
 from .const import DOMAIN
+from .const import SENSOR
+from .derived import DerivedMetrics
+from .energy import MAX_INTEGRATION_GAP
+from .energy import EnergyAccumulator
+from .entity import unique_id
+from .executor import ExecutorTimeoutError
+from .executor import async_get_executor
+from .metrics import LOGIN
+from .metrics import REFRESH
+from .metrics import Metrics
+from .profiler import RefreshProfiler
+from .ratelimit import CONTROL
+from .ratelimit import LIVE
+from .ratelimit import MAX_WAIT
+from .ratelimit import RateLimiter
+from .samples import SampleBuffer
+from .source import CLOSED
+from .source import CLOUD
+from .source import LOCAL
+from .source import CircuitBreaker
+from .source import DataSource
+from .source import SourceSelector
+from .statistics import StatisticsAggregator
 
-SCAN_INTERVAL = timedelta(seconds=30)
+if TYPE_CHECKING:
+    # pypowerwall is only imported when a client is created, in the executor
+    from pypowerwall import Powerwall
+
+    from .control import CommandQueue
+
+# Deadline for a single upstream read; a read that misses it is reported as
+# stale instead of failing the whole refresh.
+FETCH_TIMEOUT = 20
+# Share of FETCH_TIMEOUT a pypowerwall read may spend waiting on the rate
+# limiter and then the executor. Both run out before the read's deadline,
+# so the log says which of them was stuck.
+FETCH_BUDGET = 0.9
+
+AGGREGATES_API = "/api/meters/aggregates"
+SOE_API = "/api/system_status/soe"
+
+POWER_FIELDS = ("solar", "home", "battery_consumption", "battery_production")
+GRID_FIELDS = ("grid_consumption", "grid_production")
+
+# Power fields integrated into the matching *_energy totals
+ENERGY_FIELDS = POWER_FIELDS + GRID_FIELDS
+
+# Fields kept per sample in fast-sample mode
+SAMPLE_FIELDS = ENERGY_FIELDS + ("percentage",)
+
+# Long-term statistics: units of the mean/min/max fields and of the
+# running-total fields, and their display names.
+STATISTIC_MEAN_FIELDS: dict[str, str] = {
+    **{field: UnitOfPower.WATT for field in ENERGY_FIELDS},
+    "percentage": PERCENTAGE,
+}
+STATISTIC_SUM_FIELDS: dict[str, str] = {
+    f"{field}_energy": UnitOfEnergy.WATT_HOUR for field in ENERGY_FIELDS
+}
+STATISTIC_NAMES: dict[str, str] = {
+    **{field: f"PW {field.replace('_', ' ').title()} Power" for field in ENERGY_FIELDS},
+    **{
+        f"{field}_energy": f"PW {field.replace('_', ' ').title()} Energy"
+        for field in ENERGY_FIELDS
+    },
+    "percentage": "PW Battery %",
+}
+
+ENERGY_STORAGE_VERSION = 1
+# Key of the derived metrics' state in the energy store
+DERIVED_STORE_KEY = "derived"
+# Batch accumulator writes; the store is also flushed on shutdown.
+ENERGY_SAVE_DELAY = 60
+
+# Last good payload, used to start entities before the first live refresh
+CACHE_STORAGE_VERSION = 1
+CACHE_SAVE_DELAY = 60
+
+# Sums and last hour of the imported long-term statistics
+STATISTICS_STORAGE_VERSION = 1
+
+# Fields produced by each upstream read, used to mark them stale on failure.
+READ_FIELDS: dict[str, tuple[str, ...]] = {
+    "aggregates": POWER_FIELDS + GRID_FIELDS,
+    "power": POWER_FIELDS,
+    "grid": GRID_FIELDS,
+    "soe": ("percentage",),
+}
+
+# Net power flows watched by the adaptive scheduler, as (positive, negative)
+# field pairs; a single field has no negative side.
+VOLATILITY_FLOWS: tuple[tuple[str, str | None], ...] = (
+    ("solar", None),
+    ("home", None),
+    ("battery_consumption", "battery_production"),
+    ("grid_consumption", "grid_production"),
+)
+
+# Largest change in any flow between samples (W) above which polling speeds
+# up, and below which it slows down.
+VOLATILITY_HIGH = 500
+VOLATILITY_LOW = 50
+INTERVAL_SPEEDUP = 0.5
+INTERVAL_SLOWDOWN = 1.25
+
+# Account polling: sites read at once, the most wakeups each poll interval is
+# split into, the random share of a wakeup interval it is moved by, and how
+# often the account's site list is refreshed.
+MAX_CONCURRENT_SITES = 4
+SITE_SLOTS = 6
+SITE_JITTER = 0.1
+SITE_DISCOVERY_INTERVAL = timedelta(hours=6)
+
+# SOE forecasting: half-life of the weighted fit over SOE history, the
+# history needed before forecasting, the battery power (W) below which the
+# battery counts as idle, and the longest forecast published.
+FORECAST_HALF_LIFE = timedelta(minutes=15)
+FORECAST_MIN_SPAN = timedelta(minutes=5)
+FORECAST_IDLE_POWER = 50
+FORECAST_HORIZON = timedelta(hours=48)
+FORECAST_FIELDS = ("time_to_full", "time_to_empty", "reserve_time")
+
+# Gateway SOE (%) at which the Tesla app shows 0%; the app scales the rest,
+# and its reserve setting, into the remaining 95%.
+SOE_EMPTY = 5
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
 
+class AdaptiveInterval:
+    """Pick the next polling interval from how fast power flows are changing.
+
+    Large swings (EV charging, grid outage) halve the interval down to
+    min_interval; a quiet system backs off gradually towards max_interval.
+    """
+
+    def __init__(
+        self,
+        min_interval: timedelta = DEFAULT_MIN_INTERVAL,
+        max_interval: timedelta = DEFAULT_MAX_INTERVAL,
+        initial: timedelta = DEFAULT_UPDATE_INTERVAL,
+    ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.interval = self._clamp(initial)
+        self.volatility: float | None = None
+
+    def _clamp(self, interval: timedelta) -> timedelta:
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def update(self, previous: dict, current: dict) -> timedelta:
+        """Return the interval to use after the sample in current."""
+        deltas = [
+            abs(self._net(current, flow) - self._net(previous, flow))
+            for flow in VOLATILITY_FLOWS
+            if self._net(current, flow) is not None
+            and self._net(previous, flow) is not None
+        ]
+        if not deltas:
+            return self.interval
+
+        self.volatility = max(deltas)
+        if self.volatility >= VOLATILITY_HIGH:
+            self.interval = self._clamp(self.interval * INTERVAL_SPEEDUP)
+        elif self.volatility <= VOLATILITY_LOW:
+            self.interval = self._clamp(self.interval * INTERVAL_SLOWDOWN)
+        return self.interval
+
+    @staticmethod
+    def _net(data: dict, flow: tuple[str, str | None]) -> float | None:
+        positive, negative = flow
+        if data.get(positive) is None:
+            return None
+        if negative is None:
+            return data[positive]
+        if data.get(negative) is None:
+            return None
+        return data[positive] - data[negative]
+
+
+class SoeForecaster:
+    """Forecast battery time-to-full, time-to-empty and reserve from SOE.
+
+    SOE is fitted against time by exponentially weighted least squares:
+    each sample updates five running sums, in which older samples fade
+    with FORECAST_HALF_LIFE, so work and memory per sample are constant.
+    A forecast is only made while the battery power agrees with the
+    fitted trend, and the fit starts over after a gap in the samples.
+    """
+
+    def __init__(
+        self,
+        reserve: float = DEFAULT_BACKUP_RESERVE,
+        half_life: timedelta = FORECAST_HALF_LIFE,
+    ) -> None:
+        self.reserve = reserve
+        self._decay = math.log(2) / half_life.total_seconds()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the SOE history."""
+        # Weighted sums of 1, t, soe, t^2 and t * soe, with t in seconds
+        # relative to the last sample
+        self._w = self._t = self._y = self._tt = self._ty = 0.0
+        self._first: float | None = None
+        self._last: float | None = None
+        self._power: float | None = None
+
+    def add_sample(
+        self, timestamp: float, soe: float | None, battery_power: float | None
+    ) -> dict[str, float | None]:
+        """Add a sample and return the forecasts.
+
+        battery_power is positive while discharging. Either may be None when
+        the reading is stale, which leaves the fit as it was.
+        """
+        self._power = battery_power
+        if soe is None or (self._last is not None and timestamp <= self._last):
+            return self.forecast()
+        if self._last is not None:
+            elapsed = timestamp - self._last
+            if elapsed > MAX_INTEGRATION_GAP:
+                self.reset()
+                self._power = battery_power
+            else:
+                # Move t = 0 to this sample, then fade the old samples
+                self._tt += elapsed * (elapsed * self._w - 2 * self._t)
+                self._ty -= elapsed * self._y
+                self._t -= elapsed * self._w
+                fade = math.exp(-self._decay * elapsed)
+                self._w *= fade
+                self._t *= fade
+                self._y *= fade
+                self._tt *= fade
+                self._ty *= fade
+        if self._first is None:
+            self._first = timestamp
+        self._last = timestamp
+        self._w += 1
+        self._y += soe
+        return self.forecast()
+
+    def forecast(self) -> dict[str, float | None]:
+        """Return minutes to full and to empty, and the reserve-hit time."""
+        forecast: dict[str, float | None] = dict.fromkeys(FORECAST_FIELDS)
+        if (
+            self._first is None
+            or self._last - self._first < FORECAST_MIN_SPAN.total_seconds()
+            or self._power is None
+        ):
+            return forecast
+        spread = self._w * self._tt - self._t**2
+        if spread <= 0:
+            return forecast
+        # %/s, and the fitted SOE now
+        slope = (self._w * self._ty - self._t * self._y) / spread
+        level = (self._y - slope * self._t) / self._w
+
+        horizon = FORECAST_HORIZON.total_seconds()
+        if self._power < -FORECAST_IDLE_POWER and slope > 0:
+            if (seconds := max(0, (100 - level) / slope)) <= horizon:
+                forecast["time_to_full"] = round(seconds / 60)
+        elif self._power > FORECAST_IDLE_POWER and slope < 0:
+            if (seconds := max(0, (level - SOE_EMPTY) / -slope)) <= horizon:
+                forecast["time_to_empty"] = round(seconds / 60)
+            reserve = SOE_EMPTY + self.reserve * (100 - SOE_EMPTY) / 100
+            if level > reserve and (seconds := (level - reserve) / -slope) <= horizon:
+                forecast["reserve_time"] = round(self._last + seconds)
+        return forecast
+
+
 class Pw3DataUpdateCoordinator(DataUpdateCoordinator):
-    def __init__(self, hass: HomeAssistant, pw: Powerwall) -> None:
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        pw: "Powerwall | None",
+        aggregate: bool = True,
+        api: Pw3ApiClient | None = None,
+        min_interval: timedelta = DEFAULT_MIN_INTERVAL,
+        max_interval: timedelta = DEFAULT_MAX_INTERVAL,
+        connect: Callable[[], Awaitable["Powerwall"]] | None = None,
+        local: DataSource | None = None,
+        fast_interval: timedelta | None = None,
+        statistics: bool = False,
+        limiter: RateLimiter | None = None,
+        reserve: float = DEFAULT_BACKUP_RESERVE,
+    ) -> None:
         """Initialize."""
-        self.pw = pw
+        # The cloud path: a pypowerwall client (given, or created by connect
+        # on the first refresh) or a native asyncio client, whose reads run
+        # on the event loop instead of in executor threads.
+        self.cloud = DataSource(CLOUD, pw=pw, api=api, connect=connect)
+        # The local gateway, when configured, is preferred over the cloud
+        self.sources = SourceSelector(
+            [local, self.cloud] if local is not None else [self.cloud]
+        )
         self.platforms = []
+        # Blocking pypowerwall calls run on pw3's own bounded executor, and
+        # the breaker stops reads while every source keeps failing.
+        self.executor = async_get_executor(hass)
+        self.breaker = CircuitBreaker()
+        # The account's rate limiter; native clients take it themselves, and
+        # pypowerwall's cloud reads go through it here.
+        self.limiter = limiter
+        # Derive power and grid from one aggregates payload instead of
+        # separate power() and grid() calls.
+        self.aggregate = aggregate
+        self.upstream_calls = 0
+        self.upstream_calls_total = 0
+        # Call counts, errors and latency per upstream read, login and refresh
+        self.metrics = Metrics()
+        # Set by the profile service while refreshes are being profiled
+        self.profiler: RefreshProfiler | None = None
+        self.scheduler = AdaptiveInterval(min_interval, max_interval)
+        # The interval this site wants, from the scheduler or the account's
+        # backoff. It drives update_interval unless an account coordinator
+        # polls the site, which then reads it to decide when the site is due.
+        self.poll_interval = self.scheduler.interval
+        self.polled_by_account = False
+        self.energy = EnergyAccumulator(ENERGY_FIELDS)
+        # Self-consumption and similar ratios, computed once per sample
+        # instead of in template sensors
+        self.derived = DerivedMetrics()
+        # Battery runtime forecasts from the SOE trend
+        self.forecaster = SoeForecaster(reserve)
+        # Battery controls, written through the native API or pypowerwall.
+        # async_setup_entry gives every entry's coordinator one before its
+        # platforms set up.
+        self.controls: "CommandQueue | None" = None
+        # Fast-sample mode reads every fast_interval into a ring buffer and
+        # publishes window statistics at the normal update interval.
+        self.fast_interval = fast_interval
+        self.samples = SampleBuffer(SAMPLE_FIELDS) if fast_interval else None
+        self._last_sample: dict | None = None
+        self._sampling = False
         super().__init__(
             hass,
             _LOGGER,
             name=DOMAIN,
-            update_interval=timedelta(minutes=1),
-            # always_update=False,
+            update_interval=self.scheduler.interval,
         )
+        self._energy_store: Store | None = None
+        self._cache_store: Store | None = None
+        self._statistics_store: Store | None = None
+        # Hourly long-term statistics built from every sample and imported
+        # into the recorder directly.
+        self.statistics = (
+            StatisticsAggregator(
+                STATISTIC_MEAN_FIELDS,
+                STATISTIC_SUM_FIELDS,
+                STATISTIC_NAMES,
+                key=self._statistics_key(),
+            )
+            if statistics
+            else None
+        )
+        if self.config_entry is not None:
+            self._energy_store = Store(
+                hass,
+                ENERGY_STORAGE_VERSION,
+                f"{DOMAIN}.{self.config_entry.entry_id}.energy",
+            )
+            self._cache_store = Store(
+                hass,
+                CACHE_STORAGE_VERSION,
+                f"{DOMAIN}.{self.config_entry.entry_id}.cache",
+            )
+            self._statistics_store = Store(
+                hass,
+                STATISTICS_STORAGE_VERSION,
+                f"{DOMAIN}.{self.config_entry.entry_id}.statistics",
+            )
+
+    def _statistics_key(self) -> str | None:
+        """Return the site the statistic ids are keyed by.
+
+        Entries for one site are keyed by its id, others by the config entry.
+        """
+        if self.config_entry is None:
+            return None
+        if site_id := self.config_entry.data.get(CONF_SITE_ID):
+            return str(site_id)
+        return self.config_entry.entry_id
+
+    async def async_load_energy(self) -> None:
+        """Restore the energy accumulators saved by a previous run."""
+        if self._energy_store is None:
+            return
+        if (stored := await self._energy_store.async_load()) is None:
+            stored = self._restored_sensor_energy()
+        self.energy.restore(stored)
+        self.derived.restore(stored.get(DERIVED_STORE_KEY) or {})
+
+    def _restored_sensor_energy(self) -> dict[str, Any]:
+        """Return the integrator state energy sensors saved themselves.
+
+        Energy sensors used to keep their own integrators in Home
+        Assistant's restore state. On the first start without an energy
+        store, their totals are carried over into it.
+        """
+        registry = er.async_get(self.hass)
+        last_states = async_get_restore_state(self.hass).last_states
+        restored = {}
+        for field in ENERGY_FIELDS:
+            entity_id = registry.async_get_entity_id(
+                SENSOR, DOMAIN, unique_id(self, f"{field}_energy")
+            )
+            if (
+                entity_id is not None
+                and (stored := last_states.get(entity_id)) is not None
+                and stored.extra_data is not None
+            ):
+                restored[field] = stored.extra_data.as_dict()
+        return restored
+
+    async def async_save(self) -> None:
+        """Write the energy totals, statistics checkpoint and cache now.
+
+        Called on unload. Otherwise a reload would load copies up to a
+        save delay old, and the pending delayed writes would land after.
+        """
+        if self._energy_store is not None:
+            await self._energy_store.async_save(self._energy_state())
+        if self._cache_store is not None and self.data:
+            await self._cache_store.async_save(self.data)
+        await self.async_save_statistics()
+
+    def _energy_state(self) -> dict[str, Any]:
+        """Return the energy accumulators and derived metrics to persist."""
+        return {**self.energy.as_dict(), DERIVED_STORE_KEY: self.derived.as_dict()}
+
+    async def async_load_statistics(self) -> None:
+        """Restore the statistics import checkpoint saved by a previous run."""
+        if self.statistics is None or self._statistics_store is None:
+            return
+        if (stored := await self._statistics_store.async_load()) is not None:
+            self.statistics.restore(stored)
+
+    async def async_save_statistics(self) -> None:
+        """Save the statistics import checkpoint now."""
+        if self.statistics is not None and self._statistics_store is not None:
+            await self._statistics_store.async_save(self.statistics.as_dict())
+
+    async def async_load_cache(self) -> bool:
+        """Publish the payload cached by a previous run, marked stale.
+
+        Returns True if a cached payload was loaded. Energy totals come from
+        the restored accumulators, so load the energy store first.
+        """
+        if self._cache_store is None:
+            return False
+        if not (cached := await self._cache_store.async_load()):
+            return False
+        # Every live reading is old until the first refresh replaces it
+        self.data = self._stale_snapshot({**cached, **self.energy.totals()})
+        return True
+
+    @staticmethod
+    def _stale_snapshot(data: dict) -> dict:
+        """Return data with every live reading in it marked stale."""
+        live = dict.fromkeys(key for fields in READ_FIELDS.values() for key in fields)
+        return {**data, "stale": [key for key in live if key in data]}
 
     async def _async_update_data(self):
-        """Update data via library."""
+        """Update data via library, timing the whole refresh."""
+        start = time.perf_counter()
+        ok = False
         try:
-            power = await self.hass.async_add_executor_job(self.pw.power)
-            grid_raw = await self.hass.async_add_executor_job(self.pw.grid)
-            perc = await self.hass.async_add_executor_job(
-                self.pw.poll, "/api/system_status/soe"
-            )
-            battery = self._split_power_val(power["battery"])
-            grid = self._split_power_val(grid_raw)
-
-            data = {
-                "solar": round(power["solar"]),
-                "home": round(power["load"]),
-                "battery_consumption": round(battery["consumption"]),
-                "battery_production": round(battery["production"]),
-                "grid_consumption": round(grid["consumption"]),
-                "grid_production": round(grid["production"]),
-                "percentage": round(perc["percentage"], 2),
-                "last_updated": self.hass.loop.time(),
-            }
+            data = await self._async_refresh_data()
+            ok = True
             return data
-        except Exception as exception:
-            _LOGGER.error(f"Error updating Powerwall data: {str(exception)}")
-            raise UpdateFailed() from exception
+        finally:
+            self._record(REFRESH, start, ok)
+
+    def _record(self, name: str, start: float, ok: bool = True) -> None:
+        """Record a call timed from start in the metrics and any profile."""
+        end = time.perf_counter()
+        self.metrics.record(name, (end - start) * 1000, ok)
+        if self.profiler is not None:
+            self.profiler.add_span(self._track, name, start, end)
+
+    @property
+    def _track(self) -> str:
+        """Return the name this coordinator's spans are grouped under."""
+        return self.config_entry.title if self.config_entry else self.name
+
+    async def _async_refresh(self, *args: Any, **kwargs: Any) -> None:
+        """Refresh, profiling the refresh and its entity fan-out when asked."""
+        profiler = self.profiler
+        if profiler is not None and profiler.done:
+            profiler = self.profiler = None
+        if profiler is None:
+            await super()._async_refresh(*args, **kwargs)
+            return
+        profiler.start()
+        start = time.perf_counter()
+        try:
+            await super()._async_refresh(*args, **kwargs)
+        finally:
+            profiler.add_span(self._track, "run", start, time.perf_counter())
+            if profiler.stop():
+                self.profiler = None
+                self.hass.async_create_task(profiler.async_save(self.hass))
+
+    @callback
+    def async_update_listeners(self) -> None:
+        """Update all registered listeners, timing the fan-out when profiling."""
+        if self.profiler is None:
+            super().async_update_listeners()
+            return
+        start = time.perf_counter()
+        super().async_update_listeners()
+        self.profiler.add_span(self._track, "fan_out", start, time.perf_counter())
+
+    async def _async_refresh_data(self):
+        """Return the latest sample, or the window summary in fast-sample mode."""
+        previous = self.data or {}
+        # In fast-sample mode, publish what the sampler read since the last
+        # refresh; read directly when it has nothing new.
+        since = previous.get("last_updated") or 0
+        data = self._summarize_samples(since)
+        if data is None:
+            if await self._async_sample() is None:
+                if self.breaker.state != CLOSED and self.data:
+                    # Reads are paused or probing; keep the last good
+                    # readings on show, marked stale
+                    return self._stale_snapshot(self.data)
+                _LOGGER.error("Error updating Powerwall data: all reads failed")
+                if self.limiter is not None and (retry_in := self.limiter.retry_in()):
+                    # Don't come back before the account's backoff ends
+                    self._set_poll_interval(
+                        max(self.scheduler.interval, timedelta(seconds=retry_in))
+                    )
+                raise UpdateFailed("All Powerwall reads failed")
+            data = self._summarize_samples(since) or self._last_sample
+
+        if self._cache_store is not None:
+            self._cache_store.async_delay_save(lambda: data, CACHE_SAVE_DELAY)
+
+        self._set_poll_interval(self.scheduler.update(previous, data))
+        return data
+
+    def _set_poll_interval(self, interval: timedelta) -> None:
+        self.poll_interval = interval
+        if not self.polled_by_account:
+            self.update_interval = interval
+
+    async def _async_sample(
+        self, sources: list[DataSource] | None = None
+    ) -> dict | None:
+        """Read one sample from the first healthy source that answers.
+
+        sources limits the sources tried, which by default are every
+        healthy one in order of preference.
+
+        The sample is integrated into the energy totals and, in fast-sample
+        mode, stored in the sample buffer. Returns None if every source
+        failed, or without reading while the circuit breaker is open.
+        """
+        self.upstream_calls = 0
+        if not self.breaker.allow():
+            return None
+        for source in sources or self.sources.candidates():
+            reads, results = await self._async_read_source(source)
+            ok = any(result is not None for result in results)
+            self.sources.report(source, ok)
+            if ok:
+                break
+        else:
+            self.breaker.report(False)
+            return None
+        self.breaker.report(True)
+
+        previous = self._last_sample or self.data or {}
+        data = {}
+        stale = []
+        for name, result in zip(reads, results):
+            if result is None:
+                # Keep publishing the last known value for the fields this
+                # read would have produced, but flag them as stale.
+                for key in READ_FIELDS[name]:
+                    data[key] = previous.get(key)
+                    stale.append(key)
+            else:
+                data.update(result)
+
+        data["stale"] = stale
+        data["source"] = source.name
+        # Wall-clock sample time, so energy integration can resume across
+        # restarts
+        data["last_updated"] = dt_util.utcnow().timestamp()
+
+        data.update(self.energy.add_sample(data["last_updated"], data, stale))
+        data.update(self.derived.add_sample(data["last_updated"], data, stale))
+        data.update(
+            self.forecaster.add_sample(
+                data["last_updated"],
+                None if "percentage" in stale else data.get("percentage"),
+                None
+                if "battery_consumption" in stale
+                else data["battery_consumption"] - data["battery_production"],
+            )
+        )
+        if self._energy_store is not None:
+            self._energy_store.async_delay_save(self._energy_state, ENERGY_SAVE_DELAY)
+        if self.samples is not None:
+            self.samples.append(data["last_updated"], data, stale)
+        if self.statistics is not None:
+            self.statistics.add_sample(data["last_updated"], data, stale)
+            if self.statistics.async_import(self.hass) and self._statistics_store:
+                self._statistics_store.async_delay_save(
+                    self.statistics.as_dict, ENERGY_SAVE_DELAY
+                )
+        self._last_sample = data
+        return data
+
+    def _summarize_samples(self, since: float) -> dict | None:
+        """Return the latest sample with readings averaged since the last refresh.
+
+        Power fields also get *_min and *_max over the same window. Returns
+        None if no sample was taken in the window.
+        """
+        if self.samples is None or self._last_sample is None:
+            return None
+        stats = self.samples.window(since)
+        if not stats:
+            return None
+        data = dict(self._last_sample)
+        for field, values in stats.items():
+            if values is None:
+                continue
+            low, mean, high = values
+            if field == "percentage":
+                data[field] = round(mean, 2)
+                continue
+            data[field] = round(mean)
+            data[f"{field}_min"] = round(low)
+            data[f"{field}_max"] = round(high)
+        return data
+
+    @callback
+    def async_start_sampling(self) -> CALLBACK_TYPE:
+        """Start fast sampling; returns a callback that stops it."""
+
+        async def _async_fast_sample(_now: datetime) -> None:
+            # Skip a tick rather than queue reads behind a slow one. Fast
+            # reads only go to the gateway: while the cloud is serving, the
+            # regular refreshes are all the account's rate limit allows.
+            source = self.sources.active
+            if self._sampling or source is None or source.name != LOCAL:
+                return
+            self._sampling = True
+            try:
+                await self._async_sample([source])
+            finally:
+                self._sampling = False
+
+        return async_track_time_interval(
+            self.hass,
+            _async_fast_sample,
+            self.fast_interval,
+            name=f"{DOMAIN} fast sample",
+        )
+
+    @property
+    def pw(self) -> "Powerwall | None":
+        """Return the cloud pypowerwall client, once connected."""
+        return self.cloud.pw
+
+    @property
+    def api(self) -> Pw3ApiClient | None:
+        """Return the native cloud client, if configured."""
+        return self.cloud.api
+
+    async def _async_read_source(
+        self, source: DataSource
+    ) -> tuple[dict[str, tuple], list[dict | None]]:
+        """Run every read of one refresh against source.
+
+        Returns the reads and their parsed results; all results are None if
+        the source could not be connected.
+        """
+        login = not source.connected
+        start = time.perf_counter()
+        try:
+            await source.async_connect()
+        except Exception as exception:  # pylint: disable=broad-except
+            _LOGGER.warning(
+                "Error connecting to Powerwall %s source: %s", source.name, exception
+            )
+            self._record(LOGIN, start, False)
+            return {}, []
+        if login and source.connected:
+            self._record(LOGIN, start)
+
+        reads = self._build_reads(source)
+        results = await asyncio.gather(
+            *[self._async_read(name, *read) for name, read in reads.items()]
+        )
+        return reads, results
+
+    def _build_reads(
+        self, source: DataSource
+    ) -> dict[str, tuple[Callable[[], Awaitable[Any]], Callable[[Any], dict]]]:
+        """Return the reads for this refresh as (fetch, parse) pairs."""
+        api = source.api
+        if api is not None:
+            if self.aggregate:
+                reads = {
+                    "aggregates": (
+                        api.async_get_aggregates,
+                        self._parse_aggregates,
+                    )
+                }
+            else:
+                reads = {
+                    "power": (api.async_get_power, self._parse_power),
+                    "grid": (api.async_get_grid, self._parse_grid),
+                }
+            reads["soe"] = (api.async_get_soe, self._parse_soe)
+            return reads
+
+        pw = source.pw
+        limiter = self.limiter if source.name == CLOUD else None
+        job = partial(self._async_executor_job, limiter)
+        if self.aggregate:
+            reads = {
+                "aggregates": (
+                    partial(job, pw.poll, AGGREGATES_API),
+                    self._parse_aggregates,
+                ),
+            }
+        else:
+            reads = {
+                "power": (partial(job, pw.power), self._parse_power),
+                "grid": (partial(job, pw.grid), self._parse_grid),
+            }
+        reads["soe"] = (partial(job, pw.poll, SOE_API), self._parse_soe)
+        return reads
+
+    async def async_control_job(self, target: Callable[..., Any], *args: Any) -> Any:
+        """Run a blocking pypowerwall settings call on the control lane."""
+        return await self._async_executor_job(self.limiter, target, *args, lane=CONTROL)
+
+    async def _async_executor_job(
+        self,
+        limiter: RateLimiter | None,
+        target: Callable[..., Any],
+        *args: Any,
+        lane: int = LIVE,
+    ) -> Any:
+        """Run a blocking pypowerwall call in the executor.
+
+        Cloud calls go through the rate limiter's lane first. The limiter
+        wait and the executor call share FETCH_BUDGET of the read's deadline.
+        """
+        budget = FETCH_TIMEOUT * FETCH_BUDGET
+        deadline = time.monotonic() + budget
+        run = partial(
+            self.executor.async_run,
+            profiler=self.profiler,
+            track=f"{self._track} executor",
+        )
+        if limiter is None:
+            return await run(target, *args, timeout=budget)
+        if not await limiter.async_acquire(lane, min(MAX_WAIT[lane], budget / 2)):
+            raise Pw3ApiClientRateLimitError(
+                f"Tesla API calls held back for {round(limiter.retry_in())}s"
+            )
+        try:
+            result = await run(
+                target, *args, timeout=max(0.0, deadline - time.monotonic())
+            )
+        except Exception:
+            limiter.failure()
+            raise
+        limiter.success()
+        return result
+
+    async def _async_read(
+        self,
+        name: str,
+        fetch: Callable[[], Awaitable[Any]],
+        parse: Callable[[Any], dict],
+    ) -> dict | None:
+        """Run one read, bounded by FETCH_TIMEOUT.
+
+        Returns the parsed fields, or None if the read failed or timed out.
+        """
+        self.upstream_calls += 1
+        self.upstream_calls_total += 1
+        start = time.perf_counter()
+        result = None
+        try:
+            raw = await asyncio.wait_for(fetch(), FETCH_TIMEOUT)
+            result = parse(raw)
+        except ExecutorTimeoutError as exception:
+            _LOGGER.warning("Error reading Powerwall %s: %s", name, exception)
+        except asyncio.TimeoutError:
+            _LOGGER.warning(
+                "Timed out after %ss reading Powerwall %s", FETCH_TIMEOUT, name
+            )
+        except Exception as exception:  # pylint: disable=broad-except
+            _LOGGER.warning("Error reading Powerwall %s: %s", name, exception)
+        self._record(name, start, result is not None)
+        return result
+
+    def _parse_aggregates(self, aggregates: dict) -> dict:
+        return {
+            **self._parse_power(
+                {
+                    key: aggregates[key]["instant_power"]
+                    for key in ("solar", "battery", "load")
+                }
+            ),
+            **self._parse_grid(aggregates["site"]["instant_power"]),
+        }
+
+    def _parse_power(self, power: dict) -> dict:
+        battery = self._split_power_val(power["battery"])
+        return {
+            "solar": round(power["solar"]),
+            "home": round(power["load"]),
+            "battery_consumption": round(battery["consumption"]),
+            "battery_production": round(battery["production"]),
+        }
+
+    def _parse_grid(self, grid_raw: float) -> dict:
+        grid = self._split_power_val(grid_raw)
+        return {
+            "grid_consumption": round(grid["consumption"]),
+            "grid_production": round(grid["production"]),
+        }
+
+    def _parse_soe(self, perc: dict) -> dict:
+        return {"percentage": round(perc["percentage"], 2)}
 
     def _split_power_val(self, val: float) -> dict:
         if val < 0:
             return {"consumption": 0, "production": abs(val)}
         else:
             return {"consumption": val, "production": 0}
+
+
+class Pw3AccountCoordinator(DataUpdateCoordinator):
+    """Poll every subscribed energy site on one Tesla account.
+
+    The poll cycle is split into up to SITE_SLOTS jittered wakeups, and
+    each wakeup reads the live_status of one slot's sites, at most
+    max_concurrent at a time. The result is fanned out by refreshing each
+    site's coordinator, which reads the fetched live_status from its
+    client's cache instead of making its own request. All sites share one
+    login and one timer, so per-site cost is one request per interval.
+
+    Each site keeps its own adaptive interval and backoff in poll_interval.
+    The cycle follows the shortest of them, and a site is skipped on its
+    slot's wakeups until its interval has passed.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        api: Pw3ApiClient,
+        interval: timedelta = DEFAULT_UPDATE_INTERVAL,
+        max_concurrent: int = MAX_CONCURRENT_SITES,
+        slots: int = SITE_SLOTS,
+    ) -> None:
+        """Initialize with a client logged in to the account."""
+        self.api = api
+        self.interval = interval
+        self.max_slots = slots
+        # Energy site ids on the account, in discovery order
+        self.sites: list[int] = []
+        self.clients: dict[int, Pw3ApiClient] = {}
+        self.subscribers: dict[int, Pw3DataUpdateCoordinator] = {}
+        self.last_polled: dict[int, datetime] = {}
+        self.upstream_calls_total = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._slot = 0
+        self._discovered: datetime | None = None
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=f"{DOMAIN} account",
+            update_interval=self._slot_interval(),
+        )
+        # Shared by every entry on the account, so not tied to the one
+        # being set up
+        self.config_entry = None
+
+    @property
+    def slots(self) -> int:
+        """Return the number of wakeups each poll interval is split into."""
+        return max(1, min(self.max_slots, len(self.subscribers)))
+
+    @property
+    def cycle(self) -> timedelta:
+        """Return the time to wake every slot once."""
+        return min(
+            (c.poll_interval for c in self.subscribers.values()),
+            default=self.interval,
+        )
+
+    def _slot_interval(self) -> timedelta:
+        return (
+            self.cycle / self.slots * random.uniform(1 - SITE_JITTER, 1 + SITE_JITTER)
+        )
+
+    async def async_discover(self) -> list[int]:
+        """Refresh the account's energy sites and return their ids."""
+        sites = await self.api.async_get_sites()
+        self.upstream_calls_total += 1
+        self.sites = [int(site["energy_site_id"]) for site in sites]
+        self._discovered = dt_util.utcnow()
+        return self.sites
+
+    @property
+    def default_site(self) -> int | None:
+        """Return the site used by entries that do not name one."""
+        return self.api.site_id or next(iter(self.sites), None)
+
+    def client(self, site_id: int) -> Pw3ApiClient:
+        """Return the client for one site, sharing the account's login."""
+        if site_id not in self.clients:
+            self.clients[site_id] = self.api.for_site(site_id)
+        return self.clients[site_id]
+
+    @callback
+    def async_subscribe(
+        self, site_id: int, coordinator: "Pw3DataUpdateCoordinator"
+    ) -> CALLBACK_TYPE:
+        """Drive coordinator's refreshes from the account schedule.
+
+        The site coordinator stops polling on its own, but its poll_interval
+        still sets how often the account polls it. Returns a callback that
+        unsubscribes it and hands its polling back.
+        """
+        self.subscribers[site_id] = coordinator
+        coordinator.polled_by_account = True
+        coordinator.update_interval = None
+        remove_listener = self.async_add_listener(lambda: None)
+
+        @callback
+        def _async_unsubscribe() -> None:
+            if self.subscribers.get(site_id) is coordinator:
+                del self.subscribers[site_id]
+                self.last_polled.pop(site_id, None)
+            coordinator.polled_by_account = False
+            coordinator.update_interval = coordinator.poll_interval
+            remove_listener()
+
+        return _async_unsubscribe
+
+    def _slot_sites(self) -> list[int]:
+        """Return the subscribed sites polled on this wakeup.
+
+        A site in this wakeup's slot is polled once its poll_interval has
+        passed, give or take half a cycle, since its slot comes round only
+        once a cycle.
+        """
+        sites = sorted(self.subscribers)
+        slot = self._slot % self.slots
+        self._slot = (slot + 1) % self.slots
+        now = dt_util.utcnow()
+        slack = self.cycle / 2
+        return [
+            site
+            for site in sites[slot :: self.slots]
+            if (last := self.last_polled.get(site)) is None
+            or now - last >= self.subscribers[site].poll_interval - slack
+        ]
+
+    async def _async_update_data(self) -> dict[int, dict]:
+        """Poll one slot of sites and refresh their coordinators."""
+        if (
+            self._discovered is None
+            or dt_util.utcnow() - self._discovered >= SITE_DISCOVERY_INTERVAL
+        ):
+            try:
+                await self.async_discover()
+            except Pw3ApiClientError as exception:
+                _LOGGER.warning("Error discovering Tesla energy sites: %s", exception)
+
+        sites = self._slot_sites()
+        results = await asyncio.gather(*[self._async_poll_site(s) for s in sites])
+        data = dict(self.data or {})
+        data.update(
+            {site: status for site, status in zip(sites, results) if status is not None}
+        )
+        self.update_interval = self._slot_interval()
+        return data
+
+    async def _async_poll_site(self, site_id: int) -> dict | None:
+        self.last_polled[site_id] = dt_util.utcnow()
+        async with self._semaphore:
+            self.upstream_calls_total += 1
+            try:
+                status = await self.client(site_id).async_get_live_status()
+            except Pw3ApiClientError as exception:
+                _LOGGER.warning(
+                    "Error polling Tesla energy site %s: %s", site_id, exception
+                )
+                status = None
+            # On failure the site refresh retries and marks its readings
+            # stale; the retry counts against the same concurrency bound
+            if (coordinator := self.subscribers.get(site_id)) is not None:
+                await coordinator.async_refresh()
+        return status
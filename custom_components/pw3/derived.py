@@ -0,0 +1,139 @@
+"""Derived metrics for pw3: self-consumption, solar fraction and the like."""
+
+from typing import Any
+
+from homeassistant.util import dt as dt_util
+
+from .energy import EnergyIntegrator
+
+# Ratios published for each sample, as percentages. Each comes as an
+# instantaneous value (from power) and over today and the lifetime of the
+# entry (from energy), except battery efficiency, which only has meaning
+# over a window.
+SELF_CONSUMPTION = "self_consumption"
+SOLAR_FRACTION = "solar_fraction"
+SELF_SUFFICIENCY = "self_sufficiency"
+BATTERY_EFFICIENCY = "battery_efficiency"
+INSTANT_METRICS = (SELF_CONSUMPTION, SOLAR_FRACTION, SELF_SUFFICIENCY)
+WINDOW_METRICS = INSTANT_METRICS + (BATTERY_EFFICIENCY,)
+WINDOWS = ("today", "lifetime")
+DERIVED_FIELDS = INSTANT_METRICS + tuple(
+    f"{metric}_{window}" for window in WINDOWS for metric in WINDOW_METRICS
+)
+
+# Power fields a sample needs for the instantaneous ratios
+FLOW_FIELDS = ("solar", "home", "grid_consumption", "grid_production")
+
+# Solar, load or battery throughput (W or Wh) below which a ratio is not
+# meaningful, e.g. solar fractions at night
+MIN_FLOW = 1
+
+
+def _ratio(part: float, whole: float, clamp: bool = True) -> float | None:
+    """Return part / whole as a percentage, or None if whole is negligible."""
+    if whole < MIN_FLOW:
+        return None
+    ratio = part / whole * 100
+    if clamp:
+        ratio = max(0.0, min(100.0, ratio))
+    return round(ratio, 1)
+
+
+def _ratios(flows: dict[str, float], instant: bool = False) -> dict[str, Any]:
+    """Return the derived ratios for a set of power or energy flows.
+
+    Solar is assumed to serve the home first, then to charge the battery,
+    then to be exported, so solar to the home is what is left of it after
+    export and charging.
+    """
+    solar = flows["solar"]
+    home = flows["home"]
+    ratios = {
+        SELF_CONSUMPTION: _ratio(solar - flows["grid_production"], solar),
+        SOLAR_FRACTION: _ratio(flows["solar_home"], home),
+        SELF_SUFFICIENCY: _ratio(home - flows["grid_consumption"], home),
+    }
+    if not instant:
+        ratios[BATTERY_EFFICIENCY] = _ratio(
+            flows["battery_consumption"], flows["battery_production"], clamp=False
+        )
+    return ratios
+
+
+class DerivedMetrics:
+    """Compute the derived ratios once per sample, in constant time.
+
+    Ratios come from the coordinator's energy totals plus one extra
+    integrator for solar to the home. The totals predate that integrator,
+    so lifetime ratios use them less a snapshot taken the first time each
+    is seen, and today's less a snapshot taken at local midnight.
+    """
+
+    def __init__(self) -> None:
+        self.solar_home = EnergyIntegrator()
+        self.day: str | None = None
+        self.day_start: dict[str, float] = {}
+        self.lifetime_start: dict[str, float] = {}
+
+    def add_sample(
+        self, timestamp: float, data: dict[str, Any], stale: list[str] | None = None
+    ) -> dict[str, float | None]:
+        """Add one sample, with its *_energy totals, and return the ratios."""
+        derived: dict[str, float | None] = dict.fromkeys(INSTANT_METRICS)
+        if all(
+            data.get(field) is not None and field not in (stale or ())
+            for field in FLOW_FIELDS + ("battery_production",)
+        ):
+            power = {field: data[field] for field in FLOW_FIELDS}
+            power["solar_home"] = max(
+                0,
+                data["solar"] - data["grid_production"] - data["battery_production"],
+            )
+            derived.update(_ratios(power, instant=True))
+            self.solar_home.add_sample(timestamp, power["solar_home"])
+
+        totals = {
+            field: data.get(f"{field}_energy") or 0.0
+            for field in FLOW_FIELDS + ("battery_consumption", "battery_production")
+        }
+        totals["solar_home"] = self.solar_home.total
+        for field, total in totals.items():
+            if field == "solar_home" or data.get(f"{field}_energy") is not None:
+                self.lifetime_start.setdefault(field, total)
+
+        day = dt_util.as_local(dt_util.utc_from_timestamp(timestamp)).date()
+        if self.day != day.isoformat():
+            self.day = day.isoformat()
+            self.day_start = totals
+        today = {
+            field: total - self.day_start.get(field, 0.0)
+            for field, total in totals.items()
+        }
+        lifetime = {
+            field: total - self.lifetime_start.get(field, total)
+            for field, total in totals.items()
+        }
+        for window, flows in (("today", today), ("lifetime", lifetime)):
+            derived.update(
+                {
+                    f"{metric}_{window}": value
+                    for metric, value in _ratios(flows).items()
+                }
+            )
+        return derived
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the state for persistence."""
+        return {
+            "solar_home": self.solar_home.as_dict(),
+            "day": self.day,
+            "day_start": self.day_start,
+            "lifetime_start": self.lifetime_start,
+        }
+
+    def restore(self, data: dict[str, Any]) -> None:
+        """Restore state saved by as_dict."""
+        self.solar_home = EnergyIntegrator.from_dict(data.get("solar_home") or {})
+        self.day = data.get("day")
+        self.day_start = dict(data.get("day_start") or {})
+        self.lifetime_start = dict(data.get("lifetime_start") or {})
@@ -0,0 +1,56 @@
+"""Diagnostics support for pw3."""
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from .const import CONF_GATEWAY_PASSWORD
+from .const import CONF_HOST
+from .const import CONF_SITE_ID
+from .const import DOMAIN
+from .coordinator import Pw3DataUpdateCoordinator
+
+TO_REDACT = {"pw_email", CONF_GATEWAY_PASSWORD, CONF_HOST, CONF_SITE_ID}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator: Pw3DataUpdateCoordinator = hass.data[DOMAIN][entry.entry_id]
+    data = coordinator.data or {}
+    last_updated = data.get("last_updated")
+    return {
+        "entry": {
+            "data": async_redact_data(dict(entry.data), TO_REDACT),
+            "options": dict(entry.options),
+        },
+        "coordinator": {
+            "last_update_success": coordinator.last_update_success,
+            # Also set for sites polled by their account coordinator
+            "update_interval": coordinator.poll_interval.total_seconds(),
+            "staleness": (
+                round(dt_util.utcnow().timestamp() - last_updated, 1)
+                if last_updated
+                else None
+            ),
+            "stale": data.get("stale"),
+            "source": data.get("source"),
+            "upstream_calls_total": coordinator.upstream_calls_total,
+        },
+        "sources": {
+            source.name: {
+                "connected": source.connected,
+                "failures": source.failures,
+            }
+            for source in coordinator.sources.sources
+        },
+        "metrics": coordinator.metrics.as_dict(),
+        "breaker": coordinator.breaker.as_dict(),
+        "executor": coordinator.executor.as_dict(),
+        "limiter": coordinator.limiter.as_dict() if coordinator.limiter else None,
+        "data": data,
+    }
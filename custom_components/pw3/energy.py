@@ -0,0 +1,93 @@
+"""Energy integration for pw3."""
+
+from typing import Any
+
+# Samples further apart than this (seconds) are not integrated across, e.g.
+# after Home Assistant was stopped or the Powerwall was unreachable.
+MAX_INTEGRATION_GAP = 15 * 60
+
+
+class EnergyIntegrator:
+    """Integrate power samples (W) into energy (Wh) with the trapezoidal rule.
+
+    Samples are keyed on their own timestamps (epoch seconds), so the result
+    does not depend on how often the value is read.
+    """
+
+    def __init__(
+        self,
+        total: float = 0.0,
+        last_time: float | None = None,
+        last_power: float | None = None,
+    ) -> None:
+        self.total = total
+        self.last_time = last_time
+        self.last_power = last_power
+
+    def add_sample(self, timestamp: float, power: float | None) -> float:
+        """Add a power sample and return the accumulated energy."""
+        if power is None:
+            return self.total
+        if self.last_time is not None and self.last_power is not None:
+            elapsed = timestamp - self.last_time
+            if elapsed <= 0:
+                # Same or out-of-order sample; nothing to integrate
+                return self.total
+            if elapsed <= MAX_INTEGRATION_GAP:
+                self.total += (self.last_power + power) / 2 * elapsed / 3600
+        self.last_time = timestamp
+        self.last_power = power
+        return self.total
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the accumulator state for persistence."""
+        return {
+            "total": self.total,
+            "last_time": self.last_time,
+            "last_power": self.last_power,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "EnergyIntegrator":
+        """Rebuild an integrator from persisted state."""
+        return cls(
+            total=float(data.get("total") or 0.0),
+            last_time=data.get("last_time"),
+            last_power=data.get("last_power"),
+        )
+
+
+class EnergyAccumulator:
+    """Integrate every power field of a coordinator sample in one pass."""
+
+    def __init__(self, keys: tuple[str, ...]) -> None:
+        self.keys = keys
+        self.integrators = {key: EnergyIntegrator() for key in keys}
+
+    def add_sample(
+        self, timestamp: float, data: dict[str, Any], stale: list[str] | None = None
+    ) -> dict[str, float]:
+        """Add one coordinator sample and return the *_energy totals (Wh)."""
+        for key, integrator in self.integrators.items():
+            if not stale or key not in stale:
+                integrator.add_sample(timestamp, data.get(key))
+        return self.totals()
+
+    def totals(self) -> dict[str, float]:
+        """Return the *_energy totals (Wh) without adding a sample."""
+        return {
+            f"{key}_energy": round(integrator.total, 3)
+            for key, integrator in self.integrators.items()
+        }
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the accumulator state for persistence."""
+        return {
+            key: integrator.as_dict() for key, integrator in self.integrators.items()
+        }
+
+    def restore(self, data: dict[str, Any]) -> None:
+        """Restore integrator state saved by as_dict."""
+        for key in self.keys:
+            if key in data:
+                self.integrators[key] = EnergyIntegrator.from_dict(data[key])
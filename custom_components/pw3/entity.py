@@ -1,37 +1,75 @@
-"""Pw3Entity class"""
+"""Shared entity helpers for pw3."""
 
-from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from typing import TYPE_CHECKING
 
-from .const import ATTRIBUTION
+from homeassistant.const import EntityCategory
+from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.entity import Entity
+
+from .const import CONF_SITE_ID
 from .const import DOMAIN
-from .const import NAME
-from .const import VERSION
 
+if TYPE_CHECKING:
+    # The coordinator looks up its entities' unique ids here
+    from .control import CommandQueue
+    from .coordinator import Pw3DataUpdateCoordinator
 
-class Pw3Entity(CoordinatorEntity):
-    def __init__(self, coordinator, config_entry):
-        super().__init__(coordinator)
-        self.config_entry = config_entry
 
-    @property
-    def unique_id(self):
-        """Return a unique ID to use for this entity."""
-        return self.config_entry.entry_id
+def unique_id(coordinator: "Pw3DataUpdateCoordinator", key: str) -> str:
+    """Return an entity unique id, prefixed with the site for site entries."""
+    entry = coordinator.config_entry
+    if entry is not None and (site_id := entry.data.get(CONF_SITE_ID)):
+        return f"pw_{site_id}_{key}"
+    return f"pw_{key}"
+
+
+def device_info(coordinator: "Pw3DataUpdateCoordinator") -> DeviceInfo | None:
+    """Return the device an entry's entities belong to.
+
+    Site entries get a device named after the site, so that entity names
+    and ids from several sites on one account do not collide. Other
+    entries keep the plain "PW" name their entity ids were built from.
+    """
+    entry = coordinator.config_entry
+    if entry is None:
+        return None
+    site_id = entry.data.get(CONF_SITE_ID)
+    return DeviceInfo(
+        identifiers={(DOMAIN, str(site_id) if site_id else entry.entry_id)},
+        manufacturer="Tesla",
+        model="Powerwall",
+        name=f"PW {site_id}" if site_id else "PW",
+    )
+
+
+class PowerwallControlEntity(Entity):
+    """Base for entities that show and change one battery setting."""
+
+    _attr_entity_category = EntityCategory.CONFIG
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+
+    def __init__(self, controls: "CommandQueue", key: str, name: str) -> None:
+        """Initialize the entity."""
+        self.controls = controls
+        self._key = key
+        self._attr_name = name
+        self._attr_unique_id = unique_id(controls.coordinator, key)
+        self._attr_device_info = device_info(controls.coordinator)
 
     @property
-    def device_info(self):
-        return {
-            "identifiers": {(DOMAIN, self.unique_id)},
-            "name": NAME,
-            "model": VERSION,
-            "manufacturer": NAME,
-        }
+    def available(self) -> bool:
+        """Return True once the setting has been read."""
+        return self.controls.settings.get(self._key) is not None
 
     @property
-    def device_state_attributes(self):
-        """Return the state attributes."""
-        return {
-            "attribution": ATTRIBUTION,
-            "id": str(self.coordinator.data.get("id")),
-            "integration": DOMAIN,
-        }
+    def setting(self):
+        """Return the setting, including changes not yet sent."""
+        return self.controls.settings.get(self._key)
+
+    async def async_added_to_hass(self) -> None:
+        """Follow changes to the settings."""
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            self.controls.async_add_listener(self.async_write_ha_state)
+        )
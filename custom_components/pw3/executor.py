@@ -0,0 +1,154 @@
+"""Dedicated, bounded executor for pw3's blocking pypowerwall calls."""
+
+import asyncio
+import logging
+import time
+from typing import Any
+from typing import Callable
+
+from homeassistant.const import EVENT_HOMEASSISTANT_FINAL_WRITE
+from homeassistant.core import Event
+from homeassistant.core import HomeAssistant
+from homeassistant.core import callback
+from homeassistant.util.executor import InterruptibleThreadPoolExecutor
+
+from .const import DOMAIN
+from .profiler import RefreshProfiler
+
+# hass.data[DOMAIN] key holding the executor
+EXECUTOR = "executor"
+
+# Threads running pypowerwall calls, and the calls allowed in flight
+# (running or queued) before new ones are refused.
+EXECUTOR_WORKERS = 4
+EXECUTOR_MAX_PENDING = 16
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+class ExecutorBusyError(Exception):
+    """Exception to indicate the executor has too many calls in flight."""
+
+
+class ExecutorTimeoutError(asyncio.TimeoutError):
+    """Exception to indicate a call missed its deadline in the executor."""
+
+
+class BoundedExecutor:
+    """Run blocking calls on pw3's own threads, not Home Assistant's.
+
+    A call that misses its deadline is abandoned, but keeps its thread and
+    its in-flight slot until it returns. Once max_pending calls are in
+    flight new calls fail straight away, so a hung cloud ties up at most
+    `workers` threads and never queues without bound.
+    """
+
+    def __init__(
+        self, workers: int = EXECUTOR_WORKERS, max_pending: int = EXECUTOR_MAX_PENDING
+    ) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._executor = InterruptibleThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix=DOMAIN
+        )
+
+    async def async_run(
+        self,
+        target: Callable[..., Any],
+        *args: Any,
+        timeout: float | None = None,
+        profiler: RefreshProfiler | None = None,
+        track: str = DOMAIN,
+    ) -> Any:
+        """Run target(*args) in the executor, waiting at most timeout seconds.
+
+        While profiler is set, the call is profiled in its worker thread and
+        its time queued and running is added to track as spans.
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ExecutorBusyError(f"{self.pending} Powerwall calls already in flight")
+        loop = asyncio.get_running_loop()
+        if profiler is None:
+            future = loop.run_in_executor(self._executor, target, *args)
+        else:
+            future = self._submit_profiled(loop, profiler, track, target, *args)
+        self.pending += 1
+        future.add_done_callback(self._done)
+        try:
+            # Shielded so a missed deadline leaves the future to release its
+            # slot when the thread finishes
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError as exception:
+            self.timeouts += 1
+            raise ExecutorTimeoutError(
+                f"Powerwall call still running after {timeout:.3g}s "
+                f"({self.pending} in flight)"
+            ) from exception
+
+    def _submit_profiled(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        profiler: RefreshProfiler,
+        track: str,
+        target: Callable[..., Any],
+        *args: Any,
+    ) -> asyncio.Future:
+        submitted = time.perf_counter()
+        # Start and end of the call, as the worker thread saw them
+        times: list[float] = []
+
+        def _job() -> Any:
+            times.append(time.perf_counter())
+            try:
+                return profiler.run_in_thread(target, *args)
+            finally:
+                times.append(time.perf_counter())
+
+        @callback
+        def _add_spans(_future: asyncio.Future) -> None:
+            if times:
+                profiler.add_span(track, "queue", submitted, times[0])
+            if len(times) == 2:
+                profiler.add_span(track, "run", times[0], times[1])
+
+        future = loop.run_in_executor(self._executor, _job)
+        future.add_done_callback(_add_spans)
+        return future
+
+    @callback
+    def _done(self, _future: asyncio.Future) -> None:
+        self.pending -= 1
+
+    def shutdown(self) -> None:
+        """Stop the threads, interrupting calls that do not finish in time.
+
+        This blocks and must run in Home Assistant's executor.
+        """
+        self._executor.shutdown()
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the executor state for diagnostics."""
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+@callback
+def async_get_executor(hass: HomeAssistant) -> BoundedExecutor:
+    """Return the pw3 executor, creating it on first use."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if EXECUTOR not in data:
+        executor = data[EXECUTOR] = BoundedExecutor()
+
+        async def _async_shutdown(_event: Event) -> None:
+            await hass.async_add_executor_job(executor.shutdown)
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_FINAL_WRITE, _async_shutdown)
+    return data[EXECUTOR]
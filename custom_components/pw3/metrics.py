@@ -0,0 +1,117 @@
+"""Call counters and latency histograms for pw3's upstream reads."""
+
+import bisect
+from typing import Any
+
+# Upper bounds (ms) of the latency buckets; slower calls go in an overflow
+# bucket. Fixed bounds keep recording to a bisect and an increment.
+LATENCY_BUCKETS: tuple[float, ...] = (
+    10,
+    25,
+    50,
+    100,
+    250,
+    500,
+    1000,
+    2500,
+    5000,
+    10000,
+    20000,
+)
+
+# Percentiles reported for each histogram
+PERCENTILES = (50, 95, 99)
+
+# Name of the histogram timing whole refreshes
+REFRESH = "refresh"
+# Name of the histogram timing pypowerwall logins
+LOGIN = "login"
+
+
+class LatencyHistogram:
+    """Count calls, errors and latency in fixed buckets.
+
+    Percentiles are estimated as the upper bound of the bucket holding
+    them, so they are exact to a bucket, which is all capacity planning
+    needs; calls in the overflow bucket report the slowest call seen.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float, ok: bool = True) -> None:
+        """Record one call that took ms milliseconds."""
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        if not ok:
+            self.errors += 1
+
+    def percentile(self, percent: float) -> float | None:
+        """Return the estimated latency (ms) below which percent of calls fall."""
+        if not self.count:
+            return None
+        rank = self.count * percent / 100
+        seen = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank and count:
+                return bucket
+        # Only the overflow bucket is left
+        return self.max_ms
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the histogram for diagnostics."""
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(self.total_ms / self.count, 1) if self.count else None,
+            "max_ms": round(self.max_ms, 1),
+            **{f"p{percent}_ms": self.percentile(percent) for percent in PERCENTILES},
+            "buckets": {
+                **{
+                    f"le_{bound:g}": count
+                    for bound, count in zip(self.buckets, self.counts)
+                },
+                "overflow": self.counts[-1],
+            },
+        }
+
+
+class Metrics:
+    """Latency histograms by upstream call name, created on first use."""
+
+    def __init__(self) -> None:
+        self.histograms: dict[str, LatencyHistogram] = {}
+
+    def record(self, name: str, ms: float, ok: bool = True) -> None:
+        """Record one call to name."""
+        if (histogram := self.histograms.get(name)) is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.record(ms, ok)
+
+    def get(self, name: str) -> LatencyHistogram | None:
+        """Return the histogram for name, if it has any calls."""
+        return self.histograms.get(name)
+
+    @property
+    def errors(self) -> int:
+        """Return the failed upstream calls, not counting whole refreshes."""
+        return sum(
+            histogram.errors
+            for name, histogram in self.histograms.items()
+            if name != REFRESH
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return every histogram for diagnostics."""
+        return {
+            name: histogram.as_dict()
+            for name, histogram in sorted(self.histograms.items())
+        }
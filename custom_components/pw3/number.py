@@ -0,0 +1,48 @@
+"""Number platform for pw3."""
+
+from homeassistant.components.number import NumberEntity
+from homeassistant.components.number import NumberMode
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import PERCENTAGE
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .const import DOMAIN
+from .control import BACKUP_RESERVE
+from .control import CommandQueue
+from .coordinator import Pw3DataUpdateCoordinator
+from .entity import PowerwallControlEntity
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up the Powerwall number platform."""
+    coordinator: Pw3DataUpdateCoordinator = hass.data[DOMAIN][config_entry.entry_id]
+    async_add_entities([PowerwallReserveNumber(coordinator.controls)])
+
+
+class PowerwallReserveNumber(PowerwallControlEntity, NumberEntity):
+    """The backup reserve, in percent as the Tesla app shows it."""
+
+    _attr_icon = "mdi:battery-lock"
+    _attr_mode = NumberMode.SLIDER
+    _attr_native_min_value = 0
+    _attr_native_max_value = 100
+    _attr_native_step = 1
+    _attr_native_unit_of_measurement = PERCENTAGE
+
+    def __init__(self, controls: CommandQueue) -> None:
+        """Initialize the number."""
+        super().__init__(controls, BACKUP_RESERVE, "Backup Reserve")
+
+    @property
+    def native_value(self) -> float | None:
+        """Return the backup reserve."""
+        return self.setting
+
+    async def async_set_native_value(self, value: float) -> None:
+        """Change the backup reserve."""
+        await self.controls.async_set(BACKUP_RESERVE, round(value))
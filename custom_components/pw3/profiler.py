@@ -0,0 +1,165 @@
+"""On-demand profiling of pw3 coordinator refreshes."""
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from typing import Any
+from typing import Callable
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN
+
+# Directory under the config dir that profiles are written to
+PROFILE_DIR = f"{DOMAIN}_profiles"
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+class RefreshProfiler:
+    """Profile the next `runs` coordinator refreshes.
+
+    One profiler is shared by every coordinator being profiled, since only
+    one cProfile profiler can be active at a time; it is enabled while any
+    of them is refreshing. cProfile only sees the thread it was enabled in,
+    so blocking calls sent to the executor are profiled in their worker
+    thread by run_in_thread and merged in when saving. Coordinators add
+    timing spans (reads, logins, the refresh, entity fan-out) from the
+    timestamps they already take for their metrics, and the executor adds
+    the time each call queued and ran. Once `runs` refreshes have finished,
+    the profile is written as a pstats dump and the spans as a Chrome
+    trace, which Perfetto and speedscope show as a flame chart.
+    """
+
+    def __init__(self, runs: int) -> None:
+        self.runs = runs
+        self.completed = 0
+        self.spans: list[tuple[str, str, float, float]] = []
+        self._profile = cProfile.Profile()
+        # Profiles of executor calls, appended from the worker threads
+        self._thread_profiles: list[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._active = 0
+        self._origin = time.perf_counter()
+
+    @property
+    def done(self) -> bool:
+        """Return True once the requested refreshes have been profiled."""
+        return self.completed >= self.runs
+
+    def start(self) -> None:
+        """Mark the start of a refresh."""
+        if self._active == 0:
+            self._profile.enable()
+        self._active += 1
+
+    def stop(self) -> bool:
+        """Mark the end of a refresh; returns True when it was the last one."""
+        self._active -= 1
+        if self._active == 0:
+            self._profile.disable()
+        self.completed += 1
+        return self.done and self._active == 0
+
+    def run_in_thread(self, target: Callable[..., Any], *args: Any) -> Any:
+        """Call target(*args) under a profiler of the calling thread.
+
+        Runs in an executor thread. The call is run unprofiled if another
+        profiler is already active there.
+        """
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return target(*args)
+        try:
+            return target(*args)
+        finally:
+            profile.disable()
+            with self._lock:
+                self._thread_profiles.append(profile)
+
+    def stats(self) -> pstats.Stats | None:
+        """Return the refresh and executor profiles merged, if any has calls."""
+        with self._lock:
+            profiles = [self._profile, *self._thread_profiles]
+        stats = None
+        for profile in profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError:
+                # pstats refuses a profile that recorded no calls
+                continue
+        return stats
+
+    def add_span(self, track: str, name: str, start: float, end: float) -> None:
+        """Record a span of track between two time.perf_counter() readings."""
+        self.spans.append((track, name, start, end))
+
+    def trace(self) -> dict[str, Any]:
+        """Return the spans in Chrome trace event format."""
+        tracks = {
+            track: index
+            for index, track in enumerate(
+                dict.fromkeys(track for track, _, _, _ in self.spans)
+            )
+        }
+        events: list[dict[str, Any]] = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 1,
+                "tid": index,
+                "args": {"name": track},
+            }
+            for track, index in tracks.items()
+        ]
+        events.extend(
+            {
+                "name": name,
+                "ph": "X",
+                "pid": 1,
+                "tid": tracks[track],
+                "ts": round((start - self._origin) * 1e6),
+                "dur": round((end - start) * 1e6),
+            }
+            for track, name, start, end in self.spans
+        )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, directory: str) -> str:
+        """Write the pstats dump and trace; returns the path prefix used.
+
+        This does blocking I/O and must run in the executor.
+        """
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(
+            directory, f"profile_{dt_util.utcnow().strftime('%Y%m%dT%H%M%S')}"
+        )
+        if (stats := self.stats()) is not None:
+            stats.dump_stats(f"{prefix}.pstats")
+        else:
+            self._profile.dump_stats(f"{prefix}.pstats")
+        with open(f"{prefix}.trace.json", "w", encoding="utf-8") as file:
+            json.dump(self.trace(), file)
+        return prefix
+
+    async def async_save(self, hass: HomeAssistant) -> None:
+        """Write the results under the config directory."""
+        prefix = await hass.async_add_executor_job(
+            self.save, hass.config.path(PROFILE_DIR)
+        )
+        _LOGGER.info(
+            "Profiled %s Powerwall refreshes: %s.pstats and %s.trace.json",
+            self.completed,
+            prefix,
+            prefix,
+        )
@@ -0,0 +1,192 @@
+"""Account-wide rate limiting for outbound Tesla calls."""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import Any
+
+from homeassistant.core import HomeAssistant
+from homeassistant.core import callback
+
+from .const import DOMAIN
+
+# hass.data[DOMAIN] key holding the limiters, one per account email
+LIMITERS = "limiters"
+
+# Priority lanes, most urgent first: commands, live data, history backfill
+CONTROL = 0
+LIVE = 1
+HISTORY = 2
+LANES = {CONTROL: "control", LIVE: "live", HISTORY: "history"}
+
+# Longest a call in each lane waits for a token before failing; history
+# backfill waits as long as it takes.
+MAX_WAIT: dict[int, float | None] = {CONTROL: 30, LIVE: 10, HISTORY: None}
+
+# Sustained requests per second per account, and the burst allowed on top
+DEFAULT_RATE = 0.5
+DEFAULT_BURST = 10
+
+# Backoff after consecutive failures: BACKOFF_BASE doubled per failure, up
+# to BACKOFF_MAX, with the actual delay drawn from its upper half.
+BACKOFF_BASE = 2
+BACKOFF_MAX = 15 * 60
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+class RateLimiter:
+    """Token bucket shared by every Tesla call made for one account.
+
+    Calls wait for a token; waiting calls are served in lane order, so a
+    command goes ahead of queued live reads and those ahead of history.
+    Throttling (429 with Retry-After) and failures block the whole account:
+    for Retry-After when the server sends it, otherwise for an exponential
+    backoff with jitter that resets on the next success.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.blocked_until = 0.0
+        # End of the server's Retry-After, which a success does not cut short
+        self._retry_after_until = 0.0
+        self.failures = 0
+        self.throttle_events = 0
+        self.rejected = 0
+        self._updated = time.monotonic()
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def queue_depth(self) -> int:
+        """Return the number of calls waiting for a token."""
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def retry_in(self) -> float:
+        """Return the seconds left until throttling or backoff ends."""
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    def _delay(self, now: float) -> float:
+        """Return the seconds until a call could be sent."""
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        refill = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        return max(self.blocked_until - now, refill)
+
+    async def async_acquire(
+        self, lane: int = LIVE, max_wait: float | None = None
+    ) -> bool:
+        """Wait for a token in lane.
+
+        Returns False, without taking a token, if the call would wait more
+        than max_wait seconds.
+        """
+        now = time.monotonic()
+        if not self._waiters and self._delay(now) <= 0:
+            self.tokens -= 1
+            return True
+        if max_wait is not None and self.blocked_until - now > max_wait:
+            self.rejected += 1
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (lane, next(self._order), future))
+        self._schedule()
+        try:
+            await asyncio.wait_for(future, max_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        return True
+
+    @callback
+    def _schedule(self) -> None:
+        if self._timer is None and self._waiters:
+            delay = self._delay(time.monotonic())
+            self._timer = asyncio.get_running_loop().call_later(
+                max(0.0, delay), self._dispatch
+            )
+
+    @callback
+    def _dispatch(self) -> None:
+        """Hand out the tokens available to the waiters, most urgent first."""
+        self._timer = None
+        now = time.monotonic()
+        while self._waiters:
+            if self._waiters[0][2].done():
+                # Timed out or cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            if self._delay(now) > 0:
+                break
+            self.tokens -= 1
+            heapq.heappop(self._waiters)[2].set_result(None)
+        self._schedule()
+
+    def _block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def success(self) -> None:
+        """Record a successful call, ending any failure backoff.
+
+        A Retry-After the server sent still holds.
+        """
+        self.failures = 0
+        if self.blocked_until > self._retry_after_until:
+            self.blocked_until = self._retry_after_until
+            # Waiters were scheduled for the end of the backoff
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._schedule()
+
+    def failure(self) -> float:
+        """Record a failed call and back off; returns the backoff in seconds."""
+        self.failures += 1
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.failures - 1))
+        delay *= random.uniform(0.5, 1)
+        self._block(delay)
+        return delay
+
+    def throttle(self, retry_after: float | None = None) -> float:
+        """Record a throttled call; returns the seconds calls are held back."""
+        self.throttle_events += 1
+        if retry_after is None:
+            return self.failure()
+        self.failures += 1
+        self._block(retry_after)
+        self._retry_after_until = max(
+            self._retry_after_until, time.monotonic() + retry_after
+        )
+        _LOGGER.warning("Tesla API throttled calls for %ss", round(retry_after))
+        return retry_after
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the limiter state for diagnostics."""
+        depth = dict.fromkeys(LANES.values(), 0)
+        for lane, _, future in self._waiters:
+            if not future.done():
+                depth[LANES[lane]] += 1
+        return {
+            "tokens": round(self.tokens, 2),
+            "queue_depth": depth,
+            "throttle_events": self.throttle_events,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "retry_in": round(self.retry_in(), 1),
+        }
+
+
+@callback
+def async_get_rate_limiter(hass: HomeAssistant, email: str) -> RateLimiter:
+    """Return the rate limiter for an account, creating it on first use."""
+    limiters = hass.data.setdefault(DOMAIN, {}).setdefault(LIMITERS, {})
+    if email not in limiters:
+        limiters[email] = RateLimiter()
+    return limiters[email]
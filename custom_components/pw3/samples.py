@@ -0,0 +1,91 @@
+"""Fixed-size sample buffer for pw3 fast sampling."""
+
+import math
+from array import array
+from typing import Any
+from typing import Iterator
+
+# 24 hours of samples at the 2 s fast-sample interval
+SAMPLE_BUFFER_SIZE = 24 * 60 * 60 // 2
+
+
+class SampleBuffer:
+    """Ring buffer of timestamped samples held in preallocated arrays.
+
+    Each column (the timestamp, then one per field) is an array of doubles
+    allocated up front, so memory use is fixed at
+    capacity * (len(fields) + 1) * 8 bytes however long it runs. Missing and
+    stale values are stored as NaN and left out of the statistics.
+    """
+
+    def __init__(self, fields: tuple[str, ...], capacity: int = SAMPLE_BUFFER_SIZE):
+        self.fields = fields
+        self.capacity = capacity
+        self._times = array("d", bytes(8 * capacity))
+        self._columns = {field: array("d", bytes(8 * capacity)) for field in fields}
+        self._next = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Return the memory held by the sample arrays."""
+        return sum(
+            column.itemsize * len(column)
+            for column in (self._times, *self._columns.values())
+        )
+
+    def append(
+        self, timestamp: float, data: dict[str, Any], skip: list[str] | None = None
+    ) -> None:
+        """Store one sample, overwriting the oldest once full."""
+        index = self._next
+        self._times[index] = timestamp
+        for field, column in self._columns.items():
+            value = data.get(field)
+            column[index] = (
+                math.nan if value is None or (skip and field in skip) else value
+            )
+        self._next = (index + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def _indices_since(self, since: float) -> Iterator[int]:
+        """Yield buffer indices newest first, for samples taken after since."""
+        for offset in range(1, self._size + 1):
+            index = (self._next - offset) % self.capacity
+            if self._times[index] <= since:
+                return
+            yield index
+
+    def window(self, since: float) -> dict[str, tuple[float, float, float] | None]:
+        """Return (min, mean, max) per field over samples taken after since.
+
+        Fields with no valid value in the window map to None; an empty
+        window returns an empty dict.
+        """
+        indices = list(self._indices_since(since))
+        if not indices:
+            return {}
+        stats = {}
+        for field, column in self._columns.items():
+            values = [column[i] for i in indices if not math.isnan(column[i])]
+            stats[field] = (
+                (min(values), sum(values) / len(values), max(values))
+                if values
+                else None
+            )
+        return stats
+
+    def samples(self, since: float) -> Iterator[tuple[float, dict[str, float]]]:
+        """Yield (timestamp, values) for samples taken after since, oldest first."""
+        for index in reversed(list(self._indices_since(since))):
+            yield (
+                self._times[index],
+                {
+                    field: column[index]
+                    for field, column in self._columns.items()
+                    if not math.isnan(column[index])
+                },
+            )
@@ -0,0 +1,43 @@
+"""Select platform for pw3."""
+
+from homeassistant.components.select import SelectEntity
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .const import DOMAIN
+from .control import OPERATION_MODE
+from .control import OPERATION_MODES
+from .control import CommandQueue
+from .coordinator import Pw3DataUpdateCoordinator
+from .entity import PowerwallControlEntity
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up the Powerwall select platform."""
+    coordinator: Pw3DataUpdateCoordinator = hass.data[DOMAIN][config_entry.entry_id]
+    async_add_entities([PowerwallOperationModeSelect(coordinator.controls)])
+
+
+class PowerwallOperationModeSelect(PowerwallControlEntity, SelectEntity):
+    """The operation mode: self-powered, time-based control or backup-only."""
+
+    _attr_icon = "mdi:home-battery"
+    _attr_options = OPERATION_MODES
+
+    def __init__(self, controls: CommandQueue) -> None:
+        """Initialize the select."""
+        super().__init__(controls, OPERATION_MODE, "Operation Mode")
+
+    @property
+    def current_option(self) -> str | None:
+        """Return the operation mode."""
+        return self.setting
+
+    async def async_select_option(self, option: str) -> None:
+        """Change the operation mode."""
+        await self.controls.async_set(OPERATION_MODE, option)
@@ -1,30 +1,40 @@
 """Sensor platform for pw3."""
 
 import logging
+from dataclasses import dataclass
+from dataclasses import replace
 from datetime import datetime
 from datetime import timedelta
+from typing import Any
+from typing import Callable
 
 from homeassistant.components.sensor import SensorDeviceClass
 from homeassistant.components.sensor import SensorEntity
+from homeassistant.components.sensor import SensorEntityDescription
 from homeassistant.components.sensor import SensorStateClass
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import (
-    PERCENTAGE,
-    UnitOfPower,
-    UnitOfEnergy,
-)
+from homeassistant.const import PERCENTAGE
+from homeassistant.const import EntityCategory
+from homeassistant.const import UnitOfEnergy
+from homeassistant.const import UnitOfPower
+from homeassistant.const import UnitOfTime
 from homeassistant.core import HomeAssistant
+from homeassistant.core import callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
-import logging
+from homeassistant.util import dt as dt_util
+
+from .const import CONF_DEADBANDS
+from .const import CONF_MAX_STATE_AGE
+from .const import DEFAULT_MAX_STATE_AGE
 from .const import DOMAIN
 from .coordinator import Pw3DataUpdateCoordinator
-from homeassistant.components.sensor import (
-    SensorDeviceClass,
-    SensorEntityDescription,
-    SensorStateClass,
-)
-
+from .derived import DERIVED_FIELDS
+from .entity import device_info
+from .entity import unique_id
+from .metrics import REFRESH
+from .source import CLOUD
+from .source import LOCAL
 
 ENTITY_DESCRIPTION_KEY_MAP: dict[str, SensorEntityDescription] = {
     "solar": SensorEntityDescription(
@@ -105,6 +115,140 @@ ENTITY_DESCRIPTION_KEY_MAP: dict[str, SensorEntityDescription] = {
         device_class=SensorDeviceClass.BATTERY,
         state_class=SensorStateClass.MEASUREMENT,
     ),
+    "time_to_full": SensorEntityDescription(
+        key="Battery Time To Full",
+        native_unit_of_measurement=UnitOfTime.MINUTES,
+        device_class=SensorDeviceClass.DURATION,
+    ),
+    "time_to_empty": SensorEntityDescription(
+        key="Battery Time To Empty",
+        native_unit_of_measurement=UnitOfTime.MINUTES,
+        device_class=SensorDeviceClass.DURATION,
+    ),
+    # Published as epoch seconds, which the cache can store as JSON
+    "reserve_time": SensorEntityDescription(
+        key="Battery Reserve Time",
+        device_class=SensorDeviceClass.TIMESTAMP,
+    ),
+}
+
+# Window extremes published in fast-sample mode, e.g. solar_min and solar_max
+ENTITY_DESCRIPTION_KEY_MAP.update(
+    {
+        f"{sensor_key}_{stat}": replace(
+            description, key=f"{description.key} {stat.title()}"
+        )
+        for sensor_key, description in list(ENTITY_DESCRIPTION_KEY_MAP.items())
+        if description.device_class == SensorDeviceClass.POWER
+        for stat in ("min", "max")
+    }
+)
+
+# Derived ratios, instantaneous and over today and the entry's lifetime,
+# e.g. self_consumption and self_consumption_today
+ENTITY_DESCRIPTION_KEY_MAP.update(
+    {
+        field: SensorEntityDescription(
+            key=field.replace("_", " ").title(),
+            native_unit_of_measurement=PERCENTAGE,
+            state_class=SensorStateClass.MEASUREMENT,
+            suggested_display_precision=1,
+        )
+        for field in DERIVED_FIELDS
+    }
+)
+
+# Default smallest change worth a state write, by device class. Override per
+# sensor key with the deadbands entry option.
+DEVICE_CLASS_DEADBANDS: dict[SensorDeviceClass, float] = {
+    SensorDeviceClass.POWER: 5,
+    SensorDeviceClass.ENERGY: 1,
+    SensorDeviceClass.BATTERY: 0.1,
+    # Forecasts: minutes, and seconds of the raw epoch timestamp
+    SensorDeviceClass.DURATION: 5,
+    SensorDeviceClass.TIMESTAMP: 300,
+}
+# Derived ratios (%) have no device class, so they get a default of their own
+DERIVED_DEADBAND = 0.5
+
+
+@dataclass(frozen=True, kw_only=True)
+class PowerwallDiagnosticSensorEntityDescription(SensorEntityDescription):
+    """Describes a sensor reporting coordinator state rather than Powerwall data."""
+
+    value_fn: Callable[[Pw3DataUpdateCoordinator], Any]
+
+
+DIAGNOSTIC_DESCRIPTION_KEY_MAP: dict[
+    str, PowerwallDiagnosticSensorEntityDescription
+] = {
+    "update_interval": PowerwallDiagnosticSensorEntityDescription(
+        key="Update Interval",
+        native_unit_of_measurement=UnitOfTime.SECONDS,
+        device_class=SensorDeviceClass.DURATION,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        value_fn=lambda coordinator: coordinator.poll_interval.total_seconds(),
+    ),
+    # Refresh time lives on this one entity rather than as an attribute of
+    # every sensor, where it made each refresh a new recorder row per entity.
+    "last_refresh": PowerwallDiagnosticSensorEntityDescription(
+        key="Last Refresh",
+        device_class=SensorDeviceClass.TIMESTAMP,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        value_fn=lambda coordinator: (
+            dt_util.utc_from_timestamp(coordinator.data["last_updated"])
+            if coordinator.data and coordinator.data.get("last_updated")
+            else None
+        ),
+    ),
+    "source": PowerwallDiagnosticSensorEntityDescription(
+        key="Data Source",
+        device_class=SensorDeviceClass.ENUM,
+        options=[LOCAL, CLOUD],
+        entity_category=EntityCategory.DIAGNOSTIC,
+        value_fn=lambda coordinator: (
+            coordinator.data.get("source") if coordinator.data else None
+        ),
+    ),
+    # Shared by every entry on the account, sampled at each refresh
+    "rate_limit_queue": PowerwallDiagnosticSensorEntityDescription(
+        key="Rate Limit Queue",
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        value_fn=lambda coordinator: (
+            coordinator.limiter.queue_depth if coordinator.limiter else None
+        ),
+    ),
+    "throttle_events": PowerwallDiagnosticSensorEntityDescription(
+        key="Throttle Events",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        value_fn=lambda coordinator: (
+            coordinator.limiter.throttle_events if coordinator.limiter else None
+        ),
+    ),
+    # Upstream health for capacity planning; the full histograms are in the
+    # entry's diagnostics download.
+    "refresh_latency": PowerwallDiagnosticSensorEntityDescription(
+        key="Refresh Latency P95",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        entity_registry_enabled_default=False,
+        value_fn=lambda coordinator: (
+            histogram.percentile(95)
+            if (histogram := coordinator.metrics.get(REFRESH))
+            else None
+        ),
+    ),
+    "upstream_errors": PowerwallDiagnosticSensorEntityDescription(
+        key="Upstream Errors",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        entity_registry_enabled_default=False,
+        value_fn=lambda coordinator: coordinator.metrics.errors,
+    ),
 }
 
 _LOGGER = logging.getLogger(__name__)
@@ -117,120 +261,159 @@ async def async_setup_entry(
 ) -> None:
     """Set up the Powerwall sensor platform."""
     coordinator: Pw3DataUpdateCoordinator = hass.data[DOMAIN][config_entry.entry_id]
+    deadbands = config_entry.options.get(CONF_DEADBANDS, {})
+    max_state_age = timedelta(
+        seconds=config_entry.options.get(
+            CONF_MAX_STATE_AGE, DEFAULT_MAX_STATE_AGE.total_seconds()
+        )
+    )
 
     def _create_entity(
         sensor_key: str,
     ) -> PowerwallSensor:
         """Create the appropriate sensor entity based on the sensor key."""
-        description = ENTITY_DESCRIPTION_KEY_MAP.get(sensor_key)
-        if description is None:
-            raise ValueError(f"Unknown sensor key: {sensor_key}")
-
+        description = ENTITY_DESCRIPTION_KEY_MAP[sensor_key]
         return PowerwallSensor(
             coordinator=coordinator,
             sensor_key=sensor_key,
             description=description,
+            deadband=deadbands.get(
+                sensor_key,
+                DERIVED_DEADBAND
+                if sensor_key in DERIVED_FIELDS
+                else DEVICE_CLASS_DEADBANDS.get(description.device_class, 0),
+            ),
+            max_state_age=max_state_age,
         )
 
-    def _create_energy_entity(power_sensor_key: str) -> PowerwallEnergySensor:
-        energy_sensor_key = f"{power_sensor_key}_energy"
-        description = ENTITY_DESCRIPTION_KEY_MAP.get(energy_sensor_key)
-        if description is None:
-            raise ValueError(f"Unknown sensor key: {energy_sensor_key}")
-
-        return PowerwallEnergySensor(
-            coordinator=coordinator,
-            power_sensor_key=power_sensor_key,
-            description=description,
-        )
-
-    await coordinator.async_config_entry_first_refresh()
-    sensors = []
+    sensors = [
+        _create_entity(sensor_key)
+        for sensor_key in coordinator.data
+        if sensor_key in ENTITY_DESCRIPTION_KEY_MAP
+    ]
 
-    for power_sensor_key in coordinator.data:
-        if power_sensor_key in ENTITY_DESCRIPTION_KEY_MAP:
-            power_sensor = _create_entity(power_sensor_key)
-            sensors.append(power_sensor)
-
-            energy_sensor_key = f"{power_sensor_key}_energy"
-            if energy_sensor_key in ENTITY_DESCRIPTION_KEY_MAP:
-                energy_sensor = _create_energy_entity(power_sensor_key)
-                sensors.append(energy_sensor)
+    sensors.extend(
+        PowerwallDiagnosticSensor(coordinator, sensor_key, description)
+        for sensor_key, description in DIAGNOSTIC_DESCRIPTION_KEY_MAP.items()
+    )
 
     async_add_entities(sensors)
 
 
 class PowerwallSensor(CoordinatorEntity[Pw3DataUpdateCoordinator], SensorEntity):
-    """Representation of a Powerwall sensor."""
+    """Representation of a Powerwall sensor.
+
+    State writes are coalesced: a refresh that moves the value by no more
+    than the deadband is not written, unless the last write is older than
+    max_state_age.
+    """
+
+    _attr_has_entity_name = True
 
     def __init__(
         self,
         coordinator: Pw3DataUpdateCoordinator,
         sensor_key: str,
         description: SensorEntityDescription,
+        deadband: float = 0,
+        max_state_age: timedelta = DEFAULT_MAX_STATE_AGE,
     ):
         """Initialize the sensor."""
         super().__init__(coordinator)
         self.entity_description = description
         self._sensor_key = sensor_key
-        self._attr_unique_id = f"pw_{sensor_key}"
+        self._attr_unique_id = unique_id(coordinator, sensor_key)
+        self._attr_device_info = device_info(coordinator)
+        self._deadband = deadband
+        self._max_state_age = max_state_age
+        self._written: tuple[Any, bool, bool] | None = None
+        self._written_at: datetime | None = None
 
     @property
     def name(self) -> str | None:
-        """Return name of the entity."""
-        return f"PW {self.entity_description.key}"
+        """Return name of the entity, shown after the device name."""
+        return self.entity_description.key
 
     @property
     def native_value(self):
         """Return the state of the sensor."""
-        return self.coordinator.data.get(self._sensor_key)
+        value = self.coordinator.data.get(self._sensor_key)
+        if value is not None and self.device_class == SensorDeviceClass.TIMESTAMP:
+            return dt_util.utc_from_timestamp(value)
+        return value
 
     @property
     def extra_state_attributes(self):
         """Return the state attributes of the sensor."""
         attributes = super().extra_state_attributes or {}
-        attributes["last_updated"] = self.coordinator.data.get("last_updated")
+        attributes["stale"] = self._sensor_key in self.coordinator.data.get("stale", [])
         return attributes
 
+    async def async_added_to_hass(self) -> None:
+        """Record the state written when the entity is added."""
+        await super().async_added_to_hass()
+        self._written = self._current()
+        self._written_at = dt_util.utcnow()
 
-class PowerwallEnergySensor(CoordinatorEntity[Pw3DataUpdateCoordinator], SensorEntity):
-    """Representation of a Powerwall energy sensor."""
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write the state only if it moved past the deadband or is due."""
+        current = self._current()
+        now = dt_util.utcnow()
+        if (
+            self._written is not None
+            and self._written_at is not None
+            and now - self._written_at < self._max_state_age
+            and not self._changed(self._written, current)
+        ):
+            return
+        self._written = current
+        self._written_at = now
+        super()._handle_coordinator_update()
+
+    def _current(self) -> tuple[Any, bool, bool]:
+        return (
+            self.coordinator.data.get(self._sensor_key),
+            self.available,
+            self._sensor_key in self.coordinator.data.get("stale", []),
+        )
+
+    def _changed(self, written: tuple, current: tuple) -> bool:
+        if written[1:] != current[1:]:
+            return True
+        old, new = written[0], current[0]
+        if old is None or new is None:
+            return old is not new
+        return abs(new - old) > self._deadband
+
+
+class PowerwallDiagnosticSensor(
+    CoordinatorEntity[Pw3DataUpdateCoordinator], SensorEntity
+):
+    """Representation of a pw3 diagnostic sensor."""
+
+    _attr_has_entity_name = True
+
+    entity_description: PowerwallDiagnosticSensorEntityDescription
 
     def __init__(
         self,
         coordinator: Pw3DataUpdateCoordinator,
-        power_sensor_key: str,
-        description: SensorEntityDescription,
+        sensor_key: str,
+        description: PowerwallDiagnosticSensorEntityDescription,
     ):
+        """Initialize the sensor."""
         super().__init__(coordinator)
         self.entity_description = description
-        self._power_sensor_key = power_sensor_key
-        self._attr_unique_id = f"pw_{power_sensor_key}_energy"
-        self._energy_value = 0
-        self._last_update = None
-        self._last_reported = None
+        self._attr_unique_id = unique_id(coordinator, sensor_key)
+        self._attr_device_info = device_info(coordinator)
 
     @property
     def name(self) -> str | None:
-        """Return name of the entity."""
-        return f"PW {self.entity_description.key}"
+        """Return name of the entity, shown after the device name."""
+        return self.entity_description.key
 
     @property
     def native_value(self):
         """Return the state of the sensor."""
-        current_power = self.coordinator.data.get(self._power_sensor_key, 0)
-        current_time = datetime.now()
-
-        if self._last_update is not None:
-            time_diff = (current_time - self._last_update).total_seconds() / 3600
-            self._energy_value += current_power * time_diff
-
-        self._last_update = current_time
-
-        if self._last_reported is None or (
-            current_time - self._last_reported
-        ) >= timedelta(hours=1):
-            self._last_reported = current_time
-            return round(self._energy_value, 3)
-
-        return None
+        return self.entity_description.value_fn(self.coordinator)
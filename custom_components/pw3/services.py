@@ -0,0 +1,62 @@
+"""Services for pw3."""
+
+import logging
+
+import voluptuous as vol
+from homeassistant.core import HomeAssistant
+from homeassistant.core import ServiceCall
+from homeassistant.core import callback
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import DOMAIN
+from .coordinator import Pw3DataUpdateCoordinator
+from .profiler import PROFILE_DIR
+from .profiler import RefreshProfiler
+
+SERVICE_PROFILE = "profile"
+ATTR_RUNS = "runs"
+DEFAULT_PROFILE_RUNS = 5
+MAX_PROFILE_RUNS = 100
+
+PROFILE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_RUNS, default=DEFAULT_PROFILE_RUNS): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=MAX_PROFILE_RUNS)
+        )
+    }
+)
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+@callback
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the pw3 services."""
+
+    async def async_profile(call: ServiceCall) -> None:
+        """Profile the next refreshes of every loaded coordinator."""
+        coordinators = [
+            value
+            for value in hass.data.get(DOMAIN, {}).values()
+            if isinstance(value, Pw3DataUpdateCoordinator)
+        ]
+        if not coordinators:
+            raise HomeAssistantError("No pw3 entries are loaded")
+        if any(
+            coordinator.profiler is not None and not coordinator.profiler.done
+            for coordinator in coordinators
+        ):
+            raise HomeAssistantError("A pw3 profile is already running")
+
+        profiler = RefreshProfiler(call.data[ATTR_RUNS])
+        for coordinator in coordinators:
+            coordinator.profiler = profiler
+        _LOGGER.info(
+            "Profiling the next %s Powerwall refreshes into %s",
+            profiler.runs,
+            hass.config.path(PROFILE_DIR),
+        )
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_PROFILE, async_profile, schema=PROFILE_SCHEMA
+    )
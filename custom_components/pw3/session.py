@@ -0,0 +1,116 @@
+"""Shared, reference-counted Powerwall sessions for pw3."""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Hashable
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import CALLBACK_TYPE
+from homeassistant.core import Event
+from homeassistant.core import HomeAssistant
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+
+from .const import DOMAIN
+
+# hass.data[DOMAIN] key holding the pool
+SESSIONS = "sessions"
+
+# Seconds an unused session is kept before it is torn down, so a config
+# entry reload picks up the same authenticated client.
+SESSION_LINGER = 60
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+@dataclass
+class _Session:
+    client: Any
+    refs: int = 0
+    teardown: CALLBACK_TYPE | None = None
+
+
+class SessionPool:
+    """Authenticated clients keyed by (email, site), shared between entries.
+
+    Each acquire must be paired with a release. A client whose last
+    reference is released lingers for SESSION_LINGER seconds before it is
+    closed, so reloads reuse it instead of logging in again.
+    """
+
+    def __init__(self, hass: HomeAssistant, linger: float = SESSION_LINGER) -> None:
+        self.hass = hass
+        self.linger = linger
+        self.logins = 0
+        self._sessions: dict[Hashable, _Session] = {}
+        self._locks: dict[Hashable, asyncio.Lock] = {}
+
+    async def async_acquire(
+        self, key: Hashable, factory: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Return the client for key, creating it with factory if needed."""
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            session = self._sessions.get(key)
+            if session is None:
+                _LOGGER.debug("Creating Powerwall session for %s", key)
+                session = _Session(await factory())
+                self.logins += 1
+                self._sessions[key] = session
+            if session.teardown is not None:
+                session.teardown()
+                session.teardown = None
+            session.refs += 1
+            return session.client
+
+    @callback
+    def async_release(self, key: Hashable) -> None:
+        """Drop a reference; the last one schedules the client's teardown."""
+        session = self._sessions.get(key)
+        if session is None or session.refs == 0:
+            return
+        session.refs -= 1
+        if session.refs == 0:
+            session.teardown = async_call_later(
+                self.hass, self.linger, partial(self._async_close, key)
+            )
+
+    @callback
+    def _async_close(self, key: Hashable, _now: datetime | None = None) -> None:
+        session = self._sessions.get(key)
+        if session is None or session.refs:
+            return
+        del self._sessions[key]
+        _LOGGER.debug("Closing Powerwall session for %s", key)
+        if close := getattr(
+            getattr(session.client, "client", None), "close_session", None
+        ):
+            self.hass.async_add_executor_job(close)
+
+    async def async_close_all(self) -> None:
+        """Close every session now, whether or not it is still referenced."""
+        for key, session in list(self._sessions.items()):
+            if session.teardown is not None:
+                session.teardown()
+            session.refs = 0
+            self._async_close(key)
+
+
+@callback
+def async_get_session_pool(hass: HomeAssistant) -> SessionPool:
+    """Return the pw3 session pool, creating it on first use."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if SESSIONS not in data:
+        pool = data[SESSIONS] = SessionPool(hass)
+
+        async def _async_close_all(_event: Event) -> None:
+            await pool.async_close_all()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _async_close_all)
+    return data[SESSIONS]
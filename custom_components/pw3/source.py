@@ -0,0 +1,196 @@
+"""Data sources for pw3: the local gateway and the Tesla cloud."""
+
+import asyncio
+import logging
+from datetime import datetime
+from datetime import timedelta
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Hashable
+
+from homeassistant.util import dt as dt_util
+
+# Source names, published with each sample
+LOCAL = "local"
+CLOUD = "cloud"
+
+# Consecutive failed refreshes after which a source is skipped in favour of
+# the next one, and how long it is skipped before being probed again.
+FAILOVER_THRESHOLD = 3
+RECOVERY_INTERVAL = timedelta(minutes=5)
+
+# Breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Consecutive failed samples that open the breaker, and how long it stays
+# open before a probe; the wait doubles after each failed probe, up to
+# BREAKER_MAX_RESET.
+BREAKER_THRESHOLD = 5
+BREAKER_RESET = timedelta(minutes=1)
+BREAKER_MAX_RESET = timedelta(minutes=30)
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+class DataSource:
+    """One path to the Powerwall.
+
+    Either a pypowerwall client, read in the executor, or a native asyncio
+    client. A pypowerwall client can be created lazily by connect on the
+    first refresh that uses this source.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pw: Any = None,
+        api: Any = None,
+        connect: Callable[[], Awaitable[Any]] | None = None,
+        session_key: Hashable | None = None,
+    ) -> None:
+        self.name = name
+        self.pw = pw
+        self.api = api
+        self._connect = connect
+        # Session pool key of the client, released when the entry unloads
+        self.session_key = session_key
+        self.failures = 0
+        self.last_failure: datetime | None = None
+        # Refreshes and battery controls may both connect; one client is made
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        """Return True once the source has a client to read from."""
+        return self.pw is not None or self.api is not None
+
+    async def async_connect(self) -> None:
+        """Create the pypowerwall client if this source does not have one."""
+        if self.connected or self._connect is None:
+            return
+        async with self._connect_lock:
+            if not self.connected:
+                self.pw = await self._connect()
+
+
+class SourceSelector:
+    """Order sources by preference and health.
+
+    Sources are tried in the order given. One that has failed
+    FAILOVER_THRESHOLD refreshes in a row is skipped, so later sources take
+    over, until RECOVERY_INTERVAL has passed; it is then tried first again
+    and takes back over as soon as it succeeds.
+    """
+
+    def __init__(
+        self,
+        sources: list[DataSource],
+        failover_threshold: int = FAILOVER_THRESHOLD,
+        recovery_interval: timedelta = RECOVERY_INTERVAL,
+    ) -> None:
+        self.sources = sources
+        self.failover_threshold = failover_threshold
+        self.recovery_interval = recovery_interval
+        self.active: DataSource | None = None
+
+    def healthy(self, source: DataSource) -> bool:
+        """Return True if source should be tried on this refresh."""
+        if source.failures < self.failover_threshold:
+            return True
+        return (
+            source.last_failure is None
+            or dt_util.utcnow() - source.last_failure >= self.recovery_interval
+        )
+
+    def candidates(self) -> list[DataSource]:
+        """Return the sources to try, in order, for one refresh."""
+        candidates = [source for source in self.sources if self.healthy(source)]
+        # With every source skipped, keep trying the last resort anyway
+        return candidates or self.sources[-1:]
+
+    def report(self, source: DataSource, ok: bool) -> None:
+        """Record the outcome of reading from source."""
+        if ok:
+            if self.active is not None and self.active is not source:
+                _LOGGER.info(
+                    "Powerwall data source switched from %s to %s",
+                    self.active.name,
+                    source.name,
+                )
+            source.failures = 0
+            self.active = source
+            return
+        source.failures += 1
+        source.last_failure = dt_util.utcnow()
+
+
+class CircuitBreaker:
+    """Stop reading from the Powerwall while every source is failing.
+
+    After threshold failed samples in a row the breaker opens and samples
+    are skipped. Once the reset time has passed it goes half-open and lets
+    a single probe through: success closes it, failure reopens it for twice
+    as long.
+    """
+
+    def __init__(
+        self,
+        threshold: int = BREAKER_THRESHOLD,
+        reset: timedelta = BREAKER_RESET,
+        max_reset: timedelta = BREAKER_MAX_RESET,
+    ) -> None:
+        self.threshold = threshold
+        self.reset = reset
+        self.max_reset = max_reset
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: datetime | None = None
+        self._wait = reset
+
+    def allow(self) -> bool:
+        """Return True if a sample may be read now."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and dt_util.utcnow() - self.opened_at >= self._wait:
+            self.state = HALF_OPEN
+            _LOGGER.debug("Probing Powerwall after %s", self._wait)
+            return True
+        # Open, or half-open with the probe still running
+        return False
+
+    def report(self, ok: bool) -> None:
+        """Record the outcome of a sample."""
+        if ok:
+            if self.state != CLOSED:
+                _LOGGER.info("Powerwall reads recovered, resuming updates")
+            self.state = CLOSED
+            self.failures = 0
+            self._wait = self.reset
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            self._wait = min(self.max_reset, self._wait * 2)
+            self._open()
+        elif self.state == CLOSED and self.failures >= self.threshold:
+            _LOGGER.warning(
+                "Powerwall reads failed %s times in a row, pausing them for %s",
+                self.failures,
+                self._wait,
+            )
+            self._open()
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self.opened_at = dt_util.utcnow()
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the breaker state for diagnostics."""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened_at": self.opened_at.isoformat() if self.opened_at else None,
+            "reset": self._wait.total_seconds(),
+        }
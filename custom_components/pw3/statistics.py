@@ -0,0 +1,235 @@
+"""Long-term statistics for pw3, aggregated from samples and imported directly."""
+
+import logging
+from typing import Any
+
+from homeassistant.components.recorder.models import StatisticData
+from homeassistant.components.recorder.models import StatisticMetaData
+from homeassistant.components.recorder.statistics import async_add_external_statistics
+from homeassistant.core import HomeAssistant
+from homeassistant.core import callback
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN
+
+# Samples are rolled into 5-minute buckets, and those into the hourly rows
+# the recorder accepts for import.
+BUCKET_SECONDS = 5 * 60
+HOUR_SECONDS = 60 * 60
+
+# Closed hours kept for import while the recorder is not running
+MAX_PENDING_HOURS = 48
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+class _Bucket:
+    """Running mean/min/max of one field over one period."""
+
+    __slots__ = ("count", "total", "low", "high")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.low = float("inf")
+        self.high = float("-inf")
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.low = min(self.low, value)
+        self.high = max(self.high, value)
+
+    def merge(self, other: "_Bucket") -> None:
+        # Weighted by sample count, so the hourly mean is the mean of samples
+        self.count += other.count
+        self.total += other.total
+        self.low = min(self.low, other.low)
+        self.high = max(self.high, other.high)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count
+
+
+class StatisticsAggregator:
+    """Aggregate coordinator samples into hourly long-term statistics.
+
+    mean_fields get hourly mean/min/max. sum_fields are running totals
+    (the *_energy fields); each hour contributes the energy it added, and
+    the imported sum continues from the last imported hour, so hours
+    backfilled from history and hours measured live form one series.
+    Closed hours wait in pending until they are imported.
+    """
+
+    def __init__(
+        self,
+        mean_fields: dict[str, str | None],
+        sum_fields: dict[str, str | None],
+        names: dict[str, str] | None = None,
+        key: str | None = None,
+    ) -> None:
+        """mean_fields and sum_fields map each field to its unit.
+
+        key tells apart the statistics of different sites; see statistic_id.
+        """
+        self.mean_fields = mean_fields
+        self.sum_fields = sum_fields
+        self.names = names or {}
+        self.key = key
+        # Checkpoint: the sums as of the end of the last imported hour
+        self.sums: dict[str, float] = {}
+        self.last_hour: float | None = None
+        # Set while a backfill owns the sums; live hours wait in pending
+        self.paused = False
+        self.pending: dict[str, list[StatisticData]] = {}
+        self.pending_energy: list[tuple[float, dict[str, float]]] = []
+        self.buckets: list[tuple[float, dict[str, tuple[float, float, float]]]] = []
+        self._bucket_start: float | None = None
+        self._hour_start: float | None = None
+        self._bucket: dict[str, _Bucket] = {}
+        self._hour: dict[str, _Bucket] = {}
+        self._totals: dict[str, float] = {}
+        self._hour_totals: dict[str, float] = {}
+
+    def add_sample(
+        self, timestamp: float, data: dict[str, Any], stale: list[str] | None = None
+    ) -> None:
+        """Add one sample, closing any 5-minute bucket and hour it ends."""
+        bucket_start = timestamp - timestamp % BUCKET_SECONDS
+        hour_start = timestamp - timestamp % HOUR_SECONDS
+        if self._bucket_start is not None:
+            if bucket_start < self._bucket_start:
+                # Out-of-order sample for a closed period
+                return
+            if bucket_start > self._bucket_start:
+                self._close_bucket()
+            if hour_start > self._hour_start:
+                self._close_hour()
+        self._bucket_start = bucket_start
+        self._hour_start = hour_start
+
+        for field in self.mean_fields:
+            value = data.get(field)
+            if value is None or (stale and field in stale):
+                continue
+            self._bucket.setdefault(field, _Bucket()).add(value)
+        for field in self.sum_fields:
+            if (value := data.get(field)) is not None:
+                self._totals[field] = value
+                self._hour_totals.setdefault(field, value)
+
+    def _close_bucket(self) -> None:
+        stats = {}
+        for field, bucket in self._bucket.items():
+            stats[field] = (bucket.low, bucket.mean, bucket.high)
+            self._hour.setdefault(field, _Bucket()).merge(bucket)
+        # The last hour of 5-minute buckets, for diagnostics
+        self.buckets = [
+            *self.buckets[-(HOUR_SECONDS // BUCKET_SECONDS - 1) :],
+            (self._bucket_start, stats),
+        ]
+        self._bucket = {}
+
+    def _close_hour(self) -> None:
+        start = dt_util.utc_from_timestamp(self._hour_start)
+        for field, bucket in self._hour.items():
+            rows = self.pending.setdefault(field, [])
+            rows.append(
+                StatisticData(
+                    start=start, mean=bucket.mean, min=bucket.low, max=bucket.high
+                )
+            )
+            del rows[:-MAX_PENDING_HOURS]
+        if self._totals:
+            self.pending_energy.append(
+                (
+                    self._hour_start,
+                    {
+                        field: max(0.0, total - self._hour_totals[field])
+                        for field, total in self._totals.items()
+                    },
+                )
+            )
+            del self.pending_energy[:-MAX_PENDING_HOURS]
+        self._hour = {}
+        self._hour_totals = dict(self._totals)
+
+    def metadata(self, field: str) -> StatisticMetaData:
+        """Return the external statistic metadata for field."""
+        has_sum = field in self.sum_fields
+        return StatisticMetaData(
+            has_mean=not has_sum,
+            has_sum=has_sum,
+            name=self.names.get(field),
+            source=DOMAIN,
+            statistic_id=statistic_id(field, self.key),
+            unit_of_measurement=(
+                self.sum_fields[field] if has_sum else self.mean_fields[field]
+            ),
+        )
+
+    @callback
+    def async_import(self, hass: HomeAssistant) -> int:
+        """Queue every pending hour for import in one batch per statistic.
+
+        Returns the number of rows queued. Rows stay pending while the
+        recorder is not running or a backfill is in progress.
+        """
+        if self.paused or "recorder" not in hass.config.components:
+            return 0
+        imported = 0
+        for field, rows in self.pending.items():
+            async_add_external_statistics(hass, self.metadata(field), rows)
+            imported += len(rows)
+        self.pending = {}
+        imported += self.async_import_energy(hass, self.pending_energy)
+        self.pending_energy = []
+        if imported:
+            _LOGGER.debug("Imported %s hourly statistics rows", imported)
+        return imported
+
+    @callback
+    def async_import_energy(
+        self, hass: HomeAssistant, hours: list[tuple[float, dict[str, float]]]
+    ) -> int:
+        """Import hourly energy deltas as sums continuing from the checkpoint.
+
+        hours are (hour start timestamp, {field: Wh added in that hour}) in
+        time order. Hours at or before the checkpoint are skipped. Returns
+        the number of rows queued.
+        """
+        rows: dict[str, list[StatisticData]] = {}
+        for hour, deltas in hours:
+            if self.last_hour is not None and hour <= self.last_hour:
+                continue
+            start = dt_util.utc_from_timestamp(hour)
+            for field, delta in deltas.items():
+                total = self.sums[field] = self.sums.get(field, 0.0) + delta
+                rows.setdefault(field, []).append(
+                    StatisticData(start=start, state=total, sum=total)
+                )
+            self.last_hour = hour
+        for field, field_rows in rows.items():
+            async_add_external_statistics(hass, self.metadata(field), field_rows)
+        return sum(len(field_rows) for field_rows in rows.values())
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the import checkpoint for persistence."""
+        return {"sums": self.sums, "last_hour": self.last_hour}
+
+    def restore(self, data: dict[str, Any]) -> None:
+        """Restore a checkpoint saved by as_dict."""
+        self.sums = dict(data.get("sums") or {})
+        self.last_hour = data.get("last_hour")
+
+
+def statistic_id(field: str, key: str | None = None) -> str:
+    """Return the external statistic id for a coordinator field.
+
+    key is the site id or config entry id, so that entries for different
+    sites import separate series: pw3:<key>_<field>.
+    """
+    if key is None:
+        return f"{DOMAIN}:{field}"
+    return f"{DOMAIN}:{key.lower()}_{field}"
@@ -1,44 +1,58 @@
 """Switch platform for pw3."""
 
+from typing import Any
+
 from homeassistant.components.switch import SwitchEntity
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
-from .const import DEFAULT_NAME
 from .const import DOMAIN
-from .const import ICON
-from .const import SWITCH
-from .entity import Pw3Entity
-
-
-async def async_setup_entry(hass, entry, async_add_devices):
-    """Setup sensor platform."""
-    coordinator = hass.data[DOMAIN][entry.entry_id]
-    async_add_devices([Pw3BinarySwitch(coordinator, entry)])
-
-
-class Pw3BinarySwitch(Pw3Entity, SwitchEntity):
-    """pw3 switch class."""
-
-    async def async_turn_on(self, **kwargs):  # pylint: disable=unused-argument
-        """Turn on the switch."""
-        await self.coordinator.api.async_set_title("bar")
-        await self.coordinator.async_request_refresh()
-
-    async def async_turn_off(self, **kwargs):  # pylint: disable=unused-argument
-        """Turn off the switch."""
-        await self.coordinator.api.async_set_title("foo")
-        await self.coordinator.async_request_refresh()
+from .control import GRID_CHARGING
+from .control import STORM_MODE
+from .control import CommandQueue
+from .coordinator import Pw3DataUpdateCoordinator
+from .entity import PowerwallControlEntity
+
+# Setting key: (name, icon)
+SWITCHES = {
+    STORM_MODE: ("Storm Watch", "mdi:weather-lightning"),
+    GRID_CHARGING: ("Grid Charging", "mdi:transmission-tower-import"),
+}
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up the Powerwall switch platform."""
+    coordinator: Pw3DataUpdateCoordinator = hass.data[DOMAIN][config_entry.entry_id]
+    async_add_entities(
+        PowerwallSwitch(coordinator.controls, key, name, icon)
+        for key, (name, icon) in SWITCHES.items()
+        # Storm Watch is only on the native API
+        if key in coordinator.controls.supported
+    )
+
+
+class PowerwallSwitch(PowerwallControlEntity, SwitchEntity):
+    """A battery setting that is on or off."""
+
+    def __init__(self, controls: CommandQueue, key: str, name: str, icon: str) -> None:
+        """Initialize the switch."""
+        super().__init__(controls, key, name)
+        self._attr_icon = icon
 
     @property
-    def name(self):
-        """Return the name of the switch."""
-        return f"{DEFAULT_NAME}_{SWITCH}"
+    def is_on(self) -> bool | None:
+        """Return true if the setting is on."""
+        return self.setting
 
-    @property
-    def icon(self):
-        """Return the icon of this switch."""
-        return ICON
+    async def async_turn_on(self, **kwargs: Any) -> None:
+        """Turn the setting on."""
+        await self.controls.async_set(self._key, True)
 
-    @property
-    def is_on(self):
-        """Return true if the switch is on."""
-        return self.coordinator.data.get("title", "") == "foo"
+    async def async_turn_off(self, **kwargs: Any) -> None:
+        """Turn the setting off."""
+        await self.controls.async_set(self._key, False)
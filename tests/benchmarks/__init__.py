@@ -0,0 +1 @@
+"""Benchmarks for pw3 integration."""
@@ -0,0 +1,201 @@
+"""Fixtures for pw3 benchmarks.
+
+Each benchmark measures metrics and checks them against baseline.json; a
+metric over its baseline by more than the stored tolerance fails the run.
+Run with PW3_UPDATE_BASELINE=1 to record the measured values as the new
+baseline instead.
+
+Benchmarks run with the rest of the suite. Counts and memory are held to
+their baselines as they are; coverage tracing slows the code under test
+several times over, so under coverage the timing limits are scaled by
+COVERAGE_SLOWDOWN. For timings against the real limits, and to record a
+baseline, run without coverage:
+
+    pytest --no-cov tests/benchmarks
+    PW3_UPDATE_BASELINE=1 pytest --no-cov tests/benchmarks
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+UPDATE_BASELINE = bool(os.environ.get("PW3_UPDATE_BASELINE"))
+BENCHMARK_DIR = Path(__file__).parent
+
+# Allowed regression over the baseline: none for counts, some for memory,
+# and a wide margin for wall-clock timings, which vary between machines.
+TOLERANCE = {"count": 0.0, "bytes": 0.5, "time": 2.0}
+# How much longer timed code may take while coverage traces it
+COVERAGE_SLOWDOWN = 5.0
+
+
+class FakePowerwall:
+    """pypowerwall cloud client stand-in with scripted latency and jitter.
+
+    Readings drift with seeded noise around a steady load, so runs are
+    repeatable; every step_every-th reading jumps by step watts.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        noise: float = 5,
+        step: float = 0,
+        step_every: int = 0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.noise = noise
+        self.step = step
+        self.step_every = step_every
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._reads = 0
+
+    def _wait(self) -> None:
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def poll(self, api):
+        self._wait()
+        if api == "/api/system_status/soe":
+            return {"percentage": 75.5}
+        with self._lock:
+            self._reads += 1
+            stepped = self.step_every and self._reads % self.step_every == 0
+            noise = self._random.uniform(-self.noise, self.noise)
+        load = 3500 + noise + (self.step if stepped else 0)
+        return {
+            "site": {"instant_power": load - 2500},
+            "battery": {"instant_power": -1000},
+            "load": {"instant_power": load},
+            "solar": {"instant_power": 3500 + noise},
+        }
+
+    # Battery settings, read once when an entry's controls load
+    def get_reserve(self):
+        return 20.0
+
+    def get_mode(self):
+        return "self_consumption"
+
+    def get_grid_charging(self):
+        return True
+
+
+class Baseline:
+    """Stored benchmark results, compared against what a run measures."""
+
+    def __init__(self, path: Path, slowdown: float = 1.0) -> None:
+        self.path = path
+        self.slowdown = slowdown
+        self.stored = json.loads(path.read_text()) if path.exists() else {}
+        self.measured: dict[str, dict] = {}
+
+    def check(self, name: str, value: float, kind: str = "time") -> None:
+        """Record a metric and fail if it regressed past its tolerance."""
+        self.measured[name] = {"value": round(value, 3), "kind": kind}
+        if UPDATE_BASELINE:
+            return
+        stored = self.stored.get(name)
+        assert stored is not None, f"No baseline for {name}; record one"
+        limit = stored["value"] * (1 + TOLERANCE[stored["kind"]])
+        if stored["kind"] == "time":
+            limit *= self.slowdown
+        assert value <= limit, (
+            f"{name} regressed: {value:.3f} against a baseline of "
+            f"{stored['value']} (limit {limit:.3f})"
+        )
+
+    def save(self) -> None:
+        self.path.write_text(
+            json.dumps({**self.stored, **self.measured}, indent=2, sort_keys=True)
+            + "\n"
+        )
+
+
+BASELINE_KEY = pytest.StashKey[Baseline]()
+
+
+def _coverage(config: pytest.Config) -> bool:
+    """Return whether this run traces coverage."""
+    return bool(config.getoption("cov_source", None)) and not config.getoption(
+        "no_cov", False
+    )
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: list) -> None:
+    """Skip recording a baseline under coverage, whose timings are skewed."""
+    if not (UPDATE_BASELINE and _coverage(config)):
+        return
+    skip = pytest.mark.skip(reason="record baselines with --no-cov")
+    for item in items:
+        if BENCHMARK_DIR in item.path.parents:
+            item.add_marker(skip)
+
+
+def pytest_terminal_summary(terminalreporter, config: pytest.Config) -> None:
+    """List the measured metrics after the run."""
+    baseline = config.stash.get(BASELINE_KEY, None)
+    if baseline is None or not baseline.measured:
+        return
+    terminalreporter.section("pw3 benchmarks")
+    for name, metric in sorted(baseline.measured.items()):
+        stored = baseline.stored.get(name, {}).get("value")
+        terminalreporter.write_line(
+            f"{name}: {metric['value']:.3f} (baseline {stored})"
+        )
+
+
+@pytest.fixture(scope="session")
+def _baseline(pytestconfig):
+    baseline = pytestconfig.stash[BASELINE_KEY] = Baseline(
+        BASELINE_PATH, COVERAGE_SLOWDOWN if _coverage(pytestconfig) else 1.0
+    )
+    yield baseline
+    if UPDATE_BASELINE:
+        baseline.save()
+
+
+@pytest.fixture
+def baseline(_baseline):
+    """Return the stored baseline to check metrics against."""
+    return _baseline
+
+
+async def max_loop_lag(awaitable) -> tuple[object, float]:
+    """Await awaitable, returning its result and the longest loop stall (s).
+
+    A heartbeat task sleeps 1 ms at a time; any extra delay before it runs
+    again is time the event loop was blocked by something else.
+    """
+    lag = 0.0
+    done = False
+
+    async def heartbeat():
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag = max(lag, time.perf_counter() - start - 0.001)
+
+    task = asyncio.ensure_future(heartbeat())
+    try:
+        result = await awaitable
+    finally:
+        done = True
+        await task
+    return result, lag
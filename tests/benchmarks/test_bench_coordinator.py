@@ -0,0 +1,111 @@
+"""Benchmarks for coordinator refreshes and entity state fan-out."""
+
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from unittest.mock import patch
+
+from custom_components.pw3.const import DOMAIN
+from custom_components.pw3.coordinator import Pw3DataUpdateCoordinator
+from homeassistant.const import EVENT_STATE_CHANGED
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from .conftest import FakePowerwall
+from .conftest import max_loop_lag
+
+REFRESHES = 20
+
+
+async def _setup_entry(hass, mock_config_entry, pw):
+    entry = MockConfigEntry(domain=DOMAIN, data=mock_config_entry, entry_id="bench")
+    entry.add_to_hass(hass)
+    with patch("pypowerwall.Powerwall", return_value=pw):
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    # Settle the control entities, which load in the background
+    await coordinator.controls.async_load()
+    await hass.async_block_till_done()
+    return coordinator
+
+
+async def test_bench_refresh(hass, baseline):
+    """Measure refresh wall time and event-loop stalls with 50 ms reads."""
+    coordinator = Pw3DataUpdateCoordinator(
+        hass, FakePowerwall(latency=0.05, jitter=0.01)
+    )
+    durations = []
+
+    async def refreshes():
+        for _ in range(REFRESHES):
+            start = time.perf_counter()
+            coordinator.data = await coordinator._async_update_data()
+            durations.append(time.perf_counter() - start)
+
+    _, lag = await max_loop_lag(refreshes())
+
+    baseline.check("refresh_wall_ms", statistics.median(durations) * 1000)
+    baseline.check("refresh_loop_block_ms", lag * 1000)
+    baseline.check("refresh_upstream_calls", coordinator.upstream_calls, "count")
+
+
+async def test_bench_entity_fan_out(hass, baseline, mock_config_entry):
+    """Measure pushing a changed payload to every entity."""
+    coordinator = await _setup_entry(hass, mock_config_entry, FakePowerwall())
+    low = coordinator.data
+    high = {
+        **low,
+        **{key: value + 1000 for key, value in low.items() if key in ("solar", "home")},
+        "battery_production": low["battery_production"] + 1000,
+        "grid_production": low["grid_production"] + 1000,
+        "percentage": low["percentage"] + 10,
+    }
+    durations = []
+    for index in range(50):
+        start = time.perf_counter()
+        coordinator.async_set_updated_data(high if index % 2 else low)
+        durations.append(time.perf_counter() - start)
+    await hass.async_block_till_done()
+
+    baseline.check("fan_out_ms", statistics.median(durations) * 1000)
+
+
+async def test_bench_allocations_per_tick(hass, baseline):
+    """Measure the memory one refresh allocates.
+
+    Entities are left out: their state writes wake the recorder thread,
+    which tracemalloc would slow to a crawl and count as well.
+    """
+    coordinator = Pw3DataUpdateCoordinator(hass, FakePowerwall(step=500, step_every=2))
+    for _ in range(5):
+        await coordinator.async_refresh()
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(REFRESHES):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await coordinator.async_refresh()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    baseline.check("tick_peak_kib", statistics.median(peaks) / 1024, "bytes")
+
+
+async def test_bench_state_writes_per_hour(hass, freezer, baseline, mock_config_entry):
+    """Count state changes, each a recorder row, over an hour of refreshes."""
+    coordinator = await _setup_entry(
+        hass, mock_config_entry, FakePowerwall(noise=5, step=500, step_every=10)
+    )
+    changed = []
+    hass.bus.async_listen(EVENT_STATE_CHANGED, changed.append)
+
+    for _ in range(60):
+        freezer.tick(timedelta(minutes=1))
+        await coordinator.async_refresh()
+        await hass.async_block_till_done()
+
+    baseline.check("state_writes_per_hour", len(changed), "count")
@@ -0,0 +1,56 @@
+"""Benchmarks for energy integration and sample aggregation."""
+
+import time
+
+from custom_components.pw3.coordinator import ENERGY_FIELDS
+from custom_components.pw3.coordinator import SAMPLE_FIELDS
+from custom_components.pw3.coordinator import STATISTIC_MEAN_FIELDS
+from custom_components.pw3.coordinator import STATISTIC_SUM_FIELDS
+from custom_components.pw3.energy import EnergyAccumulator
+from custom_components.pw3.samples import SAMPLE_BUFFER_SIZE
+from custom_components.pw3.samples import SampleBuffer
+from custom_components.pw3.statistics import StatisticsAggregator
+
+SAMPLES = 10_000
+SAMPLE = {
+    "solar": 3500,
+    "home": 1200,
+    "battery_consumption": 0,
+    "battery_production": 800,
+    "grid_consumption": 0,
+    "grid_production": 1500,
+    "percentage": 75.5,
+}
+
+
+def _per_sample_us(add) -> float:
+    start = time.perf_counter()
+    for index in range(SAMPLES):
+        add(float(index * 2), SAMPLE)
+    return (time.perf_counter() - start) / SAMPLES * 1e6
+
+
+def test_bench_energy_integration(baseline):
+    """Measure integrating one sample into every energy total."""
+    energy = EnergyAccumulator(ENERGY_FIELDS)
+    baseline.check("energy_sample_us", _per_sample_us(energy.add_sample))
+
+
+def test_bench_statistics_aggregation(baseline):
+    """Measure rolling one sample into the hourly statistics."""
+    aggregator = StatisticsAggregator(STATISTIC_MEAN_FIELDS, STATISTIC_SUM_FIELDS)
+    baseline.check("statistics_sample_us", _per_sample_us(aggregator.add_sample))
+
+
+def test_bench_sample_window(baseline):
+    """Measure summarizing a refresh window out of a full day of samples."""
+    buffer = SampleBuffer(SAMPLE_FIELDS)
+    for index in range(SAMPLE_BUFFER_SIZE):
+        buffer.append(float(index * 2), SAMPLE)
+    newest = (SAMPLE_BUFFER_SIZE - 1) * 2
+
+    start = time.perf_counter()
+    for _ in range(100):
+        buffer.window(newest - 60)
+    baseline.check("sample_window_us", (time.perf_counter() - start) / 100 * 1e6)
+    baseline.check("sample_buffer_kib", buffer.nbytes / 1024, "bytes")
@@ -0,0 +1,85 @@
+"""Benchmark for the integration's import time."""
+
+import subprocess
+import sys
+from pathlib import Path
+
+# What Home Assistant has loaded by the time it imports pw3: the core, the
+# helpers pw3 uses, and energy's recorder dependency. Only the time spent
+# on top of these counts against pw3.
+PRELOADED = (
+    "homeassistant.core",
+    "homeassistant.config_entries",
+    "homeassistant.components.number",
+    "homeassistant.components.recorder",
+    "homeassistant.components.select",
+    "homeassistant.components.sensor",
+    "homeassistant.components.switch",
+    "homeassistant.helpers.aiohttp_client",
+    "homeassistant.helpers.config_validation",
+    "homeassistant.helpers.debounce",
+    "homeassistant.helpers.discovery_flow",
+    "homeassistant.helpers.event",
+    "homeassistant.helpers.storage",
+    "homeassistant.helpers.update_coordinator",
+)
+
+# Modules Home Assistant imports to set up an entry
+MODULES = (
+    "custom_components.pw3",
+    "custom_components.pw3.config_flow",
+    "custom_components.pw3.number",
+    "custom_components.pw3.select",
+    "custom_components.pw3.sensor",
+    "custom_components.pw3.switch",
+)
+
+# Dependencies that must wait until an entry creates a client. requests is
+# not among them, as Home Assistant itself already imports it.
+DEFERRED = ("pypowerwall", "teslapy")
+
+ROOT = Path(__file__).parents[2]
+
+
+def _import_times() -> tuple[dict[str, int], set[str]]:
+    """Import MODULES in a fresh interpreter under -X importtime.
+
+    Returns the cumulative microseconds of each top-level import and the
+    modules loaded by the end.
+    """
+    code = "\n".join(
+        [f"import {module}" for module in PRELOADED + MODULES]
+        + ["import sys", "print(' '.join(sys.modules))"]
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        check=True,
+        cwd=ROOT,
+        text=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | <indent>module"
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if not name.startswith("  ") and cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times, set(result.stdout.split())
+
+
+def test_bench_import_time(baseline):
+    """Importing pw3 stays within budget and leaves pypowerwall unloaded."""
+    # The first run writes any missing bytecode, which Home Assistant
+    # would only pay for once
+    _import_times()
+    times, loaded = _import_times()
+
+    assert not loaded & set(DEFERRED), "heavy dependencies imported eagerly"
+    pw3_us = sum(
+        cumulative
+        for name, cumulative in times.items()
+        if name.startswith("custom_components")
+    )
+    baseline.check("import_ms", pw3_us / 1000)
@@ -0,0 +1,99 @@
+"""Benchmarks for polling many energy sites on one account."""
+
+import asyncio
+import random
+import time
+
+import pytest
+from custom_components.pw3.coordinator import SITE_SLOTS
+from custom_components.pw3.coordinator import Pw3AccountCoordinator
+from custom_components.pw3.coordinator import Pw3DataUpdateCoordinator
+
+from .conftest import max_loop_lag
+
+
+class FakeSiteApi:
+    """Native client stand-in for one site, with network latency."""
+
+    def __init__(self, account: "FakeAccountApi", site_id: int):
+        self.account = account
+        self.site_id = site_id
+        self.status: dict = {}
+
+    async def async_get_live_status(self):
+        self.account.calls += 1
+        await asyncio.sleep(
+            self.account.latency + self.account.random.uniform(0, self.account.jitter)
+        )
+        self.status = {"solar_power": 3500, "load_power": 1200, "grid_power": -2300}
+        return self.status
+
+    async def async_get_aggregates(self):
+        return {
+            "site": {"instant_power": self.status.get("grid_power", 0)},
+            "battery": {"instant_power": 0},
+            "load": {"instant_power": self.status.get("load_power", 0)},
+            "solar": {"instant_power": self.status.get("solar_power", 0)},
+        }
+
+    async def async_get_soe(self):
+        return {"percentage": 75.5}
+
+
+class FakeAccountApi:
+    """Account client stand-in with any number of sites."""
+
+    def __init__(self, sites: int, latency: float = 0.02, jitter: float = 0.01):
+        self.sites = list(range(1, sites + 1))
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(0)
+        self.calls = 0
+        self.site_id = None
+
+    async def async_get_sites(self):
+        self.calls += 1
+        return [{"energy_site_id": site} for site in self.sites]
+
+    def for_site(self, site_id):
+        return FakeSiteApi(self, site_id)
+
+
+@pytest.mark.parametrize("sites", [1, 10, 100])
+async def test_bench_many_sites(hass, baseline, sites):
+    """Measure calls, wakeups and wall time for one poll interval."""
+    api = FakeAccountApi(sites)
+    account = Pw3AccountCoordinator(hass, api)
+    await account.async_discover()
+    coordinators = {
+        site: Pw3DataUpdateCoordinator(hass, None, api=account.client(site))
+        for site in api.sites
+    }
+    unsubscribes = [
+        account.async_subscribe(site, coordinator)
+        for site, coordinator in coordinators.items()
+    ]
+    api.calls = 0
+
+    async def interval():
+        wakeups = 0
+        for _ in range(account.slots):
+            await account.async_refresh()
+            wakeups += 1
+        return wakeups
+
+    try:
+        start = time.perf_counter()
+        wakeups, lag = await max_loop_lag(interval())
+        elapsed = time.perf_counter() - start
+
+        assert all(coordinator.data for coordinator in coordinators.values())
+        assert wakeups == min(sites, SITE_SLOTS)
+        baseline.check(f"sites_{sites}_calls_per_interval", api.calls, "count")
+        baseline.check(f"sites_{sites}_wakeups_per_interval", wakeups, "count")
+        baseline.check(f"sites_{sites}_busy_ms_per_site", elapsed / sites * 1000)
+        baseline.check(f"sites_{sites}_loop_block_ms", lag * 1000)
+    finally:
+        # Drops the account's last listener, which cancels its refresh timer
+        for unsubscribe in unsubscribes:
+            unsubscribe()
@@ -1,11 +1,32 @@
 """Global fixtures for pw3 integration."""
 
+from contextlib import contextmanager
 from unittest.mock import patch
 
 import pytest
 
+from .const import MOCK_LIVE_STATUS
+from .const import MOCK_SITE_ID
+from .const import MOCK_TOKEN
+
 pytest_plugins = "pytest_homeassistant_custom_component"
 
+AGGREGATES = {
+    "site": {"instant_power": -1000},
+    "battery": {"instant_power": 2000},
+    "load": {"instant_power": 3500},
+    "solar": {"instant_power": 1500},
+}
+SOE = {"percentage": 75.5}
+
+
+# This fixture enables loading custom integrations in all tests. The recorder is set
+# up first because pw3 depends on energy, which needs a running recorder.
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(recorder_mock, enable_custom_integrations):
+    """Enable custom integrations defined in the test dir."""
+    yield
+
 
 # This fixture is used to prevent HomeAssistant from attempting to create and dismiss persistent
 # notifications. These calls would fail without this fixture since the persistent_notification
@@ -13,39 +34,73 @@ pytest_plugins = "pytest_homeassistant_custom_component"
 @pytest.fixture(name="skip_notifications", autouse=True)
 def skip_notifications_fixture():
     """Skip notification calls."""
-    with patch("homeassistant.components.persistent_notification.async_create"), patch(
-        "homeassistant.components.persistent_notification.async_dismiss"
+    with (
+        patch("homeassistant.components.persistent_notification.async_create"),
+        patch("homeassistant.components.persistent_notification.async_dismiss"),
+    ):
+        yield
+
+
+@contextmanager
+def _native_api(**live_status):
+    """Patch the cached token and account discovery of native API entries."""
+    with (
+        patch(
+            "custom_components.pw3.load_cloud_auth",
+            return_value=(MOCK_TOKEN, MOCK_SITE_ID),
+        ),
+        patch(
+            "custom_components.pw3.Pw3ApiClient.async_get_sites",
+            return_value=[{"energy_site_id": MOCK_SITE_ID}],
+        ),
+        patch("custom_components.pw3.Pw3ApiClient.async_get_settings", return_value={}),
+        patch(
+            "custom_components.pw3.Pw3ApiClient.async_get_live_status", **live_status
+        ),
     ):
         yield
 
 
-# This fixture, when used, will result in calls to async_get_data to return None. To have the call
-# return a value, we would add the `return_value=<VALUE_TO_RETURN>` parameter to the patch call.
+# This fixture, when used, will result in calls to async_get_live_status to return
+# canned readings, so no request reaches the Tesla API.
 @pytest.fixture(name="bypass_get_data")
 def bypass_get_data_fixture():
     """Skip calls to get data from API."""
-    with patch("custom_components.pw3.Pw3ApiClient.async_get_data"):
+    with _native_api(return_value=MOCK_LIVE_STATUS):
         yield
 
 
-# In this fixture, we are forcing calls to async_get_data to raise an Exception. This is useful
+# In this fixture, we are forcing calls to async_get_live_status to raise an Exception. This is useful
 # for exception handling.
 @pytest.fixture(name="error_on_get_data")
 def error_get_data_fixture():
     """Simulate error when retrieving data from API."""
-    with patch(
-        "custom_components.pw3.Pw3ApiClient.async_get_data",
-        side_effect=Exception,
-    ):
+    with _native_api(side_effect=Exception):
         yield
 
 
 @pytest.fixture
 def mock_powerwall():
-    with patch("custom_components.pw3.Powerwall") as mock_pw:
+    with patch("pypowerwall.Powerwall") as mock_pw:
         yield mock_pw
 
 
+# Powerwall instances created during setup answer the aggregates and SOE polls.
+@pytest.fixture
+def mock_pw_data(mock_powerwall):
+    """Return canned Powerwall readings from the patched Powerwall."""
+    pw = mock_powerwall.return_value
+    pw.poll.side_effect = lambda api: {
+        "/api/meters/aggregates": AGGREGATES,
+        "/api/system_status/soe": SOE,
+    }[api]
+    # Battery settings, read when controls load
+    pw.get_reserve.return_value = 20.0
+    pw.get_mode.return_value = "self_consumption"
+    pw.get_grid_charging.return_value = True
+    yield pw
+
+
 @pytest.fixture
 def mock_config_entry():
     return {"pw_email": "test@example.com", "pw_timezone": "America/New_York"}
@@ -1,10 +1,16 @@
 """Constants for pw3 tests."""
 
-from custom_components.pw3.const import (
-    CONF_PASSWORD,
-)
-from custom_components.pw3.const import (
-    CONF_USERNAME,
-)
+from custom_components.pw3.const import CONF_NATIVE_API
 
-MOCK_CONFIG = {CONF_USERNAME: "test_username", CONF_PASSWORD: "test_password"}
+MOCK_CONFIG = {"pw_email": "test@example.com", "pw_timezone": "America/New_York"}
+# Entries read through the native Tesla API client
+MOCK_OPTIONS = {CONF_NATIVE_API: True}
+MOCK_SITE_ID = 12345
+MOCK_TOKEN = {"access_token": "at", "refresh_token": "rt", "expires_at": 0}
+MOCK_LIVE_STATUS = {
+    "solar_power": 1500,
+    "battery_power": 2000,
+    "load_power": 3500,
+    "grid_power": -1000,
+    "percentage_charged": 50,
+}
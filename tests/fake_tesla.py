@@ -0,0 +1,206 @@
+"""Local stand-in for the Tesla cloud, for load and fault-injection tests.
+
+FakeTeslaCloud serves the owner API endpoints pw3's cloud clients use
+(the SSO token endpoint, the product list, live_status, which carries the
+SOE, and calendar_history) from an aiohttp server on localhost. Latency,
+errors and throttling are scriptable, so tests exercise real HTTP
+behavior with no internet access.
+"""
+
+import asyncio
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+TOKEN_PATH = "/oauth2/v3/token"
+API_PATH = "/api/1"
+
+
+@dataclass
+class Fault:
+    """One scripted response, returned instead of the real one."""
+
+    status: int = 500
+    headers: dict | None = None
+    # Seconds to stall before answering, e.g. longer than a client timeout
+    delay: float = 0
+
+
+class FakeTeslaCloud:
+    """Scriptable Tesla owner API and SSO server.
+
+    Every request first waits latency plus up to jitter seconds. Then,
+    in order: a queued Fault is returned if there is one; requests over
+    rate_limit in the current rate_window get a 429 with Retry-After; and
+    error_rate of the remaining API requests fail with a 500.
+    """
+
+    def __init__(
+        self,
+        sites: int = 1,
+        latency: float = 0,
+        jitter: float = 0,
+        error_rate: float = 0,
+        rate_limit: int | None = None,
+        rate_window: float = 60,
+        retry_after: int = 30,
+        token_lifetime: int = 3600,
+        seed: int = 0,
+    ) -> None:
+        self.sites = [10000 + index for index in range(sites)]
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.retry_after = retry_after
+        self.token_lifetime = token_lifetime
+        self.faults: list[Fault] = []
+        self.requests: Counter[str] = Counter()
+        self.statuses: Counter[int] = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.access_token = "access-0"
+        self.refresh_token = "refresh-0"
+        self.token_expires_at = time.time() + token_lifetime
+        self._tokens_issued = 0
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self._random = random.Random(seed)
+        self._server: TestServer | None = None
+
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post(TOKEN_PATH, self._token)
+        app.router.add_get(f"{API_PATH}/products", self._products)
+        app.router.add_get(
+            f"{API_PATH}/energy_sites/{{site_id}}/live_status", self._live_status
+        )
+        app.router.add_get(
+            f"{API_PATH}/energy_sites/{{site_id}}/calendar_history",
+            self._calendar_history,
+        )
+        self.app = app
+
+    @property
+    def base_url(self) -> str:
+        """Return the owner API base URL to give a client."""
+        return str(self._server.make_url(API_PATH))
+
+    @property
+    def token_url(self) -> str:
+        """Return the SSO token URL to give a client."""
+        return str(self._server.make_url(TOKEN_PATH))
+
+    @property
+    def token(self) -> dict:
+        """Return a token as cached by pypowerwall, valid for this server."""
+        return {
+            "access_token": self.access_token,
+            "refresh_token": self.refresh_token,
+            "expires_at": self.token_expires_at,
+        }
+
+    async def start(self) -> None:
+        """Start serving on a free localhost port."""
+        self._server = TestServer(self.app)
+        await self._server.start_server()
+
+    async def close(self) -> None:
+        """Stop the server."""
+        if self._server is not None:
+            await self._server.close()
+
+    def live_status(self, site_id: int) -> dict:
+        """Return the live_status payload served for a site."""
+        return {
+            "solar_power": 3000 + site_id % 100,
+            "battery_power": -500,
+            "load_power": 1500,
+            "grid_power": -1000,
+            "percentage_charged": 80,
+        }
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        self.requests[request.match_info.route.resource.canonical] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            response = await self._respond(request, handler)
+        finally:
+            self.in_flight -= 1
+        self.statuses[response.status] += 1
+        return response
+
+    async def _respond(self, request: web.Request, handler) -> web.StreamResponse:
+        await asyncio.sleep(self.latency + self._random.uniform(0, self.jitter))
+        if self.faults:
+            fault = self.faults.pop(0)
+            await asyncio.sleep(fault.delay)
+            return web.json_response(
+                {"error": "fault"}, status=fault.status, headers=fault.headers
+            )
+        if self.rate_limit is not None:
+            now = time.monotonic()
+            if now - self._window_start >= self.rate_window:
+                self._window_start = now
+                self._window_requests = 0
+            self._window_requests += 1
+            if self._window_requests > self.rate_limit:
+                return web.json_response(
+                    {"error": "rate limited"},
+                    status=429,
+                    headers={"Retry-After": str(self.retry_after)},
+                )
+        if request.path.startswith(API_PATH):
+            if request.headers.get("Authorization") != f"Bearer {self.access_token}":
+                return web.json_response({"error": "invalid token"}, status=401)
+            if time.time() >= self.token_expires_at:
+                return web.json_response({"error": "token expired"}, status=401)
+            if self.error_rate and self._random.random() < self.error_rate:
+                return web.json_response({"error": "upstream"}, status=500)
+        return await handler(request)
+
+    async def _token(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if body.get("refresh_token") != self.refresh_token:
+            return web.json_response({"error": "invalid_grant"}, status=401)
+        self._tokens_issued += 1
+        self.access_token = f"access-{self._tokens_issued}"
+        self.refresh_token = f"refresh-{self._tokens_issued}"
+        self.token_expires_at = time.time() + self.token_lifetime
+        return web.json_response(
+            {
+                "access_token": self.access_token,
+                "refresh_token": self.refresh_token,
+                "expires_in": self.token_lifetime,
+            }
+        )
+
+    async def _products(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "response": [
+                    {"energy_site_id": site_id, "resource_type": "battery"}
+                    for site_id in self.sites
+                ]
+            }
+        )
+
+    def _site(self, request: web.Request) -> int | None:
+        site_id = int(request.match_info["site_id"])
+        return site_id if site_id in self.sites else None
+
+    async def _live_status(self, request: web.Request) -> web.Response:
+        if (site_id := self._site(request)) is None:
+            return web.json_response({"error": "not found"}, status=404)
+        return web.json_response({"response": self.live_status(site_id)})
+
+    async def _calendar_history(self, request: web.Request) -> web.Response:
+        if self._site(request) is None:
+            return web.json_response({"error": "not found"}, status=404)
+        return web.json_response({"response": {"time_series": []}})
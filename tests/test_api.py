@@ -1,88 +1,289 @@
 """Tests for pw3 api."""
 
 import asyncio
+import json
+import time
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from email.utils import format_datetime
 
 import aiohttp
+import pytest
 from custom_components.pw3.api import (
+    OWNER_API_URL,
+    SSO_TOKEN_URL,
     Pw3ApiClient,
+    Pw3ApiClientAuthenticationError,
+    Pw3ApiClientError,
+    Pw3ApiClientRateLimitError,
+    load_cloud_auth,
+    parse_retry_after,
+    save_cloud_token,
 )
+from custom_components.pw3.ratelimit import RateLimiter
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
+LIVE_STATUS_URL = f"{OWNER_API_URL}/energy_sites/12345/live_status"
+LIVE_STATUS = {
+    "response": {
+        "solar_power": 1500,
+        "battery_power": 2000,
+        "load_power": 3500,
+        "grid_power": -1000,
+        "percentage_charged": 50,
+    }
+}
+TOKEN = {"access_token": "at", "refresh_token": "rt", "expires_at": 1}
 
-async def test_api(hass, aioclient_mock, caplog):
-    """Test API calls."""
 
-    # To test the api submodule, we first create an instance of our API client
-    api = Pw3ApiClient("test", "test", async_get_clientsession(hass))
-
-    # Use aioclient_mock which is provided by `pytest_homeassistant_custom_components`
-    # to mock responses to aiohttp requests. In this case we are telling the mock to
-    # return {"test": "test"} when a `GET` call is made to the specified URL. We then
-    # call `async_get_data` which will make that `GET` request.
-    aioclient_mock.get(
-        "https://jsonplaceholder.typicode.com/posts/1", json={"test": "test"}
-    )
-    assert await api.async_get_data() == {"test": "test"}
-
-    # We do the same for `async_set_title`. Note the difference in the mock call
-    # between the previous step and this one. We use `patch` here instead of `get`
-    # because we know that `async_set_title` calls `api_wrapper` with `patch` as the
-    # first parameter
-    aioclient_mock.patch("https://jsonplaceholder.typicode.com/posts/1")
-    assert await api.async_set_title("test") is None
-
-    # In order to get 100% coverage, we need to test `api_wrapper` to test the code
-    # that isn't already called by `async_get_data` and `async_set_title`. Because the
-    # only logic that lives inside `api_wrapper` that is not being handled by a third
-    # party library (aiohttp) is the exception handling, we also want to simulate
-    # raising the exceptions to ensure that the function handles them as expected.
-    # The caplog fixture allows access to log messages in tests. This is particularly
-    # useful during exception handling testing since often the only action as part of
-    # exception handling is a logging statement
-    caplog.clear()
-    aioclient_mock.put(
-        "https://jsonplaceholder.typicode.com/posts/1", exc=asyncio.TimeoutError
+def _client(hass, **kwargs):
+    token = {**TOKEN, "expires_at": time.time() + 3600}
+    return Pw3ApiClient(
+        "test@example.com",
+        async_get_clientsession(hass),
+        kwargs.pop("token", token),
+        site_id=kwargs.pop("site_id", 12345),
+        **kwargs,
     )
-    assert (
-        await api.api_wrapper("put", "https://jsonplaceholder.typicode.com/posts/1")
-        is None
+
+
+async def test_api_live_data(hass, aioclient_mock):
+    """Test power, grid and SOE are derived from one live_status request."""
+    aioclient_mock.get(LIVE_STATUS_URL, json=LIVE_STATUS)
+    api = _client(hass)
+
+    aggregates, soe = await asyncio.gather(
+        api.async_get_aggregates(), api.async_get_soe()
     )
-    assert (
-        len(caplog.record_tuples) == 1
-        and "Timeout error fetching information from" in caplog.record_tuples[0][2]
+    assert aggregates == {
+        "site": {"instant_power": -1000},
+        "battery": {"instant_power": 2000},
+        "load": {"instant_power": 3500},
+        "solar": {"instant_power": 1500},
+    }
+    assert soe == {"percentage": pytest.approx(52.5)}
+    assert await api.async_get_power() == {
+        "site": -1000,
+        "battery": 2000,
+        "load": 3500,
+        "solar": 1500,
+    }
+    assert await api.async_get_grid() == -1000
+    assert aioclient_mock.call_count == 1
+    assert aioclient_mock.mock_calls[0][3]["Authorization"] == "Bearer at"
+
+
+async def test_api_calendar_history(hass, aioclient_mock):
+    """Test one day of energy history is requested for the local day."""
+    url = f"{OWNER_API_URL}/energy_sites/12345/calendar_history"
+    series = [{"timestamp": "2024-03-01T00:00:00-05:00", "solar_energy_exported": 5}]
+    aioclient_mock.get(url, json={"response": {"time_series": series}})
+    api = _client(hass)
+
+    end_date = datetime(2024, 3, 1, 23, 59, 59, tzinfo=timezone(timedelta(hours=-5)))
+    assert await api.async_get_calendar_history(end_date, "America/New_York") == series
+    assert dict(aioclient_mock.mock_calls[0][1].query) == {
+        "kind": "energy",
+        "period": "day",
+        "end_date": "2024-03-01T23:59:59-05:00",
+        "time_zone": "America/New_York",
+    }
+
+
+async def test_api_site_discovery(hass, aioclient_mock):
+    """Test the first energy site is used when none is configured."""
+    aioclient_mock.get(
+        f"{OWNER_API_URL}/products",
+        json={"response": [{"id": "vehicle"}, {"energy_site_id": 12345}]},
     )
+    api = _client(hass, site_id=None)
 
-    caplog.clear()
+    assert await api.async_get_site_id() == 12345
+    assert api.site_id == 12345
+
+
+async def test_api_site_discovery_without_sites(hass, aioclient_mock):
+    """Test an account without energy sites is an error."""
+    aioclient_mock.get(f"{OWNER_API_URL}/products", json={"response": []})
+    api = _client(hass, site_id=None)
+
+    with pytest.raises(Pw3ApiClientError):
+        await api.async_get_site_id()
+
+
+async def test_api_refreshes_expired_token(hass, aioclient_mock):
+    """Test an expired access token is refreshed and persisted before use."""
     aioclient_mock.post(
-        "https://jsonplaceholder.typicode.com/posts/1", exc=aiohttp.ClientError
-    )
-    assert (
-        await api.api_wrapper("post", "https://jsonplaceholder.typicode.com/posts/1")
-        is None
+        SSO_TOKEN_URL,
+        json={"access_token": "new", "refresh_token": "rt2", "expires_in": 3600},
     )
-    assert (
-        len(caplog.record_tuples) == 1
-        and "Error fetching information from" in caplog.record_tuples[0][2]
+    aioclient_mock.get(LIVE_STATUS_URL, json=LIVE_STATUS)
+    saved = []
+    api = _client(hass, token=TOKEN, token_updater=saved.append)
+
+    await api.async_get_live_status()
+
+    assert saved[0]["access_token"] == "new"
+    assert saved[0]["refresh_token"] == "rt2"
+    assert aioclient_mock.mock_calls[1][3]["Authorization"] == "Bearer new"
+
+
+async def test_api_refreshes_rejected_token(hass, aioclient_mock):
+    """Test a 401 refreshes the token once and retries the request."""
+    aioclient_mock.post(
+        SSO_TOKEN_URL,
+        json={"access_token": "new", "refresh_token": "rt2", "expires_in": 3600},
     )
+    aioclient_mock.get(LIVE_STATUS_URL, status=401)
+    api = _client(hass)
+
+    # A token the API still rejects after the refresh is an auth error
+    with pytest.raises(Pw3ApiClientAuthenticationError):
+        await api.async_get_live_status()
+    assert [call[0].upper() for call in aioclient_mock.mock_calls] == [
+        "GET",
+        "POST",
+        "GET",
+    ]
+    assert aioclient_mock.mock_calls[2][3]["Authorization"] == "Bearer new"
+
 
+async def test_api_token_refresh_errors(hass, aioclient_mock):
+    """Test failed token refreshes raise client errors."""
+    with pytest.raises(Pw3ApiClientAuthenticationError):
+        await _client(hass, token={"access_token": "at"}).async_refresh_token()
+
+    aioclient_mock.post(SSO_TOKEN_URL, status=401)
+    with pytest.raises(Pw3ApiClientAuthenticationError):
+        await _client(hass).async_refresh_token()
+
+    aioclient_mock.clear_requests()
+    aioclient_mock.post(SSO_TOKEN_URL, exc=asyncio.TimeoutError)
+    with pytest.raises(Pw3ApiClientError):
+        await _client(hass).async_refresh_token()
+
+
+async def test_api_errors(hass, aioclient_mock, caplog):
+    """Test transport errors are logged and raised as client errors."""
+    api = _client(hass)
+
+    aioclient_mock.get(LIVE_STATUS_URL, exc=asyncio.TimeoutError)
+    with pytest.raises(Pw3ApiClientError):
+        await api.async_get_live_status()
+    assert "Timeout error fetching information from" in caplog.text
+
+    aioclient_mock.clear_requests()
     caplog.clear()
-    aioclient_mock.post("https://jsonplaceholder.typicode.com/posts/2", exc=Exception)
-    assert (
-        await api.api_wrapper("post", "https://jsonplaceholder.typicode.com/posts/2")
-        is None
-    )
-    assert (
-        len(caplog.record_tuples) == 1
-        and "Something really wrong happened!" in caplog.record_tuples[0][2]
-    )
+    aioclient_mock.get(LIVE_STATUS_URL, exc=aiohttp.ClientError)
+    with pytest.raises(Pw3ApiClientError):
+        await api.async_get_live_status()
+    assert "Error fetching information from" in caplog.text
 
+    aioclient_mock.clear_requests()
     caplog.clear()
-    aioclient_mock.post("https://jsonplaceholder.typicode.com/posts/3", exc=TypeError)
-    assert (
-        await api.api_wrapper("post", "https://jsonplaceholder.typicode.com/posts/3")
-        is None
+    aioclient_mock.get(LIVE_STATUS_URL, text="not json")
+    with pytest.raises(Pw3ApiClientError):
+        await api.async_get_live_status()
+    assert "Error parsing information from" in caplog.text
+
+    aioclient_mock.clear_requests()
+    aioclient_mock.get(LIVE_STATUS_URL, status=403)
+    with pytest.raises(Pw3ApiClientAuthenticationError):
+        await api.async_get_live_status()
+
+
+def test_parse_retry_after():
+    """Test Retry-After is read as seconds or as an HTTP date."""
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after("-5") == 0
+    assert parse_retry_after("soon") is None
+    later = datetime.now(timezone.utc) + timedelta(minutes=2)
+    assert 100 < parse_retry_after(format_datetime(later, usegmt=True)) <= 120
+
+
+async def test_api_rate_limited(hass, aioclient_mock):
+    """Test a 429 honors Retry-After and holds back the account's calls."""
+    aioclient_mock.get(LIVE_STATUS_URL, status=429, headers={"Retry-After": "120"})
+    limiter = RateLimiter()
+    api = _client(hass, limiter=limiter)
+
+    with pytest.raises(Pw3ApiClientRateLimitError) as error:
+        await api.async_get_live_status()
+    assert error.value.retry_after == 120
+    assert limiter.throttle_events == 1
+
+    # The next live read fails fast without a request
+    with pytest.raises(Pw3ApiClientRateLimitError):
+        await api.for_site(67890).async_get_live_status()
+    assert aioclient_mock.call_count == 1
+
+
+async def test_cloud_auth_files(tmp_path):
+    """Test the pypowerwall token cache is read and updated in place."""
+    (tmp_path / ".pypowerwall.auth").write_text(
+        json.dumps({"test@example.com": {"url": "u", "sso": TOKEN}})
     )
-    assert (
-        len(caplog.record_tuples) == 1
-        and "Error parsing information from" in caplog.record_tuples[0][2]
+    (tmp_path / ".pypowerwall.site").write_text("12345")
+
+    assert load_cloud_auth(str(tmp_path), "test@example.com") == (TOKEN, 12345)
+    assert load_cloud_auth(str(tmp_path), "other@example.com") == (None, 12345)
+
+    save_cloud_token(str(tmp_path), "test@example.com", {"access_token": "new"})
+    cache = json.loads((tmp_path / ".pypowerwall.auth").read_text())
+    assert cache["test@example.com"] == {"url": "u", "sso": {"access_token": "new"}}
+
+
+async def test_cloud_auth_files_missing(tmp_path):
+    """Test a missing or unreadable cache reads as no token and no site."""
+    (tmp_path / ".pypowerwall.site").write_text("not a site")
+    assert load_cloud_auth(str(tmp_path), "test@example.com") == (None, None)
+
+    save_cloud_token(str(tmp_path), "test@example.com", {"access_token": "new"})
+    cache = json.loads((tmp_path / ".pypowerwall.auth").read_text())
+    assert cache == {"test@example.com": {"sso": {"access_token": "new"}}}
+
+
+async def test_api_settings_and_commands(hass, aioclient_mock):
+    """Test battery settings are read from site_info and written by command."""
+    site_url = f"{OWNER_API_URL}/energy_sites/12345"
+    aioclient_mock.get(
+        f"{site_url}/site_info",
+        json={
+            "response": {
+                "backup_reserve_percent": 20,
+                "default_real_mode": "self_consumption",
+                "user_settings": {"storm_mode_enabled": True},
+                "components": {"disallow_charge_from_grid_with_solar_installed": True},
+            }
+        },
     )
+    for command in ("backup", "operation", "storm_mode", "grid_import_export"):
+        aioclient_mock.post(f"{site_url}/{command}", json={"response": {}})
+    api = _client(hass)
+
+    assert await api.async_get_settings() == {
+        "backup_reserve": 20,
+        "operation_mode": "self_consumption",
+        "storm_mode": True,
+        "grid_charging": False,
+    }
+
+    await api.async_set_backup_reserve(30)
+    await api.async_set_operation_mode("backup")
+    await api.async_set_storm_mode(False)
+    await api.async_set_grid_charging(True)
+    assert [
+        (str(url).rsplit("/", 1)[-1], data)
+        for method, url, data, _ in aioclient_mock.mock_calls
+        if method == "post"
+    ] == [
+        ("backup", {"backup_reserve_percent": 30}),
+        ("operation", {"default_real_mode": "backup"}),
+        ("storm_mode", {"enabled": False}),
+        (
+            "grid_import_export",
+            {"disallow_charge_from_grid_with_solar_installed": False},
+        ),
+    ]
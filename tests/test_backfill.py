@@ -0,0 +1,143 @@
+"""Tests for pw3 energy history backfill."""
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from unittest.mock import AsyncMock
+from unittest.mock import patch
+
+from custom_components.pw3.api import Pw3ApiClientError
+from custom_components.pw3.backfill import EnergyBackfill
+from custom_components.pw3.backfill import hourly_energy
+from custom_components.pw3.statistics import StatisticsAggregator
+
+NOW = datetime(2024, 3, 10, 2, 30, tzinfo=timezone.utc)
+END = datetime(2024, 3, 10, 2, tzinfo=timezone.utc).timestamp()
+
+
+class FakeHistoryApi:
+    """calendar_history with 25 Wh of solar every 15 minutes."""
+
+    def __init__(self, statistics: StatisticsAggregator, fail_after: int = -1):
+        self.statistics = statistics
+        self.fail_after = fail_after
+        self.days: list[str] = []
+
+    async def async_get_calendar_history(self, end_date, time_zone, kind="energy"):
+        assert self.statistics.paused
+        if len(self.days) == self.fail_after:
+            raise Pw3ApiClientError("rate limited")
+        self.days.append(end_date.date().isoformat())
+        day = end_date.replace(hour=0, minute=0, second=0)
+        return [
+            {
+                "timestamp": (day + timedelta(minutes=15 * i)).isoformat(),
+                "solar_energy_exported": 25,
+                "grid_energy_imported": 0,
+            }
+            for i in range(96)
+        ]
+
+
+def _sums(add_statistics) -> list[float]:
+    return [
+        row["sum"]
+        for call in add_statistics.call_args_list
+        if call.args[1]["statistic_id"] == "pw3:solar_energy"
+        for row in call.args[2]
+    ]
+
+
+def test_hourly_energy():
+    """Test intervals are summed per hour and clipped to the range."""
+    series = [
+        {"timestamp": "2024-03-01T10:00:00Z", "solar_energy_exported": 10},
+        {"timestamp": "2024-03-01T10:30:00Z", "solar_energy_exported": 20},
+        {"timestamp": "2024-03-01T11:00:00Z", "solar_energy_exported": 40},
+        {"timestamp": "bad"},
+    ]
+    start = datetime(2024, 3, 1, 10, tzinfo=timezone.utc).timestamp()
+    hours = hourly_energy(series, start, start + 3600)
+    assert list(hours) == [start]
+    assert hours[start]["solar_energy"] == 30
+    assert hours[start]["home_energy"] == 0
+
+
+async def test_backfill_first_setup(hass, freezer):
+    """Test the last days of history are imported as one continuing sum."""
+    freezer.move_to(NOW)
+    statistics = StatisticsAggregator({}, {"solar_energy": "Wh"})
+    api = FakeHistoryApi(statistics)
+    checkpoint = AsyncMock()
+
+    with patch(
+        "custom_components.pw3.statistics.async_add_external_statistics"
+    ) as add_statistics:
+        imported = await EnergyBackfill(
+            hass, api, statistics, checkpoint, 2, "UTC"
+        ).async_run()
+
+    # Two whole days plus the closed hours of today
+    assert api.days == ["2024-03-08", "2024-03-09", "2024-03-10"]
+    assert imported == 50
+    sums = _sums(add_statistics)
+    assert sums[0] == 100
+    assert sums[-1] == 5000
+    assert statistics.last_hour == END - 3600
+    assert not statistics.paused
+    assert checkpoint.await_count == 2
+
+
+async def test_backfill_fills_gap(hass, freezer):
+    """Test only the hours after the checkpoint are fetched and imported."""
+    freezer.move_to(NOW)
+    statistics = StatisticsAggregator({}, {"solar_energy": "Wh"})
+    statistics.restore({"sums": {"solar_energy": 1000}, "last_hour": END - 3 * 3600})
+    api = FakeHistoryApi(statistics)
+
+    with patch(
+        "custom_components.pw3.statistics.async_add_external_statistics"
+    ) as add_statistics:
+        imported = await EnergyBackfill(
+            hass, api, statistics, AsyncMock(), 7, "UTC"
+        ).async_run()
+
+    assert api.days == ["2024-03-10"]
+    assert imported == 2
+    assert _sums(add_statistics) == [1100, 1200]
+
+
+async def test_backfill_error_resumes(hass, freezer, caplog):
+    """Test a failed request keeps the checkpoint and resumes live imports."""
+    freezer.move_to(NOW)
+    statistics = StatisticsAggregator({}, {"solar_energy": "Wh"})
+    api = FakeHistoryApi(statistics, fail_after=1)
+
+    with patch("custom_components.pw3.statistics.async_add_external_statistics"):
+        imported = await EnergyBackfill(
+            hass, api, statistics, AsyncMock(), 2, "UTC"
+        ).async_run()
+
+    assert imported == 0
+    assert statistics.last_hour is None
+    assert not statistics.paused
+    assert "Energy history backfill stopped" in caplog.text
+
+
+async def test_backfill_nothing_to_do(hass, freezer):
+    """Test no history is fetched when backfill is off or nothing is missing."""
+    freezer.move_to(NOW)
+    statistics = StatisticsAggregator({}, {"solar_energy": "Wh"})
+    api = FakeHistoryApi(statistics)
+    checkpoint = AsyncMock()
+
+    # No checkpoint and no days asked for
+    backfill = EnergyBackfill(hass, api, statistics, checkpoint, 0, "UTC")
+    assert await backfill.async_run() == 0
+
+    # The last closed hour is already imported
+    statistics.last_hour = END - 3600
+    backfill = EnergyBackfill(hass, api, statistics, checkpoint, 2, "UTC")
+    assert await backfill.async_run() == 0
+    assert api.days == []
+    assert not statistics.paused
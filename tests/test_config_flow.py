@@ -3,9 +3,23 @@
 from unittest.mock import patch
 
 import pytest
+import voluptuous as vol
+from custom_components.pw3.const import CONF_BACKFILL_DAYS
+from custom_components.pw3.const import CONF_DEADBANDS
+from custom_components.pw3.const import CONF_FAST_SAMPLE_INTERVAL
+from custom_components.pw3.const import CONF_IMPORT_STATISTICS
+from custom_components.pw3.const import CONF_MAX_INTERVAL
+from custom_components.pw3.const import CONF_MAX_STATE_AGE
+from custom_components.pw3.const import CONF_MIN_INTERVAL
+from custom_components.pw3.const import CONF_NATIVE_API
+from custom_components.pw3.const import DEFAULT_BACKFILL_DAYS
+from custom_components.pw3.const import DEFAULT_MAX_INTERVAL
+from custom_components.pw3.const import DEFAULT_MAX_STATE_AGE
+from custom_components.pw3.const import DEFAULT_MIN_INTERVAL
 from custom_components.pw3.const import DOMAIN
 from homeassistant import config_entries
 from homeassistant import data_entry_flow
+from pytest_homeassistant_custom_component.common import MockConfigEntry
 
 
 # This fixture bypasses the actual setup of the integration
@@ -14,12 +28,15 @@ from homeassistant import data_entry_flow
 @pytest.fixture(autouse=True)
 def bypass_setup_fixture():
     """Prevent setup."""
-    with patch(
-        "custom_components.pw3.async_setup",
-        return_value=True,
-    ), patch(
-        "custom_components.pw3.async_setup_entry",
-        return_value=True,
+    with (
+        patch(
+            "custom_components.pw3.async_setup",
+            return_value=True,
+        ),
+        patch(
+            "custom_components.pw3.async_setup_entry",
+            return_value=True,
+        ),
     ):
         yield
 
@@ -36,13 +53,9 @@ async def test_successful_config_flow(hass, mock_powerwall, mock_config_entry):
     assert result["step_id"] == "user"
 
     # Simulate a successful configuration
-    with patch(
-        "custom_components.pw3.config_flow.Pw3ConfigFlow.async_step_user",
-        return_value={"title": "PW3", "data": mock_config_entry},
-    ):
-        result2 = await hass.config_entries.flow.async_configure(
-            result["flow_id"], mock_config_entry
-        )
+    result2 = await hass.config_entries.flow.async_configure(
+        result["flow_id"], mock_config_entry
+    )
 
     # Check that the config flow is complete and a new entry is created with
     # the input data
@@ -73,31 +86,169 @@ async def test_failed_config_flow(hass, mock_powerwall):
     assert result2["errors"] == {"pw_email": "invalid_email"}
 
 
-# Our config flow also has an options flow, so we must test it as well.
-# async def test_options_flow(hass):
-#     """Test an options flow."""
-#     # Create a new MockConfigEntry and add to HASS (we're bypassing config
-#     # flow entirely)
-#     entry = MockConfigEntry(domain=DOMAIN, data=MOCK_CONFIG, entry_id="test")
-#     entry.add_to_hass(hass)
+async def test_gateway_config_flow(hass, mock_powerwall, mock_config_entry):
+    """Test a gateway host needs its password and is stored with the entry."""
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": config_entries.SOURCE_USER}
+    )
+
+    result2 = await hass.config_entries.flow.async_configure(
+        result["flow_id"], {**mock_config_entry, "pw_host": "192.168.91.1"}
+    )
+    assert result2["type"] == data_entry_flow.RESULT_TYPE_FORM
+    assert result2["errors"] == {"pw_gw_password": "gateway_password_required"}
+
+    user_input = {
+        **mock_config_entry,
+        "pw_host": "192.168.91.1",
+        "pw_gw_password": "ABCDEFGHIJ",
+    }
+    result3 = await hass.config_entries.flow.async_configure(
+        result2["flow_id"], user_input
+    )
+    assert result3["type"] == data_entry_flow.RESULT_TYPE_CREATE_ENTRY
+    assert result3["data"] == user_input
+
+
+async def test_site_config_flow(hass, mock_powerwall, mock_config_entry):
+    """Test a site chosen in the user step is stored and only added once."""
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": config_entries.SOURCE_USER}
+    )
+    result2 = await hass.config_entries.flow.async_configure(
+        result["flow_id"], {**mock_config_entry, "pw_site_id": "67890"}
+    )
+    assert result2["type"] == data_entry_flow.RESULT_TYPE_CREATE_ENTRY
+    assert result2["data"] == {**mock_config_entry, "pw_site_id": 67890}
+    assert result2["result"].unique_id == "67890"
+
+    # Discovery of the same site is not offered again
+    result3 = await hass.config_entries.flow.async_init(
+        DOMAIN,
+        context={"source": config_entries.SOURCE_INTEGRATION_DISCOVERY},
+        data={**mock_config_entry, "pw_site_id": 67890},
+    )
+    assert result3["type"] == data_entry_flow.RESULT_TYPE_ABORT
+    assert result3["reason"] == "already_configured"
 
-#     # Initialize an options flow
-#     await hass.config_entries.async_setup(entry.entry_id)
-#     result = await hass.config_entries.options.async_init(entry.entry_id)
 
-#     # Verify that the first options step is a user form
-#     assert result["type"] == data_entry_flow.RESULT_TYPE_FORM
-#     assert result["step_id"] == "user"
+async def test_discovered_site_config_flow(hass, mock_config_entry):
+    """Test another site on the account is offered once and confirmed."""
+    discovery = {**mock_config_entry, "pw_site_id": 67890}
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN,
+        context={"source": config_entries.SOURCE_INTEGRATION_DISCOVERY},
+        data=discovery,
+    )
+    assert result["type"] == data_entry_flow.RESULT_TYPE_FORM
+    assert result["step_id"] == "discovery_confirm"
 
-#     # Enter some fake data into the form
-#     result = await hass.config_entries.options.async_configure(
-#         result["flow_id"],
-#         user_input={platform: platform != SENSOR for platform in PLATFORMS},
-#     )
+    result2 = await hass.config_entries.flow.async_configure(result["flow_id"], {})
+    assert result2["type"] == data_entry_flow.RESULT_TYPE_CREATE_ENTRY
+    assert result2["data"] == discovery
+    assert result2["options"] == {"native_api": True}
+
+    result3 = await hass.config_entries.flow.async_init(
+        DOMAIN,
+        context={"source": config_entries.SOURCE_INTEGRATION_DISCOVERY},
+        data=discovery,
+    )
+    assert result3["type"] == data_entry_flow.RESULT_TYPE_ABORT
+    assert result3["reason"] == "already_configured"
 
-#     # Verify that the flow finishes
-#     assert result["type"] == data_entry_flow.RESULT_TYPE_CREATE_ENTRY
-#     assert result["title"] == "test_username"
 
-#     # Verify that the options were updated
-#     assert entry.options == {BINARY_SENSOR: True, SENSOR: False, SWITCH: True}
+async def test_options_flow(hass):
+    """Test the options flow updates options and keeps the ones it doesn't show."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={"pw_email": "test@example.com"},
+        options={CONF_NATIVE_API: True},
+        entry_id="test",
+    )
+    entry.add_to_hass(hass)
+
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    assert result["type"] == data_entry_flow.RESULT_TYPE_FORM
+    assert result["step_id"] == "user"
+
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], user_input={CONF_FAST_SAMPLE_INTERVAL: 2}
+    )
+    assert result["type"] == data_entry_flow.RESULT_TYPE_CREATE_ENTRY
+    assert entry.options == {
+        CONF_NATIVE_API: True,
+        CONF_MIN_INTERVAL: DEFAULT_MIN_INTERVAL.total_seconds(),
+        CONF_MAX_INTERVAL: DEFAULT_MAX_INTERVAL.total_seconds(),
+        CONF_MAX_STATE_AGE: DEFAULT_MAX_STATE_AGE.total_seconds(),
+        CONF_DEADBANDS: {},
+        CONF_FAST_SAMPLE_INTERVAL: 2.0,
+        CONF_IMPORT_STATISTICS: False,
+        CONF_BACKFILL_DAYS: DEFAULT_BACKFILL_DAYS,
+    }
+
+    # Statistics import and its backfill are turned on from the same form
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"],
+        user_input={CONF_IMPORT_STATISTICS: True, CONF_BACKFILL_DAYS: 30},
+    )
+    assert entry.options[CONF_IMPORT_STATISTICS] is True
+    assert entry.options[CONF_BACKFILL_DAYS] == 30
+    assert entry.options[CONF_FAST_SAMPLE_INTERVAL] == 2.0
+
+
+async def test_options_flow_intervals(hass):
+    """Test the refresh interval bounds are set from the options form."""
+    entry = MockConfigEntry(
+        domain=DOMAIN, data={"pw_email": "test@example.com"}, entry_id="test"
+    )
+    entry.add_to_hass(hass)
+
+    # The longest interval can't be below the shortest
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"],
+        user_input={CONF_MIN_INTERVAL: 60, CONF_MAX_INTERVAL: 30},
+    )
+    assert result["type"] == data_entry_flow.RESULT_TYPE_FORM
+    assert result["errors"] == {CONF_MAX_INTERVAL: "max_interval_below_min"}
+
+    # Nor outside the offered range
+    with pytest.raises(vol.Invalid):
+        await hass.config_entries.options.async_configure(
+            result["flow_id"], user_input={CONF_MIN_INTERVAL: 1}
+        )
+
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"],
+        user_input={CONF_MIN_INTERVAL: 30, CONF_MAX_INTERVAL: 600},
+    )
+    assert result["type"] == data_entry_flow.RESULT_TYPE_CREATE_ENTRY
+    assert entry.options[CONF_MIN_INTERVAL] == 30.0
+    assert entry.options[CONF_MAX_INTERVAL] == 600.0
+
+
+async def test_options_flow_state_writes(hass):
+    """Test the heartbeat and per-sensor deadbands are set from the options form."""
+    entry = MockConfigEntry(
+        domain=DOMAIN, data={"pw_email": "test@example.com"}, entry_id="test"
+    )
+    entry.add_to_hass(hass)
+
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    # Deadbands can't be negative
+    with pytest.raises(vol.Invalid):
+        await hass.config_entries.options.async_configure(
+            result["flow_id"], user_input={CONF_DEADBANDS: {"solar": -1}}
+        )
+
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"],
+        user_input={
+            CONF_MAX_STATE_AGE: 300,
+            CONF_DEADBANDS: {"solar": 20, "percentage": "0.5"},
+        },
+    )
+    assert result["type"] == data_entry_flow.RESULT_TYPE_CREATE_ENTRY
+    assert entry.options[CONF_MAX_STATE_AGE] == 300.0
+    assert entry.options[CONF_DEADBANDS] == {"solar": 20.0, "percentage": 0.5}
@@ -0,0 +1,437 @@
+"""Tests for pw3 battery controls."""
+
+import asyncio
+import time
+from datetime import timedelta
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+from custom_components.pw3.api import OWNER_API_URL
+from custom_components.pw3.api import Pw3ApiClientError
+from custom_components.pw3.api import Pw3ApiClientRateLimitError
+from custom_components.pw3.const import CONF_NATIVE_API
+from custom_components.pw3.const import DOMAIN
+from custom_components.pw3.control import BACKUP_RESERVE
+from custom_components.pw3.control import COMMAND_DEBOUNCE
+from custom_components.pw3.control import GRID_CHARGING
+from custom_components.pw3.control import OPERATION_MODE
+from custom_components.pw3.control import STORM_MODE
+from custom_components.pw3.control import CommandQueue
+from custom_components.pw3.control import PowerwallControlClient
+from custom_components.pw3.coordinator import Pw3DataUpdateCoordinator
+from custom_components.pw3.metrics import REFRESH
+from custom_components.pw3.ratelimit import CONTROL
+from custom_components.pw3.ratelimit import RateLimiter
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+SITE_URL = f"{OWNER_API_URL}/energy_sites/12345"
+SITE_INFO = {
+    "response": {
+        "backup_reserve_percent": 20,
+        "default_real_mode": "self_consumption",
+        "user_settings": {"storm_mode_enabled": True},
+        "components": {},
+    }
+}
+LIVE_STATUS = {
+    "response": {
+        "solar_power": 1500,
+        "battery_power": 2000,
+        "load_power": 3500,
+        "grid_power": -1000,
+        "percentage_charged": 50,
+    }
+}
+
+
+class FakeApi:
+    """Records commands; fails those listed in fail."""
+
+    def __init__(self, fail=()):
+        self.commands = []
+        self.fail = fail
+
+    async def async_get_settings(self):
+        return {BACKUP_RESERVE: 20, OPERATION_MODE: "self_consumption"}
+
+    async def _async_command(self, key, value):
+        if key in self.fail:
+            raise Pw3ApiClientError("rejected")
+        self.commands.append((key, value))
+
+    async def async_set_backup_reserve(self, percent):
+        await self._async_command(BACKUP_RESERVE, percent)
+
+    async def async_set_operation_mode(self, mode):
+        await self._async_command(OPERATION_MODE, mode)
+
+    async def async_set_storm_mode(self, enabled):
+        await self._async_command(STORM_MODE, enabled)
+
+    async def async_set_grid_charging(self, enabled):
+        pass
+
+
+def _fire_debounce(hass):
+    async_fire_time_changed(
+        hass, dt_util.utcnow() + timedelta(seconds=COMMAND_DEBOUNCE + 1)
+    )
+
+
+async def test_command_queue_batches(hass):
+    """Test changes apply at once and are written as one debounced batch."""
+    api = FakeApi()
+    coordinator = Pw3DataUpdateCoordinator(hass, None)
+    controls = CommandQueue(hass, api, coordinator)
+    await controls.async_load()
+    updates = []
+    controls.async_add_listener(lambda: updates.append(dict(controls.settings)))
+
+    with patch.object(coordinator, "async_request_refresh") as refresh:
+        for percent in (30, 35, 40):
+            await controls.async_set(BACKUP_RESERVE, percent)
+        await controls.async_set(OPERATION_MODE, "backup")
+        # Toggled back before the flush, so nothing to send
+        await controls.async_set(OPERATION_MODE, "self_consumption")
+        await controls.async_set(STORM_MODE, True)
+
+        assert controls.settings[BACKUP_RESERVE] == 40
+        assert coordinator.forecaster.reserve == 40
+        assert len(updates) == 6
+        assert api.commands == []
+
+        _fire_debounce(hass)
+        await hass.async_block_till_done()
+
+    assert api.commands == [(BACKUP_RESERVE, 40), (STORM_MODE, True)]
+    assert controls.confirmed[BACKUP_RESERVE] == 40
+    assert controls.commands_sent == 2
+    refresh.assert_awaited_once()
+    controls.async_shutdown()
+
+
+async def test_command_queue_reverts_failed_command(hass, caplog):
+    """Test a rejected command puts its setting back to the confirmed value."""
+    api = FakeApi(fail=(BACKUP_RESERVE,))
+    coordinator = Pw3DataUpdateCoordinator(hass, None)
+    controls = CommandQueue(hass, api, coordinator)
+    await controls.async_load()
+
+    with patch.object(coordinator, "async_request_refresh") as refresh:
+        await controls.async_set(BACKUP_RESERVE, 80)
+        await controls.async_set(OPERATION_MODE, "autonomous")
+        _fire_debounce(hass)
+        await hass.async_block_till_done()
+
+    assert controls.settings == {BACKUP_RESERVE: 20, OPERATION_MODE: "autonomous"}
+    assert coordinator.forecaster.reserve == 20
+    assert api.commands == [(OPERATION_MODE, "autonomous")]
+    assert "Error setting Powerwall backup_reserve to 80" in caplog.text
+    refresh.assert_awaited_once()
+    controls.async_shutdown()
+
+
+async def test_command_queue_change_during_write(hass):
+    """Test a change made while a batch is being written goes out next."""
+    api = FakeApi()
+    coordinator = Pw3DataUpdateCoordinator(hass, None)
+    controls = CommandQueue(hass, api, coordinator)
+    await controls.async_load()
+    writing = asyncio.Event()
+    release = asyncio.Event()
+    command = api._async_command
+
+    async def slow_command(key, value):
+        writing.set()
+        await release.wait()
+        await command(key, value)
+
+    with (
+        patch.object(api, "_async_command", slow_command),
+        patch.object(coordinator, "async_request_refresh") as refresh,
+    ):
+        await controls.async_set(BACKUP_RESERVE, 30)
+        _fire_debounce(hass)
+        await writing.wait()
+        await controls.async_set(BACKUP_RESERVE, 50)
+        release.set()
+        await hass.async_block_till_done()
+        assert api.commands == [(BACKUP_RESERVE, 30)]
+        assert controls.pending == {BACKUP_RESERVE: 50}
+
+        _fire_debounce(hass)
+        await hass.async_block_till_done()
+
+    assert api.commands == [(BACKUP_RESERVE, 30), (BACKUP_RESERVE, 50)]
+    assert controls.pending == {}
+    assert controls.confirmed[BACKUP_RESERVE] == 50
+    assert refresh.await_count == 2
+    controls.async_shutdown()
+
+
+async def test_command_queue_cooldown_ends_during_write(hass):
+    """Test a change whose cooldown ends mid-write is sent after that write."""
+    api = FakeApi()
+    coordinator = Pw3DataUpdateCoordinator(hass, None)
+    controls = CommandQueue(hass, api, coordinator)
+    await controls.async_load()
+    writing = asyncio.Event()
+    release = asyncio.Event()
+    command = api._async_command
+
+    async def slow_command(key, value):
+        writing.set()
+        await release.wait()
+        await command(key, value)
+
+    with (
+        patch.object(api, "_async_command", slow_command),
+        patch.object(coordinator, "async_request_refresh"),
+    ):
+        await controls.async_set(BACKUP_RESERVE, 30)
+        _fire_debounce(hass)
+        await writing.wait()
+        await controls.async_set(BACKUP_RESERVE, 50)
+        # Due while the first batch is still being written
+        _fire_debounce(hass)
+        await asyncio.sleep(0)
+        release.set()
+        await hass.async_block_till_done()
+        assert api.commands == [(BACKUP_RESERVE, 30)]
+
+        _fire_debounce(hass)
+        await hass.async_block_till_done()
+
+    assert api.commands == [(BACKUP_RESERVE, 30), (BACKUP_RESERVE, 50)]
+    controls.async_shutdown()
+
+
+async def test_command_queue_load_error(hass, caplog):
+    """Test settings that can't be read leave the controls unavailable."""
+    api = FakeApi()
+    coordinator = Pw3DataUpdateCoordinator(hass, None)
+    controls = CommandQueue(hass, api, coordinator)
+
+    with patch.object(
+        api, "async_get_settings", side_effect=Pw3ApiClientError("offline")
+    ):
+        await controls.async_load()
+
+    assert controls.settings == {}
+    assert "Error reading Powerwall settings: offline" in caplog.text
+
+
+async def test_command_queue_long_drag(hass, freezer):
+    """Test a drag longer than the cooldown is still sent as one command."""
+    api = FakeApi()
+    coordinator = Pw3DataUpdateCoordinator(hass, None)
+    controls = CommandQueue(hass, api, coordinator)
+    await controls.async_load()
+
+    with patch.object(coordinator, "async_request_refresh"):
+        # A change every second for five seconds, against a 2 s cooldown
+        for percent in range(30, 36):
+            await controls.async_set(BACKUP_RESERVE, percent)
+            freezer.tick(COMMAND_DEBOUNCE / 2)
+            async_fire_time_changed(hass)
+            await hass.async_block_till_done()
+        assert api.commands == []
+
+        freezer.tick(COMMAND_DEBOUNCE)
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+
+    assert api.commands == [(BACKUP_RESERVE, 35)]
+    controls.async_shutdown()
+
+
+async def test_command_queue_shutdown_drops_changes(hass):
+    """Test changes not yet sent are dropped when the entry unloads."""
+    api = FakeApi()
+    coordinator = Pw3DataUpdateCoordinator(hass, None)
+    controls = CommandQueue(hass, api, coordinator)
+    await controls.async_load()
+
+    await controls.async_set(BACKUP_RESERVE, 30)
+    controls.async_shutdown()
+    _fire_debounce(hass)
+    await hass.async_block_till_done()
+
+    assert api.commands == []
+    assert controls.pending == {}
+
+
+async def test_control_entities(hass, aioclient_mock, mock_config_entry):
+    """Test native entries get control entities that write through the queue."""
+    aioclient_mock.get(
+        f"{OWNER_API_URL}/products", json={"response": [{"energy_site_id": 12345}]}
+    )
+    aioclient_mock.get(f"{SITE_URL}/live_status", json=LIVE_STATUS)
+    aioclient_mock.get(f"{SITE_URL}/site_info", json=SITE_INFO)
+    for command in ("backup", "operation"):
+        aioclient_mock.post(f"{SITE_URL}/{command}", json={"response": {}})
+    token = {
+        "access_token": "at",
+        "refresh_token": "rt",
+        "expires_at": time.time() + 3600,
+    }
+
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data=mock_config_entry,
+        options={CONF_NATIVE_API: True},
+        entry_id="test",
+    )
+    entry.add_to_hass(hass)
+    with patch("custom_components.pw3.load_cloud_auth", return_value=(token, 12345)):
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    assert hass.states.get("number.pw_backup_reserve").state == "20"
+    assert hass.states.get("select.pw_operation_mode").state == "self_consumption"
+    assert hass.states.get("switch.pw_storm_watch").state == "on"
+    assert hass.states.get("switch.pw_grid_charging").state == "on"
+
+    def calls(path):
+        return sum(
+            1 for _, url, _, _ in aioclient_mock.mock_calls if url.path.endswith(path)
+        )
+
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    refreshes = coordinator.metrics.get(REFRESH).count
+    for value in (30, 40):
+        await hass.services.async_call(
+            "number",
+            "set_value",
+            {"entity_id": "number.pw_backup_reserve", "value": value},
+            blocking=True,
+        )
+    await hass.services.async_call(
+        "select",
+        "select_option",
+        {"entity_id": "select.pw_operation_mode", "option": "backup"},
+        blocking=True,
+    )
+    assert hass.states.get("number.pw_backup_reserve").state == "40"
+    assert hass.states.get("select.pw_operation_mode").state == "backup"
+    assert calls("/backup") == 0
+
+    _fire_debounce(hass)
+    await hass.async_block_till_done()
+
+    assert [
+        data for method, _, data, _ in aioclient_mock.mock_calls if method == "post"
+    ] == [{"backup_reserve_percent": 40}, {"default_real_mode": "backup"}]
+    assert coordinator.metrics.get(REFRESH).count == refreshes + 1
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+    assert hass.states.get("number.pw_backup_reserve").state == "unavailable"
+
+
+async def test_pypowerwall_controls(hass):
+    """Test pypowerwall entries write settings on the limiter's control lane."""
+    pw = MagicMock()
+    pw.get_reserve.return_value = 19.6
+    pw.get_mode.return_value = "self_consumption"
+    pw.get_grid_charging.return_value = None
+    pw.set_mode.return_value = None
+    limiter = RateLimiter()
+    coordinator = Pw3DataUpdateCoordinator(hass, pw, limiter=limiter)
+    controls = CommandQueue(hass, PowerwallControlClient(coordinator), coordinator)
+    assert controls.supported == {BACKUP_RESERVE, OPERATION_MODE, GRID_CHARGING}
+
+    with patch.object(limiter, "async_acquire", wraps=limiter.async_acquire) as acquire:
+        await controls.async_load()
+        # Grid charging is not available in this mode, so it is left out
+        assert controls.settings == {
+            BACKUP_RESERVE: 20,
+            OPERATION_MODE: "self_consumption",
+        }
+
+        with patch.object(coordinator, "async_request_refresh") as refresh:
+            await controls.async_set(BACKUP_RESERVE, 40)
+            await controls.async_set(OPERATION_MODE, "backup")
+            _fire_debounce(hass)
+            await hass.async_block_till_done()
+
+    pw.set_reserve.assert_called_once_with(40)
+    # pypowerwall returned None, so the mode change is reverted
+    pw.set_mode.assert_called_once_with("backup")
+    assert controls.settings[OPERATION_MODE] == "self_consumption"
+    assert controls.confirmed[BACKUP_RESERVE] == 40
+    assert {call.args[0] for call in acquire.call_args_list} == {CONTROL}
+    refresh.assert_awaited_once()
+    controls.async_shutdown()
+
+
+async def test_pypowerwall_control_errors(hass):
+    """Test pypowerwall failures are raised as client errors."""
+    pw = MagicMock()
+    coordinator = Pw3DataUpdateCoordinator(hass, pw)
+    client = PowerwallControlClient(coordinator)
+
+    pw.set_grid_charging.return_value = True
+    await client.async_set_grid_charging(False)
+    pw.set_grid_charging.assert_called_once_with(False)
+
+    pw.set_reserve.side_effect = ValueError("bad reserve")
+    with pytest.raises(Pw3ApiClientError, match="pypowerwall error: bad reserve"):
+        await client.async_set_backup_reserve(40)
+
+    with (
+        patch.object(
+            coordinator, "async_control_job", side_effect=asyncio.TimeoutError
+        ),
+        pytest.raises(Pw3ApiClientError, match="Timed out"),
+    ):
+        await client.async_set_operation_mode("backup")
+
+    with (
+        patch.object(
+            coordinator,
+            "async_control_job",
+            side_effect=Pw3ApiClientRateLimitError("held back"),
+        ),
+        pytest.raises(Pw3ApiClientRateLimitError),
+    ):
+        await client.async_get_settings()
+
+
+async def test_pypowerwall_control_entities(hass, mock_pw_data, mock_config_entry):
+    """Test the default pypowerwall entry gets controls, without Storm Watch."""
+    entry = MockConfigEntry(domain=DOMAIN, data=mock_config_entry, entry_id="test")
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    await hass.data[DOMAIN][entry.entry_id].controls.async_load()
+    await hass.async_block_till_done()
+
+    assert hass.states.get("number.pw_backup_reserve").state == "20"
+    assert hass.states.get("switch.pw_grid_charging").state == "on"
+    assert hass.states.get("switch.pw_storm_watch") is None
+
+    await hass.services.async_call(
+        "number",
+        "set_value",
+        {"entity_id": "number.pw_backup_reserve", "value": 35},
+        blocking=True,
+    )
+    await hass.services.async_call(
+        "switch", "turn_off", {"entity_id": "switch.pw_grid_charging"}, blocking=True
+    )
+    assert hass.states.get("switch.pw_grid_charging").state == "off"
+    await hass.services.async_call(
+        "switch", "turn_on", {"entity_id": "switch.pw_grid_charging"}, blocking=True
+    )
+    _fire_debounce(hass)
+    await hass.async_block_till_done()
+    mock_pw_data.set_reserve.assert_called_once_with(35)
+    # Turned back on before the write, so grid charging is left alone
+    mock_pw_data.set_grid_charging.assert_not_called()
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
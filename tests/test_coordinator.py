@@ -1,34 +1,716 @@
+import asyncio
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
 import pytest
+from custom_components.pw3.api import OWNER_API_URL
+from custom_components.pw3.api import Pw3ApiClient
+from custom_components.pw3.api import Pw3ApiClientError
+from custom_components.pw3.coordinator import FORECAST_FIELDS
+from custom_components.pw3.coordinator import SITE_SLOTS
+from custom_components.pw3.coordinator import AdaptiveInterval
+from custom_components.pw3.coordinator import Pw3AccountCoordinator
 from custom_components.pw3.coordinator import Pw3DataUpdateCoordinator
+from custom_components.pw3.coordinator import SoeForecaster
+from custom_components.pw3.derived import DERIVED_FIELDS
+from custom_components.pw3.entity import device_info
+from custom_components.pw3.profiler import RefreshProfiler
+from custom_components.pw3.ratelimit import RateLimiter
+from custom_components.pw3.source import BREAKER_RESET
+from custom_components.pw3.source import BREAKER_THRESHOLD
+from custom_components.pw3.source import CLOSED
+from custom_components.pw3.source import CLOUD
+from custom_components.pw3.source import FAILOVER_THRESHOLD
+from custom_components.pw3.source import LOCAL
+from custom_components.pw3.source import OPEN
+from custom_components.pw3.source import RECOVERY_INTERVAL
+from custom_components.pw3.source import DataSource
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.helpers.update_coordinator import UpdateFailed
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+# Ratios of the first sample: instantaneous only, as no energy has been
+# integrated yet. There is too little SOE history for forecasts.
+DERIVED = {
+    **dict.fromkeys(DERIVED_FIELDS),
+    **dict.fromkeys(FORECAST_FIELDS),
+    "self_consumption": 33.3,
+    "solar_fraction": 14.3,
+    "self_sufficiency": 100.0,
+}
 
 
 async def test_coordinator_update(hass, mock_powerwall):
     """Test coordinator update."""
-    mock_powerwall.solar.return_value = {
-        "last_communication_time": "2023-05-01T12:00:00Z"
-    }
     mock_powerwall.power.return_value = {"solar": 1500, "battery": 2000, "load": 3500}
     mock_powerwall.grid.return_value = -1000
     mock_powerwall.poll.return_value = {"percentage": 75.5}
 
+    coordinator = Pw3DataUpdateCoordinator(hass, mock_powerwall, aggregate=False)
+    data = await coordinator._async_update_data()
+
+    assert data == {
+        "solar": 1500,
+        "home": 3500,
+        "battery_consumption": 2000,
+        "battery_production": 0,
+        "grid_consumption": 0,
+        "grid_production": 1000,
+        "percentage": 75.5,
+        "solar_energy": 0,
+        "home_energy": 0,
+        "battery_consumption_energy": 0,
+        "battery_production_energy": 0,
+        "grid_consumption_energy": 0,
+        "grid_production_energy": 0,
+        **DERIVED,
+        "stale": [],
+        "source": "cloud",
+        "last_updated": data["last_updated"],
+    }
+    assert coordinator.upstream_calls == 3
+
+
+async def test_coordinator_aggregate_update(hass, mock_powerwall):
+    """Test power and grid are derived from a single aggregates poll."""
+    aggregates = {
+        "site": {"instant_power": -1000},
+        "battery": {"instant_power": 2000},
+        "load": {"instant_power": 3500},
+        "solar": {"instant_power": 1500},
+    }
+    mock_powerwall.poll.side_effect = lambda api: {
+        "/api/meters/aggregates": aggregates,
+        "/api/system_status/soe": {"percentage": 75.5},
+    }[api]
+
     coordinator = Pw3DataUpdateCoordinator(hass, mock_powerwall)
-    await coordinator._async_update_data()
+    data = await coordinator._async_update_data()
 
-    assert coordinator.data == {
-        "solar": 1.5,
-        "battery": 2.0,
-        "home": 3.5,
-        "grid": -1.0,
+    assert data == {
+        "solar": 1500,
+        "home": 3500,
+        "battery_consumption": 2000,
+        "battery_production": 0,
+        "grid_consumption": 0,
+        "grid_production": 1000,
         "percentage": 75.5,
-        "last_updated": "2023-05-01T12:00:00Z",
+        "solar_energy": 0,
+        "home_energy": 0,
+        "battery_consumption_energy": 0,
+        "battery_production_energy": 0,
+        "grid_consumption_energy": 0,
+        "grid_production_energy": 0,
+        **DERIVED,
+        "stale": [],
+        "source": "cloud",
+        "last_updated": data["last_updated"],
     }
+    assert coordinator.upstream_calls == 2
+    mock_powerwall.power.assert_not_called()
+    mock_powerwall.grid.assert_not_called()
 
 
 async def test_coordinator_update_failure(hass, mock_powerwall):
     """Test coordinator update failure."""
-    mock_powerwall.solar.return_value = None
+    mock_powerwall.power.side_effect = Exception
+    mock_powerwall.grid.side_effect = Exception
+    mock_powerwall.poll.side_effect = Exception
 
     coordinator = Pw3DataUpdateCoordinator(hass, mock_powerwall)
     with pytest.raises(UpdateFailed):
         await coordinator._async_update_data()
+
+
+class FakePowerwall:
+    """Powerwall stand-in with plain methods, so reads really run in the executor."""
+
+    def __init__(self, delay=0.0, grid_delay=None):
+        self.delay = delay
+        self.grid_delay = delay if grid_delay is None else grid_delay
+
+    def power(self):
+        time.sleep(self.delay)
+        return {"solar": 1500, "battery": -200, "load": 3500}
+
+    def grid(self):
+        time.sleep(self.grid_delay)
+        return -1000
+
+    def poll(self, api):
+        if api == "/api/meters/aggregates":
+            time.sleep(self.grid_delay)
+            return {
+                "site": {"instant_power": -1000},
+                "battery": {"instant_power": -200},
+                "load": {"instant_power": 3500},
+                "solar": {"instant_power": 1500},
+            }
+        time.sleep(self.delay)
+        return {"percentage": 75.5}
+
+
+async def test_coordinator_partial_update(hass, caplog):
+    """Test a timed out read is published as stale while the others update."""
+    coordinator = Pw3DataUpdateCoordinator(
+        hass, FakePowerwall(grid_delay=0.5), aggregate=False
+    )
+    coordinator.data = {"grid_consumption": 10, "grid_production": 0}
+
+    with patch("custom_components.pw3.coordinator.FETCH_TIMEOUT", 0.1):
+        start = time.monotonic()
+        data = await coordinator._async_update_data()
+        elapsed = time.monotonic() - start
+
+    assert elapsed < 0.4
+    assert data["solar"] == 1500
+    assert data["battery_production"] == 200
+    assert data["percentage"] == 75.5
+    assert data["grid_consumption"] == 10
+    assert data["stale"] == ["grid_consumption", "grid_production"]
+    # The executor's deadline ends first and names the stuck call
+    assert "Error reading Powerwall grid: Powerwall call still running" in caplog.text
+    assert "Timed out" not in caplog.text
+
+
+async def test_coordinator_cloud_reads_held_back(hass, caplog):
+    """Test cloud reads give up on a backed-off limiter inside their deadline."""
+    limiter = RateLimiter()
+    limiter.throttle(120)
+    coordinator = Pw3DataUpdateCoordinator(hass, FakePowerwall(), limiter=limiter)
+
+    with pytest.raises(UpdateFailed):
+        await coordinator._async_update_data()
+
+    assert "Error reading Powerwall soe: Tesla API calls held back" in caplog.text
+    assert coordinator.executor.pending == 0
+    # The site waits out the backoff before its next refresh
+    assert coordinator.poll_interval >= timedelta(seconds=119)
+
+
+async def test_coordinator_reads_run_concurrently(hass):
+    """Test refresh wall time tracks the slowest read, not the sum of reads."""
+    coordinator = Pw3DataUpdateCoordinator(
+        hass, FakePowerwall(delay=0.2), aggregate=False
+    )
+
+    start = time.monotonic()
+    data = await coordinator._async_update_data()
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 0.5
+    assert data["stale"] == []
+
+
+class FakeApi:
+    """Native client stand-in exposing the async read methods."""
+
+    async def async_get_aggregates(self):
+        return {
+            "site": {"instant_power": 300},
+            "battery": {"instant_power": 0},
+            "load": {"instant_power": 300},
+            "solar": {"instant_power": 0},
+        }
+
+    async def async_get_power(self):
+        return {"solar": 0, "battery": 0, "load": 300}
+
+    async def async_get_grid(self):
+        return 300
+
+    async def async_get_soe(self):
+        return {"percentage": 40}
+
+
+async def test_coordinator_native_api(hass):
+    """Test reads go through the native client when one is configured."""
+    coordinator = Pw3DataUpdateCoordinator(hass, None, api=FakeApi())
+    data = await coordinator._async_update_data()
+
+    assert data["grid_consumption"] == 300
+    assert data["percentage"] == 40
+    assert data["stale"] == []
+
+    # Without aggregates, power and grid are read separately
+    coordinator = Pw3DataUpdateCoordinator(hass, None, api=FakeApi(), aggregate=False)
+    data = await coordinator._async_update_data()
+
+    assert data["grid_consumption"] == 300
+    assert data["stale"] == []
+    assert coordinator.upstream_calls == 3
+
+
+class SlowApi(FakeApi):
+    """Native client stand-in whose SOE read never answers in time."""
+
+    async def async_get_soe(self):
+        await asyncio.sleep(1)
+
+
+async def test_coordinator_native_api_timeout(hass, caplog):
+    """Test a native read past FETCH_TIMEOUT is published as stale."""
+    coordinator = Pw3DataUpdateCoordinator(hass, None, api=SlowApi())
+
+    with patch("custom_components.pw3.coordinator.FETCH_TIMEOUT", 0.05):
+        data = await coordinator._async_update_data()
+
+    assert data["grid_consumption"] == 300
+    assert data["stale"] == ["percentage"]
+    assert "Timed out after 0.05s reading Powerwall soe" in caplog.text
+
+
+async def test_coordinator_without_entry(hass):
+    """Test a coordinator without a config entry has nothing to load."""
+    coordinator = Pw3DataUpdateCoordinator(hass, None, api=FakeApi())
+
+    await coordinator.async_load_energy()
+    await coordinator.async_load_statistics()
+    assert not await coordinator.async_load_cache()
+    assert coordinator.data is None
+    assert device_info(coordinator) is None
+
+
+async def test_coordinator_profiler_done(hass):
+    """Test a profiler with no refreshes left is dropped unused."""
+    coordinator = Pw3DataUpdateCoordinator(hass, None, api=FakeApi())
+    coordinator.profiler = RefreshProfiler(0)
+
+    await coordinator.async_refresh()
+
+    assert coordinator.profiler is None
+    assert coordinator.last_update_success
+
+
+def test_adaptive_interval():
+    """Test the polling interval tracks power-flow volatility within bounds."""
+    scheduler = AdaptiveInterval(timedelta(seconds=15), timedelta(minutes=5))
+    assert scheduler.interval == timedelta(minutes=1)
+
+    quiet = {"solar": 0, "home": 400, "grid_consumption": 400, "grid_production": 0}
+    for _ in range(20):
+        interval = scheduler.update(quiet, dict(quiet, home=410))
+    assert interval == timedelta(minutes=5)
+
+    charging = dict(quiet, home=7400, grid_consumption=7400)
+    assert scheduler.update(quiet, charging) == timedelta(seconds=150)
+    for _ in range(10):
+        interval = scheduler.update(quiet, charging)
+    assert interval == timedelta(seconds=15)
+    assert scheduler.volatility == 7000
+
+    # Moderate change keeps the current interval
+    assert scheduler.update(quiet, dict(quiet, home=600)) == timedelta(seconds=15)
+
+    # A stale grid reading leaves the grid flow out
+    stale = dict(charging, grid_production=None)
+    assert scheduler.update(quiet, stale) == timedelta(seconds=15)
+    assert scheduler.volatility == 7000
+    assert scheduler.update(quiet, dict.fromkeys(quiet)) == timedelta(seconds=15)
+
+
+def _soe_ramp(forecaster, start, rate, power, minutes, at=0.0):
+    """Feed a minutely SOE ramp of rate %/h, with +-0.2% of jitter."""
+    for minute in range(minutes + 1):
+        soe = start + rate * minute / 60 + (0.2 if minute % 2 else -0.2)
+        forecast = forecaster.add_sample(at + minute * 60, soe, power)
+    return forecast
+
+
+def test_soe_forecaster():
+    """Test runtime forecasts follow the SOE trend while the battery agrees."""
+    forecaster = SoeForecaster(reserve=20)
+    assert _soe_ramp(forecaster, 80, -10, 2000, 2) == dict.fromkeys(FORECAST_FIELDS)
+
+    # Discharging 10%/h from 75%: 7 hours to empty (5%), and 5.1 hours to
+    # the 20% reserve (24% on the gateway's scale)
+    forecast = _soe_ramp(SoeForecaster(reserve=20), 80, -10, 2000, 30)
+    assert forecast["time_to_full"] is None
+    assert forecast["time_to_empty"] == pytest.approx(420, abs=5)
+    assert forecast["reserve_time"] == pytest.approx(1800 + 5.1 * 3600, abs=300)
+
+    forecast = _soe_ramp(SoeForecaster(), 50, 20, -3000, 30)
+    assert forecast["time_to_full"] == pytest.approx(120, abs=3)
+    assert forecast["time_to_empty"] is None
+
+    # SOE rising while the battery reports discharge: no forecast
+    assert _soe_ramp(SoeForecaster(), 50, 20, 2000, 30) == dict.fromkeys(
+        FORECAST_FIELDS
+    )
+
+    # A gap in the samples starts the fit over
+    forecaster = SoeForecaster()
+    _soe_ramp(forecaster, 50, 20, -3000, 30)
+    assert forecaster.add_sample(7200, 60, -3000)["time_to_full"] is None
+
+    # Once older samples have faded away there is no trend left to fit
+    forecaster = SoeForecaster(half_life=timedelta(microseconds=1))
+    assert _soe_ramp(forecaster, 50, 20, -3000, 30) == dict.fromkeys(FORECAST_FIELDS)
+
+
+async def test_coordinator_adapts_update_interval(hass):
+    """Test each refresh feeds the scheduler and updates the interval."""
+    coordinator = Pw3DataUpdateCoordinator(
+        hass, FakePowerwall(), min_interval=timedelta(seconds=30)
+    )
+    coordinator.data = await coordinator._async_update_data()
+    await coordinator._async_update_data()
+
+    assert coordinator.update_interval == timedelta(seconds=75)
+
+    # Polled by its account, the site still adapts the interval it asks for
+    coordinator.polled_by_account = True
+    coordinator.update_interval = None
+    await coordinator._async_update_data()
+    assert coordinator.poll_interval == timedelta(seconds=93.75)
+    assert coordinator.update_interval is None
+
+
+class FailingPowerwall(FakePowerwall):
+    """Powerwall stand-in whose reads fail while down is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.down = True
+
+    def poll(self, api):
+        if self.down:
+            raise ConnectionError("gateway unreachable")
+        return super().poll(api)
+
+
+async def test_coordinator_local_failover(hass, freezer):
+    """Test an unhealthy gateway fails over to the cloud and is won back."""
+    gateway = FailingPowerwall()
+    coordinator = Pw3DataUpdateCoordinator(
+        hass, FakePowerwall(), local=DataSource(LOCAL, pw=gateway)
+    )
+
+    # A failed gateway read falls through to the cloud in the same refresh
+    data = await coordinator._async_update_data()
+    assert data["source"] == CLOUD
+    assert data["stale"] == []
+
+    for _ in range(FAILOVER_THRESHOLD - 1):
+        await coordinator._async_update_data()
+    # Skipped while unhealthy, so refreshes no longer wait on it
+    gateway.down = False
+    coordinator.upstream_calls_total = 0
+    assert (await coordinator._async_update_data())["source"] == CLOUD
+    assert coordinator.upstream_calls_total == 2
+
+    freezer.tick(RECOVERY_INTERVAL)
+    assert (await coordinator._async_update_data())["source"] == LOCAL
+
+
+async def test_coordinator_circuit_breaker(hass, freezer):
+    """Test a failing Powerwall is left alone and its last readings served stale."""
+    cloud = FailingPowerwall()
+    cloud.down = False
+    coordinator = Pw3DataUpdateCoordinator(hass, cloud)
+    coordinator.data = await coordinator._async_update_data()
+
+    cloud.down = True
+    for _ in range(BREAKER_THRESHOLD - 1):
+        with pytest.raises(UpdateFailed):
+            await coordinator._async_update_data()
+    # The failure that opens the breaker already serves the last readings
+    await coordinator._async_update_data()
+    assert coordinator.breaker.state == OPEN
+
+    # Open: no reads, last good readings marked stale
+    coordinator.upstream_calls_total = 0
+    data = await coordinator._async_update_data()
+    assert coordinator.upstream_calls_total == 0
+    assert data["solar"] == 1500
+    assert "solar" in data["stale"]
+    assert data["last_updated"] == coordinator.data["last_updated"]
+
+    # A failed probe reopens it for twice as long
+    freezer.tick(BREAKER_RESET)
+    await coordinator._async_update_data()
+    assert coordinator.upstream_calls_total == 2
+    assert coordinator.breaker.state == OPEN
+
+    cloud.down = False
+    freezer.tick(BREAKER_RESET)
+    await coordinator._async_update_data()
+    assert coordinator.breaker.state == OPEN
+    freezer.tick(BREAKER_RESET)
+    assert (await coordinator._async_update_data())["stale"] == []
+    assert coordinator.breaker.state == CLOSED
+
+
+async def test_coordinator_local_connect(hass):
+    """Test the gateway client is created on first use and read from."""
+    gateway = FakePowerwall()
+
+    async def connect():
+        return gateway
+
+    coordinator = Pw3DataUpdateCoordinator(
+        hass, None, local=DataSource(LOCAL, connect=connect)
+    )
+    data = await coordinator._async_update_data()
+
+    assert data["source"] == LOCAL
+    assert coordinator.sources.sources[0].pw is gateway
+    assert coordinator.pw is None
+
+
+async def test_coordinator_local_connect_error(hass, caplog):
+    """Test a gateway that cannot be connected falls back to the cloud."""
+
+    async def connect():
+        raise OSError("unreachable")
+
+    coordinator = Pw3DataUpdateCoordinator(
+        hass, FakePowerwall(), local=DataSource(LOCAL, connect=connect)
+    )
+    data = await coordinator._async_update_data()
+
+    assert data["source"] == CLOUD
+    assert "Error connecting to Powerwall local source: unreachable" in caplog.text
+    assert coordinator.metrics.as_dict()["login"]["errors"] == 1
+
+
+class SequencePowerwall(FakePowerwall):
+    """Powerwall stand-in returning a new solar reading on each poll."""
+
+    def __init__(self, solar):
+        super().__init__()
+        self.solar = iter(solar)
+
+    def poll(self, api):
+        data = super().poll(api)
+        if api == "/api/meters/aggregates":
+            data = dict(data, solar={"instant_power": next(self.solar)})
+        return data
+
+
+async def test_coordinator_fast_sampling(hass, freezer):
+    """Test refreshes publish the mean and extremes of the fast samples."""
+    coordinator = Pw3DataUpdateCoordinator(
+        hass,
+        SequencePowerwall([1000, 1000, 4000, 1000, 1400]),
+        fast_interval=timedelta(seconds=2),
+    )
+    coordinator.data = await coordinator._async_update_data()
+    assert coordinator.data["solar"] == 1000
+    assert coordinator.data["solar_min"] == coordinator.data["solar_max"] == 1000
+
+    for _ in range(3):
+        freezer.tick(timedelta(seconds=2))
+        await coordinator._async_sample()
+    coordinator.upstream_calls_total = 0
+    freezer.tick(timedelta(seconds=2))
+    coordinator.data = await coordinator._async_update_data()
+
+    # Published from the buffer without reading upstream
+    assert coordinator.upstream_calls_total == 0
+    assert coordinator.data["solar"] == 2000
+    assert coordinator.data["solar_min"] == 1000
+    assert coordinator.data["solar_max"] == 4000
+    assert coordinator.data["home"] == 3500
+    # 6 s of samples integrated at the fast cadence
+    assert coordinator.data["solar_energy"] == pytest.approx(
+        (2000 + 5000 + 5000) / 3600, abs=0.001
+    )
+    assert len(coordinator.samples) == 4
+
+
+class NoSoePowerwall(SequencePowerwall):
+    """Powerwall stand-in whose SOE read always fails."""
+
+    def poll(self, api):
+        if api != "/api/meters/aggregates":
+            raise OSError("no soe")
+        return super().poll(api)
+
+
+async def test_coordinator_fast_sampling_stale_field(hass, freezer):
+    """Test a field stale in every fast sample keeps its last value."""
+    coordinator = Pw3DataUpdateCoordinator(
+        hass, NoSoePowerwall([1000, 3000]), fast_interval=timedelta(seconds=2)
+    )
+    coordinator.data = await coordinator._async_update_data()
+    freezer.tick(timedelta(seconds=2))
+    await coordinator._async_sample()
+    freezer.tick(timedelta(seconds=2))
+    coordinator.data = await coordinator._async_update_data()
+
+    assert coordinator.data["solar"] == 3000
+    assert coordinator.data["percentage"] is None
+    assert "percentage_min" not in coordinator.data
+
+
+async def test_coordinator_fast_sampling_gateway_only(hass):
+    """Test fast samples only read the gateway, and pause while on the cloud."""
+    gateway = FailingPowerwall()
+    gateway.down = False
+    coordinator = Pw3DataUpdateCoordinator(
+        hass,
+        FakePowerwall(),
+        local=DataSource(LOCAL, pw=gateway),
+        fast_interval=timedelta(seconds=1),
+    )
+    coordinator.data = await coordinator._async_update_data()
+    stop = coordinator.async_start_sampling()
+
+    async def tick(seconds):
+        coordinator.upstream_calls_total = 0
+        async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=seconds))
+        await hass.async_block_till_done()
+        return coordinator.upstream_calls_total
+
+    try:
+        assert await tick(1) == 2
+        # A failed gateway sample does not fall through to the cloud
+        gateway.down = True
+        assert await tick(2) == 2
+        assert coordinator.sources.active.name == LOCAL
+
+        # The next refresh publishes the buffered sample; the one after has
+        # nothing new, reads directly and fails over. Fast samples then stop.
+        coordinator.data = await coordinator._async_update_data()
+        coordinator.data = await coordinator._async_update_data()
+        assert coordinator.data["source"] == CLOUD
+        assert await tick(3) == 0
+    finally:
+        stop()
+
+
+SITES = list(range(1, 11))
+
+
+async def test_account_coordinator_polls_sites(hass, aioclient_mock):
+    """Test one account schedule feeds every site with one request per site."""
+    aioclient_mock.get(
+        f"{OWNER_API_URL}/products",
+        json={"response": [{"energy_site_id": site} for site in SITES]},
+    )
+    for site in SITES:
+        aioclient_mock.get(
+            f"{OWNER_API_URL}/energy_sites/{site}/live_status",
+            json={"response": {"solar_power": site * 100, "percentage_charged": 50}},
+        )
+    api = Pw3ApiClient(
+        "test@example.com", async_get_clientsession(hass), {"access_token": "at"}
+    )
+    account = Pw3AccountCoordinator(hass, api)
+    assert await account.async_discover() == SITES
+
+    coordinators = {
+        site: Pw3DataUpdateCoordinator(hass, None, api=account.client(site))
+        for site in SITES
+    }
+    unsubscribes = [
+        account.async_subscribe(site, coordinator)
+        for site, coordinator in coordinators.items()
+    ]
+    assert account.slots == SITE_SLOTS
+    for _ in range(account.slots):
+        await account.async_refresh()
+
+    # One discovery plus one live_status per site; the site refreshes read
+    # the polled status from their client's cache
+    assert aioclient_mock.call_count == 1 + len(SITES)
+    assert {site: c.data["solar"] for site, c in coordinators.items()} == {
+        site: site * 100 for site in SITES
+    }
+    assert all(c.update_interval is None for c in coordinators.values())
+    slot = timedelta(minutes=1) / SITE_SLOTS
+    assert slot * 0.9 <= account.update_interval <= slot * 1.1
+
+    for unsubscribe in unsubscribes:
+        unsubscribe()
+    assert account.subscribers == {}
+
+
+class CountingApi(FakeApi):
+    """Account client stand-in tracking concurrent live_status reads."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.site_id = None
+
+    async def async_get_sites(self):
+        return [{"energy_site_id": site} for site in SITES]
+
+    def for_site(self, site_id):
+        return self
+
+    async def async_get_live_status(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0)
+        self.in_flight -= 1
+        return {}
+
+
+async def test_account_coordinator_discovery_error(hass, caplog):
+    """Test subscribed sites are still polled when discovery fails."""
+    api = CountingApi()
+    account = Pw3AccountCoordinator(hass, api, slots=1)
+    site = Pw3DataUpdateCoordinator(hass, None, api=api)
+    unsubscribe = account.async_subscribe(1, site)
+
+    with patch.object(api, "async_get_sites", side_effect=Pw3ApiClientError("down")):
+        await account.async_refresh()
+
+    assert "Error discovering Tesla energy sites: down" in caplog.text
+    assert account.last_update_success
+    assert list(account.data) == [1]
+    unsubscribe()
+
+
+async def test_account_coordinator_bounds_concurrency(hass):
+    """Test a slot's sites are read at most max_concurrent at a time."""
+    api = CountingApi()
+    account = Pw3AccountCoordinator(hass, api, max_concurrent=2, slots=1)
+    await account.async_discover()
+    unsubscribes = [
+        account.async_subscribe(site, Pw3DataUpdateCoordinator(hass, None, api=api))
+        for site in SITES
+    ]
+    await account.async_refresh()
+
+    assert set(account.data) == set(SITES)
+    assert api.max_in_flight == 2
+    for unsubscribe in unsubscribes:
+        unsubscribe()
+
+
+async def test_account_coordinator_follows_site_intervals(hass, freezer):
+    """Test subscribed sites keep their own interval and the cycle follows it."""
+    api = CountingApi()
+    account = Pw3AccountCoordinator(hass, api, slots=1)
+    await account.async_discover()
+    fast, slow = (
+        Pw3DataUpdateCoordinator(
+            hass, None, api=api, min_interval=interval, max_interval=interval
+        )
+        for interval in (timedelta(seconds=30), timedelta(minutes=2))
+    )
+    unsubscribes = [account.async_subscribe(1, fast), account.async_subscribe(2, slow)]
+    assert account.cycle == timedelta(seconds=30)
+
+    polled = []
+    for _ in range(5):
+        await account.async_refresh()
+        now = dt_util.utcnow()
+        polled.append([site for site, at in account.last_polled.items() if at == now])
+        freezer.tick(timedelta(seconds=30))
+
+    # The slow site is polled every fourth wakeup, not on every one
+    assert polled == [[1, 2], [1], [1], [1], [1, 2]]
+    assert timedelta(seconds=27) <= account.update_interval <= timedelta(seconds=33)
+    assert fast.update_interval is None
+
+    for unsubscribe in unsubscribes:
+        unsubscribe()
+    # Polling is handed back at the site's own interval
+    assert slow.update_interval == timedelta(minutes=2)
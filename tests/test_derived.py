@@ -0,0 +1,117 @@
+"""Tests for pw3 derived metrics."""
+
+from datetime import date
+
+import pytest
+from custom_components.pw3.coordinator import ENERGY_FIELDS
+from custom_components.pw3.derived import DerivedMetrics
+from custom_components.pw3.energy import EnergyAccumulator
+from homeassistant.util import dt as dt_util
+
+# Daytime: 3 kW of solar, 1 kW to the home, 1 kW into the battery and 1 kW
+# exported. Night: the battery covers half of a 1 kW load.
+DAYTIME = {
+    "solar": 3000,
+    "home": 1000,
+    "battery_consumption": 0,
+    "battery_production": 1000,
+    "grid_consumption": 0,
+    "grid_production": 1000,
+}
+NIGHT = {
+    "solar": 0,
+    "home": 1000,
+    "battery_consumption": 500,
+    "battery_production": 0,
+    "grid_consumption": 500,
+    "grid_production": 0,
+}
+
+
+def _midnight() -> float:
+    """Return the start of a local day, in the time zone of the test."""
+    return dt_util.start_of_local_day(date(2024, 3, 20)).timestamp()
+
+
+def _run(derived, energy, start, hours, sample):
+    """Feed an hour of samples a minute apart; returns the last ratios."""
+    for minute in range(hours * 60 + 1):
+        timestamp = start + minute * 60
+        data = {**sample, **energy.add_sample(timestamp, sample)}
+        result = derived.add_sample(timestamp, data)
+    return result
+
+
+def test_derived_instant_and_windows():
+    """Test instantaneous ratios and their today and lifetime totals."""
+    derived = DerivedMetrics()
+    energy = EnergyAccumulator(ENERGY_FIELDS)
+    day = _midnight()
+
+    result = _run(derived, energy, day + 12 * 3600, 1, DAYTIME)
+    assert result["self_consumption"] == 66.7
+    assert result["solar_fraction"] == 100
+    assert result["self_sufficiency"] == 100
+    assert result["self_consumption_today"] == 66.7
+    assert result["battery_efficiency_today"] == 0
+
+    result = _run(derived, energy, day + 13 * 3600 + 60, 1, NIGHT)
+    assert result["self_consumption"] is None
+    assert result["self_sufficiency"] == 50
+    # Over both hours: 2 kWh of load, 1 kWh from solar and 0.5 kWh from the
+    # grid; 1 kWh charged and 0.5 kWh discharged
+    assert result["solar_fraction_today"] == 50
+    assert result["self_sufficiency_today"] == 75
+    assert result["battery_efficiency_today"] == 50
+
+    # Just after local midnight today starts over, lifetime carries on
+    result = _run(derived, energy, day + 24 * 3600, 0, NIGHT)
+    assert result["self_sufficiency_today"] is None
+    assert result["self_sufficiency_lifetime"] == 75
+
+
+def test_derived_stale_and_restore():
+    """Test stale readings skip the sample and the day survives a restart."""
+    derived = DerivedMetrics()
+    energy = EnergyAccumulator(ENERGY_FIELDS)
+    day = _midnight()
+    _run(derived, energy, day + 12 * 3600, 1, DAYTIME)
+
+    stale = derived.add_sample(day + 14 * 3600, DAYTIME, stale=["solar"])
+    assert stale["self_consumption"] is None
+
+    restored = DerivedMetrics()
+    restored.restore(derived.as_dict())
+    assert restored.day == "2024-03-20"
+    assert restored.solar_home.total == derived.solar_home.total
+    assert derived.solar_home.total == pytest.approx(1000)
+    assert restored.day_start == derived.day_start
+    assert restored.lifetime_start == derived.lifetime_start
+
+
+def test_derived_lifetime_from_restored_totals():
+    """Test lifetime ratios only count energy since solar to home was tracked."""
+    energy = EnergyAccumulator(ENERGY_FIELDS)
+    # Years of totals from before the derived metrics, all of it from the grid
+    energy.restore(
+        {
+            "home": {"total": 5_000_000},
+            "grid_consumption": {"total": 5_000_000},
+            "battery_production": {"total": 100_000},
+        }
+    )
+    derived = DerivedMetrics()
+    day = _midnight()
+
+    result = _run(derived, energy, day + 12 * 3600, 1, DAYTIME)
+    assert result["solar_fraction_lifetime"] == 100
+    assert result["self_sufficiency_lifetime"] == 100
+    assert result["battery_efficiency_lifetime"] == 0
+
+    # The snapshot survives a restart, so the lifetime carries on from it
+    restored = DerivedMetrics()
+    restored.restore(derived.as_dict())
+    result = _run(restored, energy, day + 13 * 3600 + 60, 1, NIGHT)
+    assert result["solar_fraction_lifetime"] == 50
+    assert result["self_sufficiency_lifetime"] == 75
+    assert result["battery_efficiency_lifetime"] == 50
@@ -0,0 +1,26 @@
+"""Tests for pw3 diagnostics."""
+
+from custom_components.pw3.const import DOMAIN
+from custom_components.pw3.diagnostics import async_get_config_entry_diagnostics
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+
+async def test_entry_diagnostics(hass, mock_pw_data, mock_config_entry):
+    """Test diagnostics report call metrics and redact the account."""
+    entry = MockConfigEntry(domain=DOMAIN, data=mock_config_entry, entry_id="test")
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    diagnostics = await async_get_config_entry_diagnostics(hass, entry)
+
+    assert diagnostics["entry"]["data"]["pw_email"] == "**REDACTED**"
+    metrics = diagnostics["metrics"]
+    assert set(metrics) == {"aggregates", "login", "refresh", "soe"}
+    assert metrics["soe"]["count"] == 1
+    assert metrics["soe"]["errors"] == 0
+    assert metrics["refresh"]["p95_ms"] is not None
+    assert diagnostics["coordinator"]["source"] == "cloud"
+    assert diagnostics["coordinator"]["staleness"] >= 0
+    assert diagnostics["breaker"]["state"] == "closed"
+    assert diagnostics["data"]["percentage"] == 75.5
@@ -0,0 +1,50 @@
+"""Tests for pw3 energy integration."""
+
+import pytest
+from custom_components.pw3.energy import MAX_INTEGRATION_GAP
+from custom_components.pw3.energy import EnergyAccumulator
+from custom_components.pw3.energy import EnergyIntegrator
+
+
+def test_energy_integrator_trapezoid():
+    """Test the integrator uses the trapezoidal rule on sample timestamps."""
+    integrator = EnergyIntegrator()
+    assert integrator.add_sample(0, 1000) == 0
+    assert integrator.add_sample(600, 3000) == pytest.approx(1000 / 3)
+    # Repeated sample timestamps do not add energy
+    assert integrator.add_sample(600, 3000) == pytest.approx(1000 / 3)
+    # Missing readings are skipped rather than treated as 0 W
+    assert integrator.add_sample(700, None) == pytest.approx(1000 / 3)
+    # Gaps longer than MAX_INTEGRATION_GAP restart integration
+    assert integrator.add_sample(600 + MAX_INTEGRATION_GAP + 1, 0) == pytest.approx(
+        1000 / 3
+    )
+
+    restored = EnergyIntegrator.from_dict(integrator.as_dict())
+    assert restored.add_sample(restored.last_time + 600, 1000) == pytest.approx(
+        1250 / 3
+    )
+
+
+def test_energy_accumulator():
+    """Test every power field is integrated from one sample pass."""
+    accumulator = EnergyAccumulator(("solar", "home"))
+    assert accumulator.add_sample(0, {"solar": 1000, "home": 500}) == {
+        "solar_energy": 0,
+        "home_energy": 0,
+    }
+    # A stale field is held back and integrated across once it is fresh again
+    assert accumulator.add_sample(
+        360, {"solar": 1000, "home": 900}, stale=["home"]
+    ) == {"solar_energy": 100, "home_energy": 0}
+    assert accumulator.add_sample(720, {"solar": 1000, "home": 500}) == {
+        "solar_energy": 200,
+        "home_energy": 100,
+    }
+
+    restored = EnergyAccumulator(("solar", "home"))
+    restored.restore(accumulator.as_dict())
+    assert restored.add_sample(1080, {"solar": 0, "home": 500}) == {
+        "solar_energy": 250,
+        "home_energy": 150,
+    }
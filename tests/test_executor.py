@@ -0,0 +1,56 @@
+"""Tests for the pw3 executor."""
+
+import asyncio
+import threading
+
+import pytest
+from custom_components.pw3.executor import BoundedExecutor
+from custom_components.pw3.executor import ExecutorBusyError
+from custom_components.pw3.profiler import RefreshProfiler
+
+
+async def test_executor_bounds_calls_in_flight(hass):
+    """Test a hung call keeps its slot past its deadline and excess calls fail."""
+    executor = BoundedExecutor(workers=1, max_pending=2)
+    release = threading.Event()
+
+    with pytest.raises(asyncio.TimeoutError):
+        await executor.async_run(release.wait, timeout=0.05)
+    assert executor.pending == 1
+    assert executor.timeouts == 1
+
+    queued = asyncio.ensure_future(executor.async_run(lambda: "done"))
+    await asyncio.sleep(0)
+    with pytest.raises(ExecutorBusyError):
+        await executor.async_run(lambda: "refused")
+    assert executor.rejected == 1
+
+    release.set()
+    assert await queued == "done"
+    assert executor.pending == 0
+    await hass.async_add_executor_job(executor.shutdown)
+
+
+def _blocking_read():
+    return sum(range(1000))
+
+
+async def test_executor_profiles_calls(hass):
+    """Test a profiled call is traced in its worker and timed as spans."""
+    executor = BoundedExecutor(workers=1)
+    profiler = RefreshProfiler(1)
+
+    assert await executor.async_run(
+        _blocking_read, profiler=profiler, track="site executor"
+    ) == sum(range(1000))
+    await asyncio.sleep(0)
+
+    assert [(track, name) for track, name, _, _ in profiler.spans] == [
+        ("site executor", "queue"),
+        ("site executor", "run"),
+    ]
+    (_, _, submitted, started), (_, _, run_start, ended) = profiler.spans
+    assert submitted <= started == run_start <= ended
+    functions = {function for _, _, function in profiler.stats().stats}
+    assert "_blocking_read" in functions
+    await hass.async_add_executor_job(executor.shutdown)
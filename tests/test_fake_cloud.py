@@ -0,0 +1,136 @@
+"""Tests for pw3's cloud client against a local fake Tesla cloud."""
+
+import asyncio
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+import aiohttp
+import pytest
+from custom_components.pw3.api import Pw3ApiClient
+from custom_components.pw3.api import Pw3ApiClientError
+from custom_components.pw3.api import Pw3ApiClientRateLimitError
+from custom_components.pw3.coordinator import Pw3AccountCoordinator
+from custom_components.pw3.coordinator import Pw3DataUpdateCoordinator
+from custom_components.pw3.ratelimit import RateLimiter
+
+from .fake_tesla import FakeTeslaCloud
+from .fake_tesla import Fault
+
+
+@pytest.fixture
+async def cloud(socket_enabled):
+    """Start a fake Tesla cloud on localhost."""
+    server = FakeTeslaCloud(sites=2)
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest.fixture
+async def session():
+    """Return a client session that talks to the fake cloud over real sockets."""
+    async with aiohttp.ClientSession() as client_session:
+        yield client_session
+
+
+def _client(cloud, session, token=None, limiter=None, site_id=None):
+    return Pw3ApiClient(
+        "test@example.com",
+        session,
+        token or cloud.token,
+        site_id=site_id,
+        base_url=cloud.base_url,
+        token_url=cloud.token_url,
+        limiter=limiter,
+    )
+
+
+async def test_fake_cloud_refreshes_expired_token(hass, cloud, session):
+    """Test an expired token is refreshed once, then live data is read."""
+    token = {**cloud.token, "expires_at": time.time() - 1}
+    coordinator = Pw3DataUpdateCoordinator(
+        hass, None, api=_client(cloud, session, token=token)
+    )
+
+    data = await coordinator._async_update_data()
+
+    assert data["solar"] == 3000
+    assert data["percentage"] == pytest.approx(81)
+    assert cloud.requests == {
+        "/oauth2/v3/token": 1,
+        "/api/1/products": 1,
+        "/api/1/energy_sites/{site_id}/live_status": 1,
+    }
+
+
+async def test_fake_cloud_throttling(cloud, session):
+    """Test a 429 holds the account's calls back for Retry-After."""
+    cloud.rate_limit = 1
+    limiter = RateLimiter()
+    api = _client(cloud, session, limiter=limiter, site_id=cloud.sites[0])
+
+    await api.async_get_live_status()
+    with pytest.raises(Pw3ApiClientRateLimitError):
+        await api.api_wrapper("get", f"{cloud.base_url}/products")
+
+    assert cloud.statuses[429] == 1
+    assert limiter.throttle_events == 1
+    assert 25 < limiter.retry_in() <= 30
+
+
+async def test_fake_cloud_hung_request(cloud, session):
+    """Test a request that outlives the timeout fails and the next one works."""
+    cloud.faults.append(Fault(status=200, delay=1))
+    limiter = RateLimiter()
+    api = _client(cloud, session, limiter=limiter, site_id=cloud.sites[0])
+
+    with patch("custom_components.pw3.api.TIMEOUT", 0.05):
+        with pytest.raises(Pw3ApiClientError):
+            await api.async_get_live_status()
+    assert limiter.failures == 1
+
+    limiter.blocked_until = 0
+    assert (await api.async_get_live_status())["percentage_charged"] == 80
+    assert limiter.failures == 0
+
+
+async def test_fake_cloud_load(hass, socket_enabled, session):
+    """Test an account of many sites on a slow, flaky cloud stays bounded."""
+    cloud = FakeTeslaCloud(sites=20, latency=0.01, jitter=0.01, error_rate=0.2)
+    await cloud.start()
+    try:
+        api = _client(cloud, session)
+        account = Pw3AccountCoordinator(hass, api, max_concurrent=4, slots=1)
+        await account.async_discover()
+        coordinators = {
+            # Due again by each wakeup
+            site: Pw3DataUpdateCoordinator(
+                hass,
+                None,
+                api=account.client(site),
+                min_interval=timedelta(seconds=0.1),
+                max_interval=timedelta(seconds=0.1),
+            )
+            for site in cloud.sites
+        }
+        unsubscribes = [
+            account.async_subscribe(site, coordinator)
+            for site, coordinator in coordinators.items()
+        ]
+        # Each wakeup polls afresh, and the site refreshes that follow read
+        # what it fetched
+        with patch("custom_components.pw3.api.LIVE_STATUS_TTL", 0.1):
+            for _ in range(3):
+                await account.async_refresh()
+                await asyncio.sleep(0.1)
+        for unsubscribe in unsubscribes:
+            unsubscribe()
+    finally:
+        await cloud.close()
+
+    assert cloud.statuses[500] > 0
+    assert cloud.requests["/api/1/energy_sites/{site_id}/live_status"] >= 60
+    assert cloud.max_in_flight <= 4
+    # Sites whose poll failed retried on their own, so every site has data
+    assert all(c.data is not None for c in coordinators.values())
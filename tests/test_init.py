@@ -1,25 +1,35 @@
 """Test pw3 setup process."""
 
-import pytest
+import asyncio
+from unittest.mock import AsyncMock
+from unittest.mock import patch
+
 from custom_components.pw3 import (
     async_reload_entry,
 )
 from custom_components.pw3 import (
     async_setup_entry,
 )
-from custom_components.pw3 import (
-    async_unload_entry,
-)
 from custom_components.pw3 import (
     Pw3DataUpdateCoordinator,
 )
+from custom_components.pw3.const import CONF_BACKFILL_DAYS
+from custom_components.pw3.const import CONF_GATEWAY_PASSWORD
+from custom_components.pw3.const import CONF_HOST
+from custom_components.pw3.const import CONF_IMPORT_STATISTICS
 from custom_components.pw3.const import (
     DOMAIN,
 )
-from homeassistant.exceptions import ConfigEntryNotReady
+from custom_components.pw3.control import BACKUP_RESERVE
+from custom_components.pw3.source import LOCAL
+from custom_components.pw3.statistics import StatisticsAggregator
+from homeassistant.config_entries import ConfigEntryState
 from pytest_homeassistant_custom_component.common import MockConfigEntry
 
 from .const import MOCK_CONFIG
+from .const import MOCK_OPTIONS
+from .const import MOCK_SITE_ID
+from .const import MOCK_TOKEN
 
 
 # We can pass fixtures as defined in conftest.py to tell pytest to use the fixture
@@ -30,12 +40,16 @@ from .const import MOCK_CONFIG
 async def test_setup_unload_and_reload_entry(hass, bypass_get_data):
     """Test entry setup and unload."""
     # Create a mock entry so we don't have to go through config flow
-    config_entry = MockConfigEntry(domain=DOMAIN, data=MOCK_CONFIG, entry_id="test")
+    config_entry = MockConfigEntry(
+        domain=DOMAIN, data=MOCK_CONFIG, options=MOCK_OPTIONS, entry_id="test"
+    )
+    config_entry.add_to_hass(hass)
 
     # Set up the entry and assert that the values set during setup are where we expect
-    # them to be. Because we have patched the Pw3DataUpdateCoordinator.async_get_data
-    # call, no code from custom_components/pw3/api.py actually runs.
-    assert await async_setup_entry(hass, config_entry)
+    # them to be. Because we have patched the Pw3ApiClient calls, no request
+    # reaches the Tesla API.
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    await hass.async_block_till_done()
     assert DOMAIN in hass.data and config_entry.entry_id in hass.data[DOMAIN]
     assert isinstance(
         hass.data[DOMAIN][config_entry.entry_id], Pw3DataUpdateCoordinator
@@ -43,22 +57,184 @@ async def test_setup_unload_and_reload_entry(hass, bypass_get_data):
 
     # Reload the entry and assert that the data from above is still there
     assert await async_reload_entry(hass, config_entry) is None
+    await hass.async_block_till_done()
     assert DOMAIN in hass.data and config_entry.entry_id in hass.data[DOMAIN]
     assert isinstance(
         hass.data[DOMAIN][config_entry.entry_id], Pw3DataUpdateCoordinator
     )
 
     # Unload the entry and verify that the data has been removed
-    assert await async_unload_entry(hass, config_entry)
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
     assert config_entry.entry_id not in hass.data[DOMAIN]
 
 
 async def test_setup_entry_exception(hass, error_on_get_data):
     """Test ConfigEntryNotReady when API raises an exception during entry setup."""
-    config_entry = MockConfigEntry(domain=DOMAIN, data=MOCK_CONFIG, entry_id="test")
+    config_entry = MockConfigEntry(
+        domain=DOMAIN, data=MOCK_CONFIG, options=MOCK_OPTIONS, entry_id="test"
+    )
+    config_entry.add_to_hass(hass)
 
     # In this case we are testing the condition where async_setup_entry raises
     # ConfigEntryNotReady using the `error_on_get_data` fixture which simulates
-    # an error.
-    with pytest.raises(ConfigEntryNotReady):
-        assert await async_setup_entry(hass, config_entry)
+    # an error, so Home Assistant retries the setup later.
+    assert not await hass.config_entries.async_setup(config_entry.entry_id)
+    assert config_entry.state is ConfigEntryState.SETUP_RETRY
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+
+
+async def test_setup_entry_without_email(hass):
+    """Test an entry without an account email does not set up."""
+    config_entry = MockConfigEntry(domain=DOMAIN, data={}, entry_id="test")
+
+    assert not await async_setup_entry(hass, config_entry)
+
+
+async def test_setup_entry_without_token(hass):
+    """Test a native entry retries setup until pypowerwall has cached a token."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN, data=MOCK_CONFIG, options=MOCK_OPTIONS, entry_id="test"
+    )
+    config_entry.add_to_hass(hass)
+
+    with patch("custom_components.pw3.load_cloud_auth", return_value=(None, None)):
+        assert not await hass.config_entries.async_setup(config_entry.entry_id)
+    assert config_entry.state is ConfigEntryState.SETUP_RETRY
+
+
+async def test_setup_entry_without_sites(hass):
+    """Test a native entry retries setup while the account has no sites."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN, data=MOCK_CONFIG, options=MOCK_OPTIONS, entry_id="test"
+    )
+    config_entry.add_to_hass(hass)
+
+    with (
+        patch("custom_components.pw3.load_cloud_auth", return_value=(MOCK_TOKEN, None)),
+        patch("custom_components.pw3.Pw3ApiClient.async_get_sites", return_value=[]),
+    ):
+        assert not await hass.config_entries.async_setup(config_entry.entry_id)
+    assert config_entry.state is ConfigEntryState.SETUP_RETRY
+
+
+async def test_setup_entry_discovers_sites(hass, bypass_get_data):
+    """Test other sites on the account are offered, and tokens saved back."""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN, data=MOCK_CONFIG, options=MOCK_OPTIONS, entry_id="test"
+    )
+    config_entry.add_to_hass(hass)
+
+    with patch(
+        "custom_components.pw3.Pw3ApiClient.async_get_sites",
+        return_value=[{"energy_site_id": MOCK_SITE_ID}, {"energy_site_id": 67890}],
+    ):
+        assert await hass.config_entries.async_setup(config_entry.entry_id)
+        await hass.async_block_till_done()
+
+    flows = hass.config_entries.flow.async_progress()
+    assert [flow["context"]["source"] for flow in flows] == ["integration_discovery"]
+    assert flows[0]["context"]["unique_id"] == "67890"
+
+    # A refreshed token goes back to pypowerwall's cache
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]
+    with patch("custom_components.pw3.save_cloud_token") as save:
+        coordinator.api._token_updater({"access_token": "new"})
+        await hass.async_block_till_done()
+    save.assert_called_once_with(
+        hass.config.path(), "test@example.com", {"access_token": "new"}
+    )
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+
+
+async def _setup(hass, data, options=None):
+    entry = MockConfigEntry(
+        domain=DOMAIN, data=data, options=options or {}, entry_id="test"
+    )
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    return entry
+
+
+async def test_setup_entry_with_gateway(
+    hass, mock_powerwall, mock_pw_data, mock_config_entry
+):
+    """Test an entry with a gateway host reads from it before the cloud."""
+    entry = await _setup(
+        hass,
+        {**mock_config_entry, CONF_HOST: "192.168.91.1", CONF_GATEWAY_PASSWORD: "pw"},
+    )
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+
+    assert coordinator.data["source"] == LOCAL
+    assert coordinator.data["solar"] == 1500
+    assert coordinator.sources.active.name == LOCAL
+    # Reads use the gateway client; the cloud client is only for the controls
+    await coordinator.controls.async_load()
+    gateway, cloud = sorted(
+        mock_powerwall.call_args_list,
+        key=lambda call: call.kwargs["host"],
+        reverse=True,
+    )
+    kwargs = gateway.kwargs
+    assert kwargs["host"] == "192.168.91.1"
+    assert kwargs["gw_pwd"] == "pw"
+    assert kwargs["failover"] is False
+    assert cloud.kwargs["cloudmode"] is True
+    assert mock_pw_data.poll.call_count == 2
+    assert coordinator.controls.settings[BACKUP_RESERVE] == 20
+
+
+async def test_setup_entry_with_statistics(hass, mock_pw_data, mock_config_entry):
+    """Test statistics import backfills history through the account client."""
+    token = {"access_token": "at", "refresh_token": "rt", "expires_at": 0}
+    ran = asyncio.Event()
+    # Whether statistics were paused at each live import
+    paused = []
+    async_import = StatisticsAggregator.async_import
+
+    def record_import(self, hass):
+        paused.append(self.paused)
+        return async_import(self, hass)
+
+    with (
+        patch("custom_components.pw3.load_cloud_auth", return_value=(token, 12345)),
+        patch("custom_components.pw3.Pw3AccountCoordinator.async_discover"),
+        patch("custom_components.pw3.EnergyBackfill") as backfill,
+        patch.object(StatisticsAggregator, "async_import", record_import),
+    ):
+        backfill.return_value.async_run = AsyncMock(side_effect=lambda: ran.set())
+        entry = await _setup(
+            hass,
+            mock_config_entry,
+            {CONF_IMPORT_STATISTICS: True, CONF_BACKFILL_DAYS: 3},
+        )
+        await asyncio.wait_for(ran.wait(), 5)
+
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    assert coordinator.statistics is not None
+    _, api, statistics, _, days, time_zone = backfill.call_args.args
+    assert api.site_id == 12345
+    assert statistics is coordinator.statistics
+    assert days == 3
+    assert time_zone == "America/New_York"
+    # The first refresh already waits for the backfill, which unpauses
+    assert paused == [True]
+    assert statistics.paused
+
+
+async def test_setup_entry_statistics_without_token(
+    hass, caplog, mock_pw_data, mock_config_entry
+):
+    """Test statistics import still sets up when no cloud token is cached."""
+    with patch("custom_components.pw3.load_cloud_auth", return_value=(None, None)):
+        entry = await _setup(hass, mock_config_entry, {CONF_IMPORT_STATISTICS: True})
+        for _ in range(100):
+            if "Energy history backfill unavailable" in caplog.text:
+                break
+            await asyncio.sleep(0.01)
+
+    assert "Energy history backfill unavailable" in caplog.text
+    assert hass.data[DOMAIN][entry.entry_id].data["solar"] == 1500
+    # Live imports resume without the backfill
+    assert not hass.data[DOMAIN][entry.entry_id].statistics.paused
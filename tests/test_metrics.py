@@ -0,0 +1,37 @@
+"""Tests for pw3 upstream call metrics."""
+
+from custom_components.pw3.metrics import REFRESH
+from custom_components.pw3.metrics import LatencyHistogram
+from custom_components.pw3.metrics import Metrics
+
+
+def test_latency_histogram():
+    """Test percentiles resolve to bucket bounds and overflow to the max."""
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) is None
+
+    for ms in [5] * 90 + [80] * 9:
+        histogram.record(ms)
+    histogram.record(30000, ok=False)
+
+    assert histogram.percentile(50) == 10
+    assert histogram.percentile(95) == 100
+    assert histogram.percentile(99) == 100
+    assert histogram.percentile(100) == 30000
+    summary = histogram.as_dict()
+    assert summary["count"] == 100
+    assert summary["errors"] == 1
+    assert summary["buckets"]["le_10"] == 90
+    assert summary["buckets"]["overflow"] == 1
+
+
+def test_metrics_errors_exclude_refreshes():
+    """Test the error total counts upstream calls, not the refreshes over them."""
+    metrics = Metrics()
+    metrics.record("soe", 120, ok=False)
+    metrics.record("aggregates", 80)
+    metrics.record(REFRESH, 130, ok=False)
+
+    assert metrics.errors == 1
+    assert list(metrics.as_dict()) == ["aggregates", REFRESH, "soe"]
+    assert metrics.get("grid") is None
@@ -0,0 +1,104 @@
+"""Tests for the pw3 profile service."""
+
+import json
+import pstats
+from unittest.mock import patch
+
+import pytest
+from custom_components.pw3.const import DOMAIN
+from custom_components.pw3.profiler import PROFILE_DIR
+from custom_components.pw3.profiler import RefreshProfiler
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.setup import async_setup_component
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+
+def test_profiler_trace():
+    """Test spans become Chrome trace events, one thread per track."""
+    profiler = RefreshProfiler(1)
+    origin = profiler._origin
+    profiler.add_span("site", "soe", origin + 0.001, origin + 0.004)
+    profiler.add_span("other", "run", origin, origin + 0.01)
+
+    trace = profiler.trace()
+
+    names = [e for e in trace["traceEvents"] if e["ph"] == "M"]
+    assert [e["args"]["name"] for e in names] == ["site", "other"]
+    spans = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+    assert spans[0] == {
+        "name": "soe",
+        "ph": "X",
+        "pid": 1,
+        "tid": 0,
+        "ts": 1000,
+        "dur": 3000,
+    }
+    assert spans[1]["tid"] == 1
+
+
+def test_profiler_merges_thread_profiles():
+    """Test executor-thread profiles are merged and empty ones are skipped."""
+    profiler = RefreshProfiler(1)
+    assert profiler.stats() is None
+
+    assert profiler.run_in_thread(sorted, [3, 1, 2]) == [1, 2, 3]
+    profiler.run_in_thread(lambda: None)
+
+    functions = {function for _, _, function in profiler.stats().stats}
+    assert "<built-in method builtins.sorted>" in functions
+
+
+def test_profiler_in_profiled_thread():
+    """Test executor calls run unprofiled where a profiler is already active."""
+    profiler = RefreshProfiler(1)
+    with patch(
+        "custom_components.pw3.profiler.cProfile.Profile.enable",
+        side_effect=ValueError("Another profiling tool is already active"),
+    ):
+        assert profiler.run_in_thread(sorted, [3, 1, 2]) == [1, 2, 3]
+    assert profiler.stats() is None
+
+
+def test_profiler_saves_empty_profile(tmp_path):
+    """Test a profile without calls is still written."""
+    prefix = RefreshProfiler(1).save(str(tmp_path))
+
+    assert (tmp_path / f"{prefix}.pstats").exists()
+    assert json.loads((tmp_path / f"{prefix}.trace.json").read_text()) == {
+        "traceEvents": [],
+        "displayTimeUnit": "ms",
+    }
+
+
+async def test_profile_service_without_entries(hass):
+    """Test the service fails when no entry is loaded to profile."""
+    assert await async_setup_component(hass, DOMAIN, {})
+
+    with pytest.raises(HomeAssistantError):
+        await hass.services.async_call(DOMAIN, "profile", {}, blocking=True)
+
+
+async def test_profile_service(hass, tmp_path, mock_pw_data, mock_config_entry):
+    """Test the service profiles the next refreshes, then switches itself off."""
+    hass.config.config_dir = str(tmp_path)
+    entry = MockConfigEntry(domain=DOMAIN, data=mock_config_entry, entry_id="test")
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+
+    await hass.services.async_call(DOMAIN, "profile", {"runs": 2}, blocking=True)
+    with pytest.raises(HomeAssistantError):
+        await hass.services.async_call(DOMAIN, "profile", {}, blocking=True)
+    for _ in range(2):
+        await coordinator.async_refresh()
+    await hass.async_block_till_done()
+
+    assert coordinator.profiler is None
+    [dump] = (tmp_path / PROFILE_DIR).glob("*.pstats")
+    assert pstats.Stats(str(dump)).total_calls > 0
+    trace = json.loads(dump.with_suffix(".trace.json").read_text())
+    names = {e["name"] for e in trace["traceEvents"] if e["ph"] == "X"}
+    assert {"run", "refresh", "aggregates", "soe", "fan_out", "queue"} <= names
+    tracks = {e["args"]["name"] for e in trace["traceEvents"] if e["ph"] == "M"}
+    assert "Mock Title executor" in tracks
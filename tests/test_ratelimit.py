@@ -0,0 +1,92 @@
+"""Tests for pw3 rate limiting."""
+
+import asyncio
+from unittest.mock import patch
+
+from custom_components.pw3.ratelimit import BACKOFF_BASE
+from custom_components.pw3.ratelimit import CONTROL
+from custom_components.pw3.ratelimit import HISTORY
+from custom_components.pw3.ratelimit import LIVE
+from custom_components.pw3.ratelimit import RateLimiter
+
+
+async def test_rate_limiter_serves_lanes_in_priority_order():
+    """Test queued calls get tokens control first, then live, then history."""
+    limiter = RateLimiter(rate=20, burst=1)
+    assert await limiter.async_acquire(LIVE)
+
+    served = []
+
+    async def call(lane: int, name: str) -> None:
+        await limiter.async_acquire(lane)
+        served.append(name)
+
+    tasks = [
+        asyncio.create_task(call(lane, name))
+        for lane, name in ((HISTORY, "history"), (LIVE, "live"), (CONTROL, "control"))
+    ]
+    await asyncio.sleep(0)
+    assert limiter.queue_depth == 3
+    assert limiter.as_dict()["queue_depth"] == {"control": 1, "live": 1, "history": 1}
+
+    await asyncio.gather(*tasks)
+    assert served == ["control", "live", "history"]
+    assert limiter.queue_depth == 0
+
+
+async def test_rate_limiter_backoff_and_retry_after():
+    """Test failures back off exponentially and Retry-After holds calls back."""
+    limiter = RateLimiter()
+    with patch("custom_components.pw3.ratelimit.random.uniform", return_value=1):
+        assert limiter.failure() == BACKOFF_BASE
+        assert limiter.failure() == BACKOFF_BASE * 2
+        assert limiter.failure() == BACKOFF_BASE * 4
+    # Calls that can't wait out the backoff fail fast
+    assert not await limiter.async_acquire(LIVE, max_wait=1)
+    assert limiter.rejected == 1
+
+    limiter.success()
+    assert limiter.failures == 0
+    assert limiter.retry_in() == 0
+
+    assert limiter.throttle(120) == 120
+    assert limiter.throttle_events == 1
+    assert 119 < limiter.retry_in() <= 120
+    # A call already in flight succeeding does not cut Retry-After short
+    limiter.success()
+    assert 119 < limiter.retry_in() <= 120
+    assert not await limiter.async_acquire(CONTROL, max_wait=30)
+
+
+async def test_rate_limiter_success_releases_waiters():
+    """Test a success ends the backoff for calls already waiting it out."""
+    limiter = RateLimiter()
+    limiter.failure()
+    waiter = asyncio.create_task(limiter.async_acquire(LIVE, max_wait=60))
+    await asyncio.sleep(0)
+    assert limiter.queue_depth == 1
+
+    limiter.success()
+    assert await asyncio.wait_for(waiter, 1)
+    assert limiter.retry_in() == 0
+
+
+async def test_rate_limiter_wait_timeout():
+    """Test a call that can't get a token in time gives up its place."""
+    limiter = RateLimiter(rate=20, burst=1)
+    assert await limiter.async_acquire(LIVE)
+
+    # The next token is 50 ms away
+    assert not await limiter.async_acquire(LIVE, max_wait=0.01)
+    assert limiter.rejected == 1
+    assert await limiter.async_acquire(LIVE, max_wait=1)
+    assert limiter.queue_depth == 0
+
+
+async def test_rate_limiter_throttle_without_retry_after():
+    """Test throttling without Retry-After backs off as a failure does."""
+    limiter = RateLimiter()
+    with patch("custom_components.pw3.ratelimit.random.uniform", return_value=1):
+        assert limiter.throttle() == BACKOFF_BASE
+    assert limiter.throttle_events == 1
+    assert limiter.failures == 1
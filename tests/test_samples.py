@@ -0,0 +1,49 @@
+"""Tests for the pw3 sample buffer."""
+
+import math
+
+import pytest
+from custom_components.pw3.samples import SAMPLE_BUFFER_SIZE
+from custom_components.pw3.samples import SampleBuffer
+
+
+def test_sample_buffer_memory_is_fixed():
+    """Test the buffer is preallocated and stays the same size when full."""
+    buffer = SampleBuffer(("a", "b"), capacity=4)
+    assert buffer.nbytes == 4 * 3 * 8
+    for timestamp in range(10):
+        buffer.append(timestamp, {"a": timestamp, "b": -timestamp})
+    assert len(buffer) == 4
+    assert buffer.nbytes == 4 * 3 * 8
+    # Oldest samples are overwritten
+    assert [timestamp for timestamp, _ in buffer.samples(0)] == [6, 7, 8, 9]
+
+    # A day of 2 s samples with the seven coordinator fields is under 3 MB
+    assert SampleBuffer(tuple("abcdefg")).nbytes == SAMPLE_BUFFER_SIZE * 64
+    assert SAMPLE_BUFFER_SIZE * 64 < 3 * 1024 * 1024
+
+
+def test_sample_buffer_window():
+    """Test window statistics skip missing and stale values."""
+    buffer = SampleBuffer(("a", "b"), capacity=8)
+    buffer.append(1, {"a": 100, "b": 1})
+    buffer.append(2, {"a": 300, "b": 2}, skip=["b"])
+    buffer.append(3, {"a": 200})
+
+    assert buffer.window(0) == {"a": (100, 200, 300), "b": (1, 1, 1)}
+    assert buffer.window(1) == {"a": (200, 250, 300), "b": None}
+    assert buffer.window(3) == {}
+    assert list(buffer.samples(2)) == [(3, {"a": 200})]
+    assert not any(
+        math.isnan(value)
+        for _, values in buffer.samples(0)
+        for value in values.values()
+    )
+
+
+def test_sample_buffer_window_wraps():
+    """Test the window follows the ring across the end of the arrays."""
+    buffer = SampleBuffer(("a",), capacity=3)
+    for timestamp, value in enumerate([5, 6, 7, 8, 9], start=1):
+        buffer.append(timestamp, {"a": value})
+    assert buffer.window(3) == {"a": (8, pytest.approx(8.5), 9)}
@@ -1,33 +1,291 @@
-from unittest.mock import MagicMock
-from unittest.mock import patch
+import asyncio
+import threading
+import time
+from datetime import timedelta
 
-from custom_components.pw3 import sensor
+import pytest
+from custom_components.pw3.const import CONF_SITE_ID
+from custom_components.pw3.const import DEFAULT_MAX_STATE_AGE
+from custom_components.pw3.const import DOMAIN
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import State
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers import entity_registry as er
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+from pytest_homeassistant_custom_component.common import (
+    mock_restore_cache_with_extra_data,
+)
 
 
-async def test_sensor_setup(hass, mock_powerwall, mock_config_entry):
-    """Test sensor setup."""
-    mock_coordinator = MagicMock()
-    mock_coordinator.data = {
-        "solar": 1.5,
-        "battery": 2.0,
-        "home": 3.5,
-        "grid": -1.0,
-        "percentage": 75.5,
-        "last_updated": "2023-05-01T12:00:00Z",
-    }
+async def _setup_entry(hass, mock_config_entry):
+    entry = MockConfigEntry(domain=DOMAIN, data=mock_config_entry, entry_id="test")
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    return entry
+
 
-    with patch(
-        "custom_components.pw3.sensor.Pw3DataUpdateCoordinator",
-        return_value=mock_coordinator,
-    ):
-        await sensor.async_setup_entry(hass, mock_config_entry, MagicMock())
+async def test_sensor_setup(hass, mock_pw_data, mock_config_entry):
+    """Test sensor setup."""
+    await _setup_entry(hass, mock_config_entry)
 
-    assert len(hass.states.async_all()) == 5
+    solar_state = hass.states.get("sensor.pw_solar_power")
+    assert solar_state.state == "1500"
+    assert solar_state.attributes["unit_of_measurement"] == "W"
 
-    solar_state = hass.states.get("sensor.powerwall_solar_power")
-    assert solar_state.state == "1.5"
-    assert solar_state.attributes["unit_of_measurement"] == "kW"
+    grid_state = hass.states.get("sensor.pw_grid_production_power")
+    assert grid_state.state == "1000"
 
-    battery_state = hass.states.get("sensor.powerwall_battery_percentage")
+    battery_state = hass.states.get("sensor.pw_battery")
     assert battery_state.state == "75.5"
     assert battery_state.attributes["unit_of_measurement"] == "%"
+
+    assert hass.states.get("sensor.pw_solar_energy").state == "0.0"
+
+
+async def test_sensor_names_per_site(hass, mock_pw_data, mock_config_entry):
+    """Test entities of a site entry are named after the site's device."""
+    await _setup_entry(hass, mock_config_entry)
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={**mock_config_entry, CONF_SITE_ID: 67890},
+        entry_id="site",
+    )
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    state = hass.states.get("sensor.pw_67890_solar_power")
+    assert state.state == "1500"
+    assert state.attributes["friendly_name"] == "PW 67890 Solar Power"
+    assert (
+        hass.states.get("sensor.pw_solar_power").attributes["friendly_name"]
+        == "PW Solar Power"
+    )
+    device = dr.async_get(hass).async_get_device(identifiers={(DOMAIN, "67890")})
+    assert device.name == "PW 67890"
+    assert er.async_get(hass).async_get("sensor.pw_67890_solar_power").device_id == (
+        device.id
+    )
+
+
+async def test_energy_sensor_restores_accumulator(
+    hass, hass_storage, mock_pw_data, mock_config_entry
+):
+    """Test the energy total survives a restart and integrates the gap."""
+    hass_storage["pw3.test.energy"] = {
+        "version": 1,
+        "key": "pw3.test.energy",
+        "data": {
+            "solar": {"total": 100.0, "last_time": time.time() - 60, "last_power": 1000}
+        },
+    }
+    await _setup_entry(hass, mock_config_entry)
+
+    # 60 s trapezoid between 1000 W and 1500 W adds ~20.8 Wh
+    state = hass.states.get("sensor.pw_solar_energy")
+    assert float(state.state) == pytest.approx(120.83, abs=0.1)
+    assert hass.states.get("sensor.pw_home_energy").state == "0.0"
+
+
+async def test_energy_sensor_migrates_restore_state(
+    hass, freezer, mock_pw_data, mock_config_entry
+):
+    """Test totals energy sensors saved in restore state move to the store."""
+    er.async_get(hass).async_get_or_create(
+        "sensor", DOMAIN, "pw_solar_energy", suggested_object_id="pw_solar_energy"
+    )
+    mock_restore_cache_with_extra_data(
+        hass,
+        [
+            (
+                State("sensor.pw_solar_energy", "100.0"),
+                {"total": 100.0, "last_time": time.time() - 60, "last_power": 1000},
+            )
+        ],
+    )
+    entry = await _setup_entry(hass, mock_config_entry)
+
+    state = hass.states.get("sensor.pw_solar_energy")
+    assert float(state.state) == pytest.approx(120.83, abs=0.1)
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    # A later refresh may have added less than the energy deadband since
+    assert coordinator.energy.integrators["solar"].total == pytest.approx(
+        float(state.state), abs=1
+    )
+
+
+async def test_energy_saved_on_reload(
+    hass, hass_storage, freezer, mock_pw_data, mock_config_entry
+):
+    """Test a reload saves the energy totals and resumes from them."""
+    entry = await _setup_entry(hass, mock_config_entry)
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    freezer.tick(60)
+    await coordinator.async_refresh()
+    total = coordinator.energy.integrators["solar"].total
+    assert total == pytest.approx(25)
+    # The delayed save has not run yet
+    assert "pw3.test.energy" not in hass_storage
+
+    assert await hass.config_entries.async_reload(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert hass_storage["pw3.test.energy"]["data"]["solar"]["total"] == total
+    assert hass_storage["pw3.test.cache"]["data"]["solar"] == 1500
+    reloaded = hass.data[DOMAIN][entry.entry_id]
+    assert reloaded is not coordinator
+    assert reloaded.energy.integrators["solar"].total >= total
+    # Stop the reloaded entry's background refresh
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_sensor_write_coalescing(hass, freezer, mock_pw_data, mock_config_entry):
+    """Test changes inside the deadband are only written by the heartbeat."""
+    entry = await _setup_entry(hass, mock_config_entry)
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+
+    def update(**values):
+        coordinator.async_set_updated_data({**coordinator.data, **values})
+
+    update(solar=1503, percentage=75.55)
+    assert hass.states.get("sensor.pw_solar_power").state == "1500"
+    assert hass.states.get("sensor.pw_battery").state == "75.5"
+
+    update(solar=1510, percentage=75.7)
+    assert hass.states.get("sensor.pw_solar_power").state == "1510"
+    assert hass.states.get("sensor.pw_battery").state == "75.7"
+
+    # Deadband is measured from the last written value, not the last sample
+    update(solar=1514)
+    update(solar=1518)
+    assert hass.states.get("sensor.pw_solar_power").state == "1518"
+
+    update(solar=1520)
+    assert hass.states.get("sensor.pw_solar_power").state == "1518"
+    freezer.tick(DEFAULT_MAX_STATE_AGE)
+    update(solar=1521)
+    assert hass.states.get("sensor.pw_solar_power").state == "1521"
+
+    # Becoming stale is always written
+    update(solar=1521, stale=["solar"])
+    assert hass.states.get("sensor.pw_solar_power").attributes["stale"] is True
+
+
+async def test_sensor_steady_state_writes_no_rows(
+    hass, freezer, mock_pw_data, mock_config_entry
+):
+    """Test unchanged power readings add no state changes, even on heartbeats."""
+    entry = await _setup_entry(hass, mock_config_entry)
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    changed = []
+    hass.bus.async_listen(
+        EVENT_STATE_CHANGED, lambda event: changed.append(event.data["entity_id"])
+    )
+
+    for _ in range(60):
+        freezer.tick(timedelta(minutes=1))
+        await coordinator.async_refresh()
+        await hass.async_block_till_done()
+
+    assert "sensor.pw_solar_power" not in changed
+    assert "sensor.pw_battery" not in changed
+    assert changed.count("sensor.pw_last_refresh") == 60
+    assert "last_updated" not in hass.states.get("sensor.pw_solar_power").attributes
+    last_refresh = hass.states.get("sensor.pw_last_refresh").state
+    assert dt_util.parse_datetime(last_refresh) == dt_util.utcnow().replace(
+        microsecond=0
+    )
+
+
+async def test_sensor_warm_start_from_cache(
+    hass, hass_storage, mock_pw_data, mock_powerwall, mock_config_entry
+):
+    """Test entities start from the cached payload while login runs later."""
+    hass_storage["pw3.test.cache"] = {
+        "version": 1,
+        "key": "pw3.test.cache",
+        "data": {"solar": 900, "percentage": 60.0, "solar_energy": 5.0, "stale": []},
+    }
+    login = threading.Event()
+    mock_powerwall.side_effect = lambda **kwargs: login.wait(5) and mock_pw_data
+    entry = MockConfigEntry(domain=DOMAIN, data=mock_config_entry, entry_id="test")
+    entry.add_to_hass(hass)
+    # Setup returns while the login is still blocked
+    assert await hass.config_entries.async_setup(entry.entry_id)
+
+    solar_state = hass.states.get("sensor.pw_solar_power")
+    assert solar_state.state == "900"
+    assert solar_state.attributes["stale"] is True
+    # Energy totals come from the accumulators, not the cache
+    assert hass.states.get("sensor.pw_solar_energy").state == "0.0"
+
+    login.set()
+    await asyncio.gather(*entry._background_tasks)
+    await hass.async_block_till_done()
+
+    solar_state = hass.states.get("sensor.pw_solar_power")
+    assert solar_state.state == "1500"
+    assert solar_state.attributes["stale"] is False
+    mock_powerwall.assert_called_once()
+
+
+async def test_sensor_fast_sampling(hass, mock_pw_data, mock_config_entry):
+    """Test fast-sample mode adds window min/max sensors and stops on unload."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={**mock_config_entry, "pw_host": "192.168.91.1", "pw_gw_password": "pw"},
+        options={"fast_sample_interval": 0.5},
+        entry_id="test",
+    )
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    # Clamped to the supported range
+    assert coordinator.fast_interval == timedelta(seconds=1)
+    assert hass.states.get("sensor.pw_solar_power_max").state == "1500"
+    assert hass.states.get("sensor.pw_grid_production_power_min").state == "1000"
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_sensor_fast_sampling_needs_gateway(
+    hass, caplog, mock_pw_data, mock_config_entry
+):
+    """Test fast sampling stays off for entries that only read the cloud."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data=mock_config_entry,
+        options={"fast_sample_interval": 1},
+        entry_id="test",
+    )
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert hass.data[DOMAIN][entry.entry_id].fast_interval is None
+    assert hass.states.get("sensor.pw_solar_power_max") is None
+    assert "Fast sampling needs a gateway host" in caplog.text
+
+
+async def test_sensor_battery_forecast(hass, mock_pw_data, mock_config_entry):
+    """Test forecast sensors publish minutes and a timestamp."""
+    await _setup_entry(hass, mock_config_entry)
+    assert hass.states.get("sensor.pw_battery_time_to_empty").state == "unknown"
+
+    coordinator = hass.data[DOMAIN]["test"]
+    reserve_time = dt_util.parse_datetime("2024-03-20T18:30:00+00:00")
+    coordinator.async_set_updated_data(
+        {
+            **coordinator.data,
+            "time_to_empty": 420,
+            "reserve_time": reserve_time.timestamp(),
+        }
+    )
+
+    assert hass.states.get("sensor.pw_battery_time_to_empty").state == "420"
+    state = hass.states.get("sensor.pw_battery_reserve_time")
+    assert dt_util.parse_datetime(state.state) == reserve_time
@@ -0,0 +1,89 @@
+"""Tests for the pw3 session pool."""
+
+import asyncio
+from datetime import timedelta
+from unittest.mock import MagicMock
+
+from custom_components.pw3.const import DOMAIN
+from custom_components.pw3.session import SESSION_LINGER
+from custom_components.pw3.session import SessionPool
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+
+async def test_session_pool_shares_client(hass):
+    """Test concurrent acquires of one key log in once and share the client."""
+    pool = SessionPool(hass)
+    client = MagicMock()
+
+    async def login():
+        await asyncio.sleep(0.01)
+        return client
+
+    clients = await asyncio.gather(
+        pool.async_acquire(("pypowerwall", "a@example.com", None), login),
+        pool.async_acquire(("pypowerwall", "a@example.com", None), login),
+    )
+    other = await pool.async_acquire(("pypowerwall", "b@example.com", None), login)
+
+    assert clients == [client, client]
+    assert other is client
+    assert pool.logins == 2
+
+
+async def test_session_pool_teardown(hass):
+    """Test the last release closes the client after the linger period."""
+    pool = SessionPool(hass)
+    client = MagicMock()
+    key = ("pypowerwall", "a@example.com", None)
+
+    async def login():
+        return client
+
+    await pool.async_acquire(key, login)
+    await pool.async_acquire(key, login)
+    pool.async_release(key)
+    pool.async_release(key)
+
+    # Re-acquiring while lingering cancels the teardown
+    assert await pool.async_acquire(key, login) is client
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=SESSION_LINGER))
+    await hass.async_block_till_done()
+    client.client.close_session.assert_not_called()
+
+    pool.async_release(key)
+    async_fire_time_changed(
+        hass, dt_util.utcnow() + timedelta(seconds=SESSION_LINGER + 1)
+    )
+    await hass.async_block_till_done()
+    client.client.close_session.assert_called_once()
+    assert pool.logins == 1
+
+    await pool.async_acquire(key, login)
+    assert pool.logins == 2
+
+    # Keys not held are left alone
+    other = ("pypowerwall", "b@example.com", None)
+    pool.async_release(other)
+    pool._async_close(other)
+    pool.async_release(key)
+    pool.async_release(key)
+    assert pool.logins == 2
+    await pool.async_close_all()
+
+
+async def test_reload_reuses_session(
+    hass, mock_powerwall, mock_pw_data, mock_config_entry
+):
+    """Test reloading an entry does not log in to the cloud again."""
+    entry = MockConfigEntry(domain=DOMAIN, data=mock_config_entry, entry_id="test")
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert await hass.config_entries.async_reload(entry.entry_id)
+    await hass.async_block_till_done()
+
+    mock_powerwall.assert_called_once()
+    assert hass.states.get("sensor.pw_solar_power").state == "1500"
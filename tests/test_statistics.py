@@ -0,0 +1,157 @@
+"""Tests for pw3 long-term statistics."""
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from unittest.mock import patch
+
+import pytest
+from custom_components.pw3.const import CONF_SITE_ID
+from custom_components.pw3.const import DOMAIN
+from custom_components.pw3.coordinator import Pw3DataUpdateCoordinator
+from custom_components.pw3.statistics import StatisticsAggregator
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.statistics import statistics_during_period
+from homeassistant.config_entries import current_entry
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+from pytest_homeassistant_custom_component.components.recorder.common import (
+    async_wait_recording_done,
+)
+
+from .test_coordinator import FakePowerwall
+
+HOUR = datetime(2024, 3, 1, 10, tzinfo=timezone.utc).timestamp()
+
+
+def test_statistics_hourly_rollup():
+    """Test samples roll into 5-minute buckets and hourly mean/min/max rows."""
+    aggregator = StatisticsAggregator({"solar": "W"}, {"solar_energy": "Wh"})
+    # Two 5-minute buckets with different sample counts
+    for offset, solar in ((0, 100), (60, 200), (300, 600)):
+        aggregator.add_sample(HOUR + offset, {"solar": solar, "solar_energy": offset})
+    aggregator.add_sample(HOUR + 400, {"solar": 9999}, stale=["solar"])
+    assert aggregator.pending == {}
+
+    aggregator.add_sample(HOUR + 3600, {"solar": 50, "solar_energy": 500})
+
+    start = datetime(2024, 3, 1, 10, tzinfo=timezone.utc)
+    assert aggregator.pending == {
+        "solar": [{"start": start, "mean": 300, "min": 100, "max": 600}],
+    }
+    assert aggregator.pending_energy == [(HOUR, {"solar_energy": 300})]
+    assert aggregator.buckets == [
+        (HOUR, {"solar": (100, 150, 200)}),
+        (HOUR + 300, {"solar": (600, 600, 600)}),
+    ]
+    # Late samples for closed periods are dropped
+    aggregator.add_sample(HOUR + 10, {"solar": 1})
+    assert len(aggregator.pending["solar"]) == 1
+
+
+def test_statistics_energy_sums_continue_checkpoint(hass):
+    """Test energy sums continue from the checkpoint and skip covered hours."""
+    aggregator = StatisticsAggregator({}, {"solar_energy": "Wh"})
+    aggregator.restore({"sums": {"solar_energy": 1000.0}, "last_hour": HOUR})
+
+    with patch(
+        "custom_components.pw3.statistics.async_add_external_statistics"
+    ) as add_statistics:
+        queued = aggregator.async_import_energy(
+            hass,
+            [
+                (HOUR, {"solar_energy": 999}),
+                (HOUR + 3600, {"solar_energy": 100}),
+                (HOUR + 7200, {"solar_energy": 50}),
+            ],
+        )
+
+    assert queued == 2
+    metadata, rows = add_statistics.call_args.args[1:]
+    assert metadata["statistic_id"] == "pw3:solar_energy"
+    assert metadata["has_sum"] is True
+    assert [row["sum"] for row in rows] == [1100, 1150]
+    assert aggregator.as_dict() == {
+        "sums": {"solar_energy": 1150},
+        "last_hour": HOUR + 7200,
+    }
+
+
+async def test_statistics_checkpoint_store(hass, hass_storage):
+    """Test the import checkpoint is saved and loaded with the entry."""
+    checkpoint = {"sums": {"solar_energy": 1000.0}, "last_hour": HOUR}
+    hass_storage["pw3.test.statistics"] = {
+        "version": 1,
+        "key": "pw3.test.statistics",
+        "data": checkpoint,
+    }
+    entry = MockConfigEntry(domain=DOMAIN, entry_id="test")
+    token = current_entry.set(entry)
+    coordinator = Pw3DataUpdateCoordinator(hass, FakePowerwall(), statistics=True)
+    current_entry.reset(token)
+
+    await coordinator.async_load_statistics()
+    assert coordinator.statistics.as_dict() == checkpoint
+
+    coordinator.statistics.sums["solar_energy"] = 1500.0
+    await coordinator.async_save_statistics()
+    assert hass_storage["pw3.test.statistics"]["data"]["sums"] == {
+        "solar_energy": 1500.0
+    }
+
+
+async def test_statistics_import(hass, freezer):
+    """Test closed hours are imported as external statistics."""
+    freezer.move_to(datetime(2024, 3, 1, 10, 58, tzinfo=timezone.utc))
+    coordinator = Pw3DataUpdateCoordinator(hass, FakePowerwall(), statistics=True)
+    for _ in range(4):
+        await coordinator._async_update_data()
+        freezer.tick(timedelta(minutes=1))
+    await async_wait_recording_done(hass)
+
+    stats = await get_instance(hass).async_add_executor_job(
+        statistics_during_period,
+        hass,
+        datetime(2024, 3, 1, 10, tzinfo=timezone.utc),
+        None,
+        {"pw3:solar", "pw3:home_energy"},
+        "hour",
+        None,
+        {"mean", "max", "sum"},
+    )
+    assert stats["pw3:solar"][0]["mean"] == 1500
+    assert stats["pw3:solar"][0]["max"] == 1500
+    # One minute of 3500 W by the end of the hour
+    assert stats["pw3:home_energy"][0]["sum"] == pytest.approx(3500 / 60, abs=0.01)
+    assert coordinator.statistics.pending == {}
+
+
+async def test_statistics_per_site(hass, freezer):
+    """Test entries for different sites import separate statistics."""
+    freezer.move_to(datetime(2024, 3, 1, 10, 58, tzinfo=timezone.utc))
+    coordinators = []
+    for data, entry_id in (({CONF_SITE_ID: 111}, "first"), ({}, "SECOND")):
+        entry = MockConfigEntry(domain=DOMAIN, data=data, entry_id=entry_id)
+        token = current_entry.set(entry)
+        coordinators.append(
+            Pw3DataUpdateCoordinator(hass, FakePowerwall(), statistics=True)
+        )
+        current_entry.reset(token)
+    for _ in range(4):
+        for coordinator in coordinators:
+            await coordinator._async_update_data()
+        freezer.tick(timedelta(minutes=1))
+    await async_wait_recording_done(hass)
+
+    ids = {"pw3:111_solar", "pw3:second_solar", "pw3:solar"}
+    stats = await get_instance(hass).async_add_executor_job(
+        statistics_during_period,
+        hass,
+        datetime(2024, 3, 1, 10, tzinfo=timezone.utc),
+        None,
+        ids,
+        "hour",
+        None,
+        {"mean"},
+    )
+    assert set(stats) == {"pw3:111_solar", "pw3:second_solar"}
+    assert stats["pw3:111_solar"][0]["mean"] == 1500